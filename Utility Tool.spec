@@ -1,5 +1,19 @@
 # -*- mode: python ; coding: utf-8 -*-
 
+# Everything bundled into a --onefile build is unpacked to a temp folder on every launch,
+# so modules the app never imports are excluded, and UPX is off (decompressing the Qt
+# libraries costs more at start-up than the smaller file saves).
+EXCLUDES = [
+    'tkinter', 'unittest', 'pydoc', 'doctest', 'lib2to3', 'distutils', 'setuptools', 'pip',
+    'PIL.ImageTk', 'PIL.ImageQt', 'PIL.ImageShow',
+    'PyQt5.QtWebEngine', 'PyQt5.QtWebEngineCore', 'PyQt5.QtWebEngineWidgets', 'PyQt5.QtWebKit',
+    'PyQt5.QtQml', 'PyQt5.QtQuick', 'PyQt5.QtQuickWidgets', 'PyQt5.QtMultimedia', 'PyQt5.QtMultimediaWidgets',
+    'PyQt5.QtNetwork', 'PyQt5.QtSql', 'PyQt5.QtSvg', 'PyQt5.QtOpenGL', 'PyQt5.QtPrintSupport',
+    'PyQt5.QtBluetooth', 'PyQt5.QtPositioning', 'PyQt5.QtLocation', 'PyQt5.QtSensors', 'PyQt5.QtSerialPort',
+    'PyQt5.QtDesigner', 'PyQt5.QtHelp', 'PyQt5.QtTest', 'PyQt5.QtXml', 'PyQt5.QtXmlPatterns',
+    'PyQt5.Qt3DCore', 'PyQt5.Qt3DRender', 'PyQt5.QtDBus', 'PyQt5.QtNfc', 'PyQt5.QtRemoteObjects',
+    'PyQt5.QtTextToSpeech', 'PyQt5.QtWebChannel', 'PyQt5.QtWebSockets',
+]
 
 a = Analysis(
     ['main.py'],
@@ -10,9 +24,9 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=EXCLUDES,
     noarchive=False,
-    optimize=0,
+    optimize=1,
 )
 pyz = PYZ(a.pure)
 
@@ -26,7 +40,7 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=False,
     upx_exclude=[],
     runtime_tmpdir=None,
     console=False,
@@ -0,0 +1,98 @@
+"""
+Batch outputs written straight into one ZIP or TAR instead of a folder of files.
+
+The pool returns each encoded image as bytes (write=False, as in the pipelined mode) and a
+single ArchiveWriter appends them in the order they finish:
+- ZIP: JPEG, WEBP and PNG are stored as they are (they are compressed already, deflating
+  them again only costs time), other formats are deflated
+- TAR: written in stream mode ("w|", "w|gz", "w|bz2", "w|xz" by extension), so the file is
+  produced front to back without a single seek
+Either way the batch is one sequential write instead of a create/write/close per image
+followed by re-reading everything to archive it.
+"""
+import os, time, tarfile, threading, zipfile
+from io import BytesIO
+
+ARCHIVE_EXTS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+STORED_EXTS = (".jpg", ".jpeg", ".webp", ".png")
+_TAR_MODES = {".tar": "w|", ".tar.gz": "w|gz", ".tgz": "w|gz", ".tar.bz2": "w|bz2", ".tar.xz": "w|xz"}
+
+def is_archive(path):
+    return bool(path) and path.lower().endswith(ARCHIVE_EXTS)
+
+class ArchiveWriter:
+    """
+    Appends in-memory files to the ZIP or TAR at path (picked by its extension).
+    Member names are the output file names (out_path relative to the archive path, see
+    BatchEngine.run(archive=...)); a name already used gets _2, _3… before its extension.
+    write_results() is the BatchEngine writer step; close() finishes the archive.
+    """
+    def __init__(self, path):
+        if not is_archive(path):
+            raise ValueError(f"archive must end in one of {', '.join(ARCHIVE_EXTS)}: {path}")
+        self.path = path
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        if path.lower().endswith(".zip"):
+            self._zip, self._tar = zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED, compresslevel=6), None
+        else:
+            ext = next(e for e in _TAR_MODES if path.lower().endswith(e))
+            self._zip, self._tar = None, tarfile.open(path, _TAR_MODES[ext])
+        self.names, self.files, self.bytes_in = set(), 0, 0
+        self._lock = threading.Lock()
+
+    def _unique(self, name):
+        stem, ext = os.path.splitext(name)
+        n = 1
+        while name in self.names:
+            n += 1
+            name = f"{stem}_{n}{ext}"
+        self.names.add(name)
+        return name
+
+    def add(self, name, data):
+        """Append data as name (made unique); returns the name used."""
+        with self._lock:
+            name = self._unique(name.replace(os.sep, "/"))
+            now = time.time()
+            if self._zip:
+                info = zipfile.ZipInfo(name, time.localtime(now)[:6])
+                info.external_attr = 0o644 << 16
+                info.compress_type = zipfile.ZIP_STORED if name.lower().endswith(STORED_EXTS) else zipfile.ZIP_DEFLATED
+                self._zip.writestr(info, data)
+            else:
+                info = tarfile.TarInfo(name)
+                info.size, info.mtime, info.mode = len(data), int(now), 0o644
+                self._tar.addfile(info, BytesIO(data))
+            self.files += 1
+            self.bytes_in += len(data)
+            return name
+
+    def member(self, out_path):
+        return os.path.relpath(out_path, self.path)
+
+    def write_results(self, results):
+        """As batch_engine._write_outputs, into the archive: [(result, seconds, error), ...]."""
+        out = []
+        for r in results:
+            encoded = r.info.pop("encoded", None) if r.info else None
+            if encoded is None:
+                out.append((r, 0.0, None)); continue
+            multi = isinstance(encoded, list)
+            paths = [o["path"] for o in r.info["outputs"]] if multi else [r.out_path]
+            t0, error = time.perf_counter(), None
+            try:
+                used = [os.path.join(self.path, self.add(self.member(p), d))
+                        for p, d in zip(paths, encoded if multi else [encoded])]
+                if multi:
+                    for o, p in zip(r.info["outputs"], used):
+                        o["path"] = p
+                r = r._replace(out_path=used[0])
+            except (OSError, zipfile.BadZipFile, tarfile.TarError) as e:
+                error = f"{type(e).__name__}: {e}"
+            out.append((r, time.perf_counter() - t0, error))
+        return out
+
+    def close(self):
+        with self._lock:
+            (self._zip or self._tar).close()
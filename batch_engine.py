@@ -0,0 +1,339 @@
+import os, time, hashlib
+import threading, multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from image_utils import convert_resize_compress, convert_multi, Target
+from manifest import ManifestSet, params_digest, file_sha1
+from archive import ArchiveWriter, is_archive, ARCHIVE_EXTS
+from scheduler import Scheduler
+
+# One entry per input file; error is None on success, a short message otherwise.
+# info is the report dict filled by convert_resize_compress (e.g. "budget" for max_bytes runs).
+BatchResult = namedtuple("BatchResult", "index path out_path error info", defaults=(None,))
+
+PREFETCH_MAX = 64 * 1024 * 1024  # bigger sources are read by the pool process itself, not prefetched
+
+def default_workers():
+    return max(1, (os.cpu_count() or 2) - 1)
+
+def output_path_for(path, fmt, outdir=None):
+    base = os.path.splitext(path if not outdir else os.path.basename(path))[0]
+    if outdir:
+        base = os.path.join(outdir, base)
+    return f"{base}_out.{fmt.lower()}"  # same naming as convert_resize_compress's default
+
+def output_paths_for(path, targets, outdir=None):
+    """
+    One output path per Target: <name>_<w>x<h>.<ext> (or _full for the source size), with
+    _q<quality> added where two targets would otherwise share a name.
+    """
+    base = output_path_for(path, "", outdir)[:-len("_out.")]
+    names = [f"{base}_{'%dx%d' % tuple(t.size) if t.size else 'full'}.{t.fmt.lower()}" for t in targets]
+    return [f"{n[:-len(t.fmt) - 1]}_q{t.quality}.{t.fmt.lower()}" if names.count(n) > 1 else n
+            for n, t in zip(names, targets)]
+
+def pool_context(start_method):
+    """multiprocessing context for a ProcessPoolExecutor; None keeps the platform default."""
+    return multiprocessing.get_context(start_method) if start_method else None
+
+def _try_sha1(path):
+    try:
+        return file_sha1(path)
+    except OSError:
+        return None  # unreadable now: converted again, and the job reports why
+
+def _run_job(index, path, kwargs, hash_source=False):
+    # Runs in a pool process: never let an exception escape, report it instead
+    info = {}
+    try:
+        if kwargs.get("targets"):
+            out = convert_multi(path, report=info, **kwargs)[0]
+        else:
+            out = convert_resize_compress(path, report=info, **kwargs)
+        if hash_source:
+            source = kwargs.get("source")
+            # usually still in the page cache right after decoding
+            info["sha1"] = hashlib.sha1(source).hexdigest() if source is not None else file_sha1(path)
+        return BatchResult(index, path, out, None, info)
+    except Exception as e:
+        return BatchResult(index, path, None, f"{type(e).__name__}: {e}")
+
+def _run_task(jobs, options, fmt, hash_source, outdir=None, sources=None, write=True):
+    # One pool round-trip for a whole task (a single big file or a group of small ones).
+    # sources: the prefetched bytes of each job (None where not prefetched); see BatchEngine's pipeline
+    sources = sources or [None] * len(jobs)
+    if options.get("targets"):
+        return [_run_job(i, path, dict(options, out_paths=output_paths_for(path, options["targets"], outdir),
+                                       source=src, write=write), hash_source and st is not None)
+                for (i, path, _, st), src in zip(jobs, sources)]
+    return [_run_job(i, path, dict(options, out_fmt=fmt, out_path=out_path, source=src, write=write),
+                     hash_source and st is not None) for (i, path, out_path, st), src in zip(jobs, sources)]
+
+def _read_sources(jobs):
+    # Reader thread: [(bytes or None, seconds), ...] for a task's jobs. Unreadable or very big
+    # files are left to the pool process, which then reports the error / reads it itself.
+    out = []
+    for _, path, _, _ in jobs:
+        t0 = time.perf_counter()
+        try:
+            with open(path, "rb") as f:
+                data = f.read() if os.fstat(f.fileno()).st_size <= PREFETCH_MAX else None
+        except OSError:
+            data = None
+        out.append((data, time.perf_counter() - t0))
+    return out
+
+def _write_outputs(results):
+    # Writer thread: write the encoded buffers results carry; returns [(result, seconds, error), ...]
+    out = []
+    for r in results:
+        encoded = r.info.pop("encoded", None) if r.info else None
+        if encoded is None:
+            out.append((r, 0.0, None)); continue
+        paths = [o["path"] for o in r.info["outputs"]] if isinstance(encoded, list) else [r.out_path]
+        encoded = encoded if isinstance(encoded, list) else [encoded]
+        t0, error = time.perf_counter(), None
+        try:
+            for path, data in zip(paths, encoded):
+                with open(path, "wb") as f:
+                    f.write(data)
+        except OSError as e:
+            error = f"{type(e).__name__}: {e}"
+        out.append((r, time.perf_counter() - t0, error))
+    return out
+
+class BatchEngine:
+    """
+    Runs convert_resize_compress over many files on a process pool.
+    - workers: pool size (default: cpu_count - 1)
+    - budget_mp: decoded megapixels allowed in flight at once (default: half the RAM)
+    - run() yields a BatchResult per file; a failing file does not stop the batch
+    - files are scheduled by scheduler.Scheduler: largest first, small files in groups,
+      admitted against budget_mp; `schedule` holds its decisions after a run
+    - cancel() stops submitting and drops queued work; files already running finish
+    - incremental runs keep a manifest per output folder: files converted earlier with the
+      same settings are skipped (info {"skipped": True}), so an interrupted batch resumes
+    - with targets=[Target, ...] every source is decoded once and written once per target
+      (image_utils.convert_multi); out_path is then the first target's file and info["outputs"]
+      lists them all
+    - pipeline=True overlaps I/O with the pool's decode/encode work: io_threads reader threads
+      prefetch the sources of the next read_ahead tasks, the pool gets bytes and returns
+      encoded bytes, and io_threads writer threads write them behind. At most write_behind
+      tasks may wait to be written; beyond that no new task starts (backpressure). "read" and
+      "write" stage times are then measured in those threads, and `pipeline` holds per-stage
+      utilization after a run. Worth it on network shares and USB disks; on a local SSD the
+      extra copies to and from the pool roughly cancel out the overlap.
+    - run(archive="out.zip" / ".tar[.gz]") writes no files: the pool returns encoded bytes and
+      one writer thread appends them to the archive (see archive.py); out_path is then
+      "<archive>/<member>". At most write_behind tasks wait for it, as in the pipeline
+    - start_method: how pool processes are started ("spawn", "forkserver", "fork"; None for the
+      platform default). The GUI passes "spawn": forking a process with a live QApplication
+      and running threads copies their state, locks included, into every worker
+    """
+    def __init__(self, workers=None, budget_mp=None, pipeline=False, read_ahead=8, write_behind=8, io_threads=4,
+                 start_method=None):
+        self.workers = max(1, int(workers or default_workers()))
+        self.start_method = start_method
+        self.budget_mp = budget_mp
+        self.pipeline = None
+        self.pipelined = pipeline
+        self.read_ahead, self.write_behind = max(1, int(read_ahead)), max(1, int(write_behind))
+        self.io_threads = max(1, int(io_threads))
+        self.schedule = None
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def run(self, files, fmt="JPEG", outdir=None, incremental=False, hash_content=False, ordered=True,
+            on_header=None, archive=None, **options):
+        """
+        options are passed to convert_resize_compress (size, keep_aspect, quality, fast_downscale, ...).
+        hash_content also records a SHA-1 of each source so touched-but-identical files are still skipped.
+        ordered yields results in input order; otherwise as they finish (the big files come first).
+        on_header(index, pixels) is called for each file to convert once its header has been read.
+        targets: a list of image_utils.Target; replaces fmt/size/quality and takes only keep_aspect,
+        fast_downscale, max_memory, preserve_exif, passthrough, profile and background from options.
+        """
+        targets = options.pop("targets", None)
+        if targets:
+            if options.get("max_bytes"):
+                raise ValueError("a max size can't be combined with multiple outputs")
+            targets = [Target(*t) for t in targets]
+            options = {k: options[k] for k in ("keep_aspect", "fast_downscale", "max_memory", "preserve_exif", "passthrough",
+                                                  "profile", "background") if k in options}
+            options["targets"] = targets
+            # the scheduler prices the decode for the largest output (None: one keeps the source size)
+            sizes = [t.size for t in targets]
+            cost_size = None if None in sizes else (max(s[0] for s in sizes), max(s[1] for s in sizes))
+        if archive:
+            if not is_archive(archive):
+                raise ValueError(f"archive must end in one of {', '.join(ARCHIVE_EXTS)}: {archive}")
+            if incremental:
+                raise ValueError("incremental runs need an output folder, not an archive")
+            outdir = archive  # names outputs <archive>/<name>; ArchiveWriter turns them into members
+        self._cancel.clear()
+        manifests = ManifestSet() if incremental else None
+        digest = params_digest(dict(options, fmt=fmt.upper()))
+        sched = Scheduler(self.budget_mp, workers=self.workers)
+        jobs, done = [], {}
+        for i, path in enumerate(files):
+            out_path = output_paths_for(path, options["targets"], outdir)[0] if options.get("targets") \
+                else output_path_for(path, fmt, outdir)
+            st = None
+            if manifests:
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    pass  # let the job report the error
+            jobs.append((i, path, out_path, st))
+        if manifests:
+            # touched sources are compared by content: hash them on io_threads, not one by one here
+            touched = [path for _, path, out_path, st in jobs
+                       if st and manifests.for_output(out_path).needs_hash(os.path.abspath(path), st, digest)]
+            with ThreadPoolExecutor(self.io_threads, thread_name_prefix="batch-hash") as ex:
+                hashes = dict(zip(touched, ex.map(_try_sha1, touched)))
+            fresh = []
+            for job in jobs:
+                i, path, out_path, st = job
+                if st and (hashes.get(path, "") is not None) and manifests.for_output(out_path).is_current(
+                        os.path.abspath(path), st, digest, hashes.get(path)):
+                    done[i] = BatchResult(i, path, out_path, None, {"skipped": True})
+                else:
+                    fresh.append(job)
+            jobs = fresh
+        total = len(jobs) + len(done)
+        cost_options = {k: options.get(k) for k in ("size", "keep_aspect", "fast_downscale", "max_memory") if k in options}
+        if options.get("targets"):
+            cost_options["size"] = cost_size
+        tasks = sched.plan(jobs, on_header=on_header, **cost_options)
+        self.schedule = sched.stats
+        tasks.reverse()  # pop() from the end = next in start order
+        pending, next_index, yielded = {}, 0, 0
+        reads, read_times, writing = {}, {}, {}  # pipeline: task id -> reader future / read seconds; writer future -> task
+        p = self.pipeline = {"read_ahead": self.read_ahead, "write_behind": self.write_behind, "io_threads": self.io_threads,
+                             "read_seconds": 0.0, "cpu_seconds": 0.0, "write_seconds": 0.0, "read_waits": 0,
+                             "write_waits": 0, "peak_write_queue": 0} if self.pipelined else None
+        waited = set()
+        t_start = time.perf_counter()
+
+        def finish(task, results):
+            for r, (_, path, _, st) in zip(results, task.jobs):
+                if r.info is not None:
+                    r.info["task"] = {"id": task.id, "files": len(task.jobs), "cost_mp": round(task.cost, 2)}
+                done[r.index] = r
+                if manifests and st is not None and not r.error:
+                    manifests.for_output(r.out_path).record(
+                        os.path.abspath(path), st, digest, r.out_path, sha1=r.info.pop("sha1", None))
+
+        def ready(task):
+            # pipeline: the task's sources are in memory; pipeline / archive: the write-behind queue has room
+            if p is not None:
+                if task.id not in reads:  # read_ahead ran out within one round of admissions
+                    reads[task.id] = reader.submit(_read_sources, task.jobs)
+                if not reads[task.id].done():
+                    p["read_waits"] += ("r", task.id) not in waited; waited.add(("r", task.id))
+                    return False
+            if writer and len(writing) >= self.write_behind:
+                if p is not None:
+                    p["write_waits"] += ("w", task.id) not in waited; waited.add(("w", task.id))
+                return False
+            return True
+
+        sink = ArchiveWriter(archive) if archive else None
+        ex = ProcessPoolExecutor(max_workers=self.workers, mp_context=pool_context(self.start_method))
+        reader = ThreadPoolExecutor(self.io_threads, thread_name_prefix="batch-read") if p else None
+        write_threads = 1 if sink else self.io_threads  # zipfile / tarfile take one writer
+        writer = ThreadPoolExecutor(write_threads, thread_name_prefix="batch-write") if p or sink else None
+        write_outputs = sink.write_results if sink else _write_outputs
+        try:
+            while yielded < total:
+                if reader and not self.cancelled:
+                    for task in reversed(tasks[-self.read_ahead:]):  # prefetch the next read_ahead tasks, in start order
+                        if task.id not in reads:
+                            reads[task.id] = reader.submit(_read_sources, task.jobs)
+                # keep every worker busy with one task queued behind it, within the memory budget
+                while tasks and not self.cancelled and len(pending) < self.workers * 2 and ready(tasks[-1]) \
+                        and sched.admit(tasks[-1], len(pending)):
+                    task = tasks.pop()
+                    if p:
+                        got = reads.pop(task.id).result()
+                        read_times[task.id] = [t for _, t in got]
+                        p["read_seconds"] += sum(read_times[task.id])
+                        pending[ex.submit(_run_task, task.jobs, options, fmt, hash_content, outdir,
+                                          [d for d, _ in got], False)] = task
+                    else:
+                        pending[ex.submit(_run_task, task.jobs, options, fmt, hash_content, outdir,
+                                          None, not sink)] = task
+                if ordered:
+                    while next_index in done:
+                        yield done.pop(next_index)
+                        next_index += 1; yielded += 1
+                else:
+                    for i in list(done):
+                        yield done.pop(i)
+                        yielded += 1
+                if yielded >= total or self.cancelled or not (pending or writing or tasks):
+                    break
+                waiting = list(pending) + list(writing)
+                if p and tasks and tasks[-1].id in reads and not reads[tasks[-1].id].done():
+                    waiting.append(reads[tasks[-1].id])  # a finished read would make wait() return at once
+                finished, _ = wait(waiting, timeout=0.2, return_when=FIRST_COMPLETED)
+                for fut in finished:
+                    if fut in pending:
+                        task = pending.pop(fut)
+                        sched.release(task)
+                        try:
+                            results = fut.result()
+                        except Exception as e:  # e.g. a pool process died
+                            results = [BatchResult(i, path, None, f"{type(e).__name__}: {e}") for i, path, _, _ in task.jobs]
+                        if writer is None:
+                            finish(task, results)
+                            continue
+                        for r, t in zip(results, read_times.pop(task.id, ())):
+                            if r.info and "stages" in r.info:
+                                r.info["stages"]["read"] = round(t, 6)
+                                p["cpu_seconds"] += sum(v for k, v in r.info["stages"].items() if k not in ("read", "write"))
+                        writing[writer.submit(write_outputs, results)] = task
+                        if p:
+                            p["peak_write_queue"] = max(p["peak_write_queue"], len(writing))
+                    elif fut in writing:
+                        task = writing.pop(fut)
+                        try:
+                            written = fut.result()
+                        except Exception as e:
+                            written = [(BatchResult(i, path, None, None), 0.0, f"{type(e).__name__}: {e}")
+                                       for i, path, _, _ in task.jobs]
+                        results = []
+                        for r, t, error in written:
+                            if error:
+                                r = BatchResult(r.index, r.path, None, error)
+                            elif r.info and "stages" in r.info:
+                                r.info["stages"]["write"] = round(t, 6)
+                                if p:
+                                    p["write_seconds"] += t
+                            results.append(r)
+                        finish(task, results)
+        finally:
+            ex.shutdown(wait=not self.cancelled, cancel_futures=True)
+            if reader:
+                reader.shutdown(wait=False, cancel_futures=True)
+            if writer:
+                writer.shutdown(wait=True)  # never leave a half-written output behind
+            if sink:
+                sink.close()  # a cancelled batch still leaves a valid archive of what was done
+            if p:
+                wall = time.perf_counter() - t_start
+                p["wall_seconds"] = round(wall, 3)
+                # share of each stage's capacity (threads or pool processes x wall time) that was busy
+                p["utilization"] = {"read": round(p["read_seconds"] / (self.io_threads * wall), 3) if wall else None,
+                                    "cpu": round(p["cpu_seconds"] / (self.workers * wall), 3) if wall else None,
+                                    "write": round(p["write_seconds"] / (write_threads * wall), 3) if wall else None}
+                for k in ("read_seconds", "cpu_seconds", "write_seconds"):
+                    p[k] = round(p[k], 3)
+            if manifests:
+                manifests.close()
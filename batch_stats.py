@@ -0,0 +1,150 @@
+import os, json, time, heapq, threading
+from array import array
+from image_utils import STAGES
+from passthrough import OUTCOMES
+
+def _pct(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+
+class BatchStats:
+    """
+    Per-stage timings for a batch, collected from BatchResult.info.
+    - stage times are kept in flat arrays (one float per file) so 100k-file batches stay small
+    - only the `slowest` slowest files are kept with their details
+    - report() returns totals, mean/p50/p95/max per stage and the slowest files
+    """
+    def __init__(self, slowest=10):
+        self.stages = {s: array("d") for s in STAGES}
+        self.totals = array("d")
+        self.pixels = self.bytes_in = self.bytes_out = 0
+        self.files = self.failed = self.skipped = 0
+        self.outputs = dict.fromkeys(OUTCOMES, 0)  # files copied / edited losslessly / re-encoded
+        self._slowest, self._keep = [], slowest
+        self.memory = None  # {"limit", "peak", "rss_peak", "strips"} when a memory limit is in force
+        self.schedule = None  # BatchEngine.schedule
+        self.pipeline = None  # BatchEngine.pipeline (pipelined runs)
+        self.started = time.time()
+
+    def add(self, result):
+        self.files += 1
+        info = result.info or {}
+        if result.error:
+            self.failed += 1; return
+        if info.get("skipped"):
+            self.skipped += 1; return
+        mem = info.get("memory")
+        if mem:
+            m = self.memory = self.memory or {"limit": mem["limit"], "peak": 0, "rss_peak": None, "strips": 0}
+            m["peak"] = max(m["peak"], mem["peak"])
+            m["strips"] += mem["mode"] == "strips"
+            if mem.get("rss_peak"):
+                m["rss_peak"] = max(m["rss_peak"] or 0, mem["rss_peak"])
+        if info.get("output") in self.outputs:
+            self.outputs[info["output"]] += 1
+        stages = info.get("stages")
+        if not stages:
+            return
+        for s in STAGES:
+            self.stages[s].append(stages.get(s, 0.0))
+        total = sum(stages.values())
+        self.totals.append(total)
+        self.pixels += info.get("pixels", 0)
+        self.bytes_in += info.get("bytes_in", 0); self.bytes_out += info.get("bytes_out", 0)
+        entry = (total, result.index, result.path, {s: round(t, 4) for s, t in stages.items()}, info.get("output"))
+        if len(self._slowest) < self._keep:
+            heapq.heappush(self._slowest, entry)
+        elif total > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, entry)
+
+    def report(self):
+        wall = time.time() - self.started
+        busy = sum(self.totals)
+        out = {"files": self.files, "converted": len(self.totals), "failed": self.failed, "skipped": self.skipped,
+               "wall_seconds": round(wall, 3), "busy_seconds": round(busy, 3),
+               "megapixels": round(self.pixels / 1e6, 2), "bytes_in": self.bytes_in, "bytes_out": self.bytes_out,
+               "mp_per_s": round(self.pixels / 1e6 / wall, 2) if wall else None,
+               "outputs": dict(self.outputs), "stages": {}}
+        if self.memory:
+            out["memory"] = dict(self.memory)
+        if self.schedule:
+            out["schedule"] = dict(self.schedule)
+        if self.pipeline:
+            out["pipeline"] = dict(self.pipeline)
+        for s, values in self.stages.items():
+            if values and any(values):  # "read" stays 0 unless the batch ran pipelined
+                out["stages"][s] = {"total": round(sum(values), 3), "share": round(sum(values) / busy, 3) if busy else None,
+                                    "mean_ms": round(sum(values) / len(values) * 1000, 2),
+                                    "p50_ms": round(_pct(values, 50) * 1000, 2), "p95_ms": round(_pct(values, 95) * 1000, 2),
+                                    "max_ms": round(max(values) * 1000, 2)}
+        out["slowest"] = [{"path": p, "seconds": round(t, 3), "output": o, "stages": st}
+                          for t, _, p, st, o in sorted(self._slowest, reverse=True)]
+        return out
+
+    def write(self, path, **extra):
+        """Write report() (plus extra keys) as JSON; returns the path."""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(dict(self.report(), **extra), f, indent=1, ensure_ascii=False)
+        return path
+
+class ThroughputETA:
+    """
+    Remaining-time estimate from measured pixel throughput instead of the file count.
+    - each file costs its pixel count, from its header (set_cost, fed by the scheduler's
+      header pass); files without one yet count as the average of the ones that have
+    - finished files report their real pixel count (skipped / failed files cost nothing)
+    - throughput is pixels finished per second of wall time, so parallel workers and
+      pool start-up are accounted for as they really are
+    Thread-safe.
+    """
+    def __init__(self, total):
+        self.costs = [None] * total
+        self.done = bytearray(total)
+        self.known = self.known_n = 0        # sum / count of known costs
+        self.remaining_known = 0             # known costs of unfinished files
+        self.unknown_left = total            # unfinished files with unknown cost
+        self.done_pixels = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _set(self, i, pixels):
+        old = self.costs[i]
+        if old is None:
+            self.known_n += 1
+            if not self.done[i]:
+                self.unknown_left -= 1
+        else:
+            self.known -= old
+            if not self.done[i]:
+                self.remaining_known -= old
+        self.costs[i] = pixels
+        self.known += pixels
+        if not self.done[i]:
+            self.remaining_known += pixels
+
+    def set_cost(self, i, pixels):
+        with self._lock:
+            if i < len(self.costs) and not self.done[i]:
+                self._set(i, pixels or 0)
+
+    def finish(self, i, pixels=0):
+        with self._lock:
+            if i >= len(self.costs) or self.done[i]:
+                return
+            self._set(i, pixels or 0)
+            self.done[i] = 1
+            self.remaining_known -= self.costs[i]
+            self.done_pixels += self.costs[i]
+
+    def eta(self):
+        """Seconds left, or None until something has been measured."""
+        with self._lock:
+            elapsed = time.monotonic() - self.started
+            if not self.done_pixels or elapsed <= 0:
+                return None
+            avg = self.known / self.known_n if self.known_n else 0
+            left = self.remaining_known + avg * self.unknown_left
+            return left / (self.done_pixels / elapsed)
@@ -0,0 +1,47 @@
+"""
+Shrink-on-load benchmark for convert_resize_compress.
+
+Generates a synthetic camera-sized JPEG (24 MP by default) and converts it to every
+STANDARD_SIZES preset with each DOWNSCALE_MODES setting, in both keep-aspect and exact
+modes. Each case runs in a fresh process so peak RSS is measured per case.
+
+    python benchmarks/bench_downscale.py [--mp 24] [--repeat 3]
+"""
+import os, sys, time, argparse, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from image_utils import STANDARD_SIZES, DOWNSCALE_MODES, target_dims_from_preset, convert_resize_compress
+from corpus import make_source, run_isolated
+
+def _case(src, out, size, keep_aspect, gap, repeat):
+    times = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        convert_resize_compress(src, out_fmt="JPEG", out_path=out, size=size, keep_aspect=keep_aspect,
+                                quality=85, fast_downscale=gap)
+        times.append(time.perf_counter() - t0)
+    return min(times)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--mp", type=float, default=24, help="source size in megapixels")
+    ap.add_argument("--repeat", type=int, default=3, help="timed runs per case (best is reported)")
+    a = ap.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        src, out = os.path.join(tmp, "src.jpg"), os.path.join(tmp, "out.jpg")
+        w, h = make_source(src, a.mp)
+        print(f"source: {w}x{h} JPEG, best of {a.repeat}; speedup and RSS are vs Standard\n")
+        print(f"{'preset':36} {'fit':5} {'mode':8} {'ms':>7} {'img/s':>6} {'x':>5} {'RSS MB':>7}")
+        for name in STANDARD_SIZES:
+            size = target_dims_from_preset(name)
+            for keep_aspect in (True, False):
+                base = None
+                for mode, gap in DOWNSCALE_MODES.items():
+                    t, rss = run_isolated(_case, src, out, size, keep_aspect, gap, a.repeat)
+                    base = base or t
+                    print(f"{name[:36]:36} {'box' if keep_aspect else 'exact':5} {mode:8} {t * 1000:7.0f} "
+                          f"{1 / t:6.1f} {base / t:5.1f} {rss if rss is not None else '-':>7}")
+
+if __name__ == "__main__":
+    main()
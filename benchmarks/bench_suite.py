@@ -0,0 +1,155 @@
+"""
+Benchmark suite for the image and rename paths, with regression baselines.
+
+Cases (each image case runs in a fresh process, so peak RSS is per case):
+- convert/<preset>/<FORMAT>: convert_resize_compress over a synthetic mixed corpus
+  (JPEG photos, PNG, RGBA and palette images) for every STANDARD_SIZES preset
+- estimate/<mode>-<cold|warm>: estimate_compressed_size over the same corpus
+- rename/preview, rename/apply, rename/undo: batch_preview and apply_renames over
+  tens of thousands of empty files
+
+Metrics: img/s and MP/s (source megapixels), p50/p95 per-call latency, peak RSS.
+--save writes the results as the baseline; later runs compare against it and exit
+with status 1 when a metric is worse than the baseline by more than --threshold.
+
+    python benchmarks/bench_suite.py [--quick] [--save] [--threshold 0.15]
+"""
+import os, sys, json, time, argparse, platform, tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from image_utils import STANDARD_SIZES, target_dims_from_preset, convert_resize_compress, estimate_compressed_size
+from file_utils import batch_preview, apply_renames, undo_last_rename
+from corpus import make_image_corpus, make_dummy_files, run_isolated, timed, percentile, peak_rss_mb
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+FORMATS = ("JPEG", "PNG", "WEBP")
+EXT = {"JPEG": "jpg", "PNG": "png", "WEBP": "webp"}
+# metric -> True when higher is better
+METRICS = {"img_s": True, "mp_s": True, "files_s": True, "p50_ms": False, "p95_ms": False, "total_ms": False, "rss_mb": False}
+
+def _summary(lat, mps, n_key="img_s"):
+    total = sum(lat)
+    out = {n_key: round(len(lat) / total, 2) if total else None,
+           "p50_ms": round(percentile(lat, 50) * 1000, 1), "p95_ms": round(percentile(lat, 95) * 1000, 1)}
+    if mps is not None:
+        out["mp_s"] = round(sum(mps) / total, 2) if total else None
+    return out
+
+def _convert_case(corpus, outdir, size, fmt):
+    lat = []
+    for i, (path, _) in enumerate(corpus):
+        t, _ = timed(convert_resize_compress, path, out_fmt=fmt, out_path=os.path.join(outdir, f"{i}.{EXT[fmt]}"),
+                     size=size, quality=85)
+        lat.append(t)
+    return _summary(lat, [m for _, m in corpus])
+
+def _estimate_case(corpus, fast):
+    result = {}
+    for phase in ("cold", "warm"):  # warm = same process, caches populated
+        lat = [timed(estimate_compressed_size, path, "JPEG", 85, fast=fast)[0] for path, _ in corpus]
+        result[phase] = _summary(lat, [m for _, m in corpus])
+    return result
+
+def _rename_case(folder, count):
+    paths = make_dummy_files(folder, count)
+    journal = os.path.join(folder, "journal.jsonl")
+    out = {}
+    t, previews = timed(batch_preview, paths, prefix="{date}_", start=1, pad=6, numbering=True, case="lower")
+    out["preview"] = {"files_s": round(count / t), "total_ms": round(t * 1000, 1)}
+    t, _ = timed(apply_renames, paths, previews, journal=journal)
+    out["apply"] = {"files_s": round(count / t), "total_ms": round(t * 1000, 1)}
+    t, _ = timed(undo_last_rename, journal=journal)
+    out["undo"] = {"files_s": round(count / t), "total_ms": round(t * 1000, 1)}
+    for case in out.values():
+        case["rss_mb"] = peak_rss_mb()
+    return out
+
+def run_suite(a, tmp, log=print):
+    corpus = make_image_corpus(os.path.join(tmp, "corpus"), a.images, max_mp=a.max_mp)
+    log(f"corpus: {len(corpus)} images, {sum(m for _, m in corpus):.1f} MP; rename set: {a.files} files\n")
+    results = {}
+
+    def report(name, metrics):
+        results[name] = metrics
+        log(f"{name[:52]:52} " + "  ".join(f"{k}={v}" for k, v in metrics.items()))
+
+    presets = [p for p in STANDARD_SIZES if not a.presets or any(s.lower() in p.lower() for s in a.presets)]
+    for preset in presets:
+        for fmt in a.formats:
+            outdir = os.path.join(tmp, "out"); os.makedirs(outdir, exist_ok=True)
+            metrics, rss = run_isolated(_convert_case, corpus, outdir, target_dims_from_preset(preset), fmt)
+            report(f"convert/{preset}/{fmt}", dict(metrics, rss_mb=rss))
+    for fast in (True, False):
+        phases, rss = run_isolated(_estimate_case, corpus, fast)
+        for phase, metrics in phases.items():
+            report(f"estimate/{'fast' if fast else 'exact'}-{phase}", dict(metrics, rss_mb=rss))
+    for name, metrics in run_isolated(_rename_case, os.path.join(tmp, "rename"), a.files)[0].items():
+        report(f"rename/{name}", metrics)
+    return results
+
+def compare(results, baseline, threshold):
+    """Return [(case, metric, base, now, change), ...] for metrics worse than the baseline by > threshold."""
+    regressions = []
+    for case, metrics in results.items():
+        base = baseline.get(case, {})
+        for metric, now in metrics.items():
+            old = base.get(metric)
+            if metric not in METRICS or not old or now is None:
+                continue
+            change = (now - old) / old
+            if (-change if METRICS[metric] else change) > threshold:
+                regressions.append((case, metric, old, now, change))
+    return regressions
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--quick", action="store_true", help="small corpus and three presets (smoke run)")
+    ap.add_argument("--images", type=int, help="images in the corpus (default 11, quick 6)")
+    ap.add_argument("--max-mp", type=float, help="cap source size in megapixels (quick: 4)")
+    ap.add_argument("--files", type=int, help="files for the rename cases (default 20000, quick 5000)")
+    ap.add_argument("--presets", nargs="*", help="only presets containing one of these strings")
+    ap.add_argument("--formats", nargs="*", default=list(FORMATS), type=str.upper, choices=FORMATS)
+    ap.add_argument("--baseline", default=BASELINE, help="baseline JSON (default: benchmarks/baseline.json)")
+    ap.add_argument("--save", action="store_true", help="store this run as the baseline")
+    ap.add_argument("--threshold", type=float, default=0.15, help="allowed relative slowdown (default 0.15)")
+    ap.add_argument("--json", help="also write this run's results to this file")
+    a = ap.parse_args(argv)
+    if a.quick:
+        a.images, a.max_mp, a.files = a.images or 6, a.max_mp or 4, a.files or 5000
+        a.presets = a.presets or ["India", "4×6", "Instagram Post"]
+    a.images, a.files = a.images or 11, a.files or 20000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        results = run_suite(a, tmp)
+    run = {"meta": {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "python": platform.python_version(),
+                    "machine": platform.node(), "cpu": os.cpu_count(), "quick": a.quick,
+                    "images": a.images, "max_mp": a.max_mp, "files": a.files,
+                    "seconds": round(time.perf_counter() - t0, 1)},
+           "cases": results}
+    if a.json:
+        with open(a.json, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=1, ensure_ascii=False)
+
+    status = 0
+    if os.path.exists(a.baseline) and not a.save:
+        with open(a.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if {k: baseline["meta"].get(k) for k in ("images", "max_mp", "files")} != \
+                {k: run["meta"][k] for k in ("images", "max_mp", "files")}:
+            print("\nwarning: baseline was recorded with a different corpus; comparing anyway")
+        regressions = compare(results, baseline["cases"], a.threshold)
+        print(f"\nvs baseline from {baseline['meta'].get('time')} ({baseline['meta'].get('machine')}), "
+              f"threshold {a.threshold:.0%}:")
+        for case, metric, old, now, change in regressions:
+            print(f"  REGRESSION {case} {metric}: {old} -> {now} ({change:+.0%})")
+        print(f"  {len(regressions)} regression(s)" if regressions else "  no regressions")
+        status = 1 if regressions else 0
+    if a.save:
+        with open(a.baseline, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=1, ensure_ascii=False)
+        print(f"\nbaseline saved to {a.baseline}")
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Synthetic inputs and measurement helpers shared by the benchmark scripts.
+
+Everything is generated locally from a seed, so two runs (or two machines) measure the
+same corpus without shipping sample photos.
+"""
+import os, sys, time, queue, random
+import multiprocessing as mp
+
+try:
+    import resource
+except ImportError:  # Windows: no peak-RSS numbers
+    resource = None
+
+# (megapixels, kind) mix for image corpora: mostly photos, some screenshots / graphics with alpha or palettes
+IMAGE_MIX = [
+    (0.3, "jpeg"), (2, "jpeg"), (8, "jpeg"), (12, "jpeg"), (24, "jpeg"),
+    (1, "png"), (4, "png"), (1, "rgba"), (3, "rgba"), (0.5, "palette"), (2, "palette"),
+]
+
+def _pixels(w, h, seed):
+    from PIL import Image
+    rnd = random.Random(seed)
+    noise = Image.effect_noise((w, h), rnd.randint(20, 60)).convert("RGB")
+    grad = Image.linear_gradient("L").rotate(rnd.choice((0, 90, 180, 270))).resize((w, h)).convert("RGB")
+    return Image.blend(noise, grad, rnd.uniform(0.4, 0.8))
+
+def _dims(megapixels, aspect=3 / 2):
+    w = int((megapixels * 1e6 * aspect) ** 0.5)
+    return w, max(1, int(w / aspect))
+
+def make_source(path, megapixels):
+    """Write a camera-like 3:2 JPEG of about `megapixels` MP; returns (w, h)."""
+    w, h = _dims(megapixels)
+    _pixels(w, h, 0).save(path, "JPEG", quality=92)
+    return w, h
+
+def make_image(path, megapixels, kind, seed=0):
+    """Write one synthetic image; kind is jpeg, png, rgba or palette. Returns (w, h)."""
+    from PIL import Image
+    w, h = _dims(megapixels, random.Random(seed).choice((3 / 2, 4 / 3, 1.0, 2 / 3)))
+    img = _pixels(w, h, seed)
+    if kind == "jpeg":
+        img.save(path, "JPEG", quality=90)
+    elif kind == "png":
+        img.save(path, "PNG")
+    elif kind == "rgba":
+        img.putalpha(Image.linear_gradient("L").resize((w, h)))
+        img.save(path, "PNG")
+    elif kind == "palette":
+        img.quantize(64).save(path, "PNG")
+    else:
+        raise ValueError(f"unknown image kind: {kind}")
+    return w, h
+
+def make_image_corpus(folder, count=len(IMAGE_MIX), max_mp=None, seed=1):
+    """
+    Fill folder with `count` images cycling through IMAGE_MIX (optionally capped at max_mp).
+    Returns [(path, megapixels), ...]. Existing files with the same name are reused.
+    """
+    os.makedirs(folder, exist_ok=True)
+    out = []
+    for i in range(count):
+        mpx, kind = IMAGE_MIX[i % len(IMAGE_MIX)]
+        if max_mp:
+            mpx = min(mpx, max_mp)
+        path = os.path.join(folder, f"img_{i:04d}_{kind}.{'jpg' if kind == 'jpeg' else 'png'}")
+        if os.path.exists(path):
+            from PIL import Image
+            with Image.open(path) as im:
+                w, h = im.size
+        else:
+            w, h = make_image(path, mpx, kind, seed=seed * 100003 + i)
+        out.append((path, w * h / 1e6))
+    return out
+
+def make_dummy_files(folder, count, per_dir=1000):
+    """Create `count` empty files spread over subfolders of per_dir files; returns their paths."""
+    paths = []
+    for i in range(count):
+        d = os.path.join(folder, f"d{i // per_dir:03d}")
+        if i % per_dir == 0:
+            os.makedirs(d, exist_ok=True)
+        p = os.path.join(d, f"file {i:06d}.txt")
+        open(p, "wb").close()
+        paths.append(p)
+    return paths
+
+def peak_rss_mb():
+    # VmHWM is per process image; ru_maxrss on Linux survives fork+exec and would report the parent's peak
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(kb / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)  # bytes on macOS, KiB elsewhere
+
+def timed(fn, *args, **kwargs):
+    """Return (seconds, result) for one call."""
+    t0 = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return time.perf_counter() - t0, result
+
+def _isolated(fn, args, q):
+    try:
+        q.put((None, (fn(*args), peak_rss_mb())))
+    except Exception as e:
+        q.put((f"{type(e).__name__}: {e}", None))
+
+def run_isolated(fn, *args):
+    """
+    Run fn(*args) in a fresh spawned process; returns (result, peak_rss_mb of that process).
+    RuntimeError if fn raises there or the process dies without an answer (crash, OOM kill).
+    """
+    ctx = mp.get_context("spawn")
+    q = ctx.Queue()
+    p = ctx.Process(target=_isolated, args=(fn, args, q))
+    p.start()
+    while True:
+        try:
+            error, result = q.get(timeout=1.0)
+            break
+        except queue.Empty:
+            if not p.is_alive():
+                try:
+                    error, result = q.get(timeout=1.0)  # put just before it exited
+                    break
+                except queue.Empty:
+                    raise RuntimeError(f"{fn.__name__}: benchmark process died (exit code {p.exitcode})") from None
+    p.join()
+    if error:
+        raise RuntimeError(f"{fn.__name__}: {error}")
+    return result
+
+def percentile(values, pct):
+    values = sorted(values)
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
@@ -0,0 +1,126 @@
+"""
+Colour handling for encoded outputs: ICC profiles and transparency.
+
+prepare_output() takes a decoded (and resized) image and returns it ready for the output format:
+- profile "sRGB" (default): pixels tagged with an embedded ICC profile are transformed to sRGB
+  and saved without a profile, which is what browsers and most viewers assume. Building a
+  LittleCMS transform costs far more than applying one to a resized image, so transforms are
+  cached per process by (profile digest, mode, target); a batch from one camera builds one.
+  Profiles that already are sRGB are recognised once and then skipped. Files copied
+  instead of re-encoded (passthrough.py) keep their profile, so they still display right
+- profile "keep": pixels untouched, the source profile is embedded in the output
+- profile <path to an .icc/.icm file>: transformed to that profile, which is then embedded;
+  untagged RGB sources are taken to be sRGB. Never copied by passthrough
+- transparency, for formats without alpha (JPEG, or any mode JPEG can't take), is composited
+  onto `background` in one pass: a paste through the alpha channel, no per-pixel Python
+"""
+import hashlib, threading
+from collections import OrderedDict
+from io import BytesIO
+from PIL import Image
+
+PROFILES = ("sRGB", "keep")          # or the path of an ICC profile file
+ICC_FORMATS = ("JPEG", "PNG", "WEBP", "TIFF")  # formats Pillow embeds an icc_profile in
+ALPHA_FORMATS = ("PNG", "WEBP", "TIFF")  # BMP alpha is read by few viewers, and LA not at all
+BACKGROUND = (255, 255, 255)
+_CMS_MODES = ("RGB", "RGBA", "CMYK")  # modes transformed; grayscale and 16-bit stay as decoded
+_MAX_TRANSFORMS = 32
+
+_transforms, _targets, _lock = OrderedDict(), {}, threading.Lock()
+
+def parse_color(text):
+    """'#rrggbb' / 'rrggbb' (or an (r, g, b) tuple) -> (r, g, b)."""
+    if isinstance(text, (tuple, list)):
+        return tuple(int(v) for v in text[:3])
+    h = text.strip().lstrip("#")
+    if len(h) != 6:
+        raise ValueError(f"expected a colour like #ffffff, got {text!r}")
+    return tuple(int(h[i:i + 2], 16) for i in (0, 2, 4))
+
+def _target(profile):
+    # (ImageCmsProfile, bytes to embed or None) for a target name / file, loaded once
+    from PIL import ImageCms
+    if profile not in _targets:
+        if profile == "sRGB":
+            _targets[profile] = (ImageCms.ImageCmsProfile(ImageCms.createProfile("sRGB")), None)
+        else:
+            with open(profile, "rb") as f:
+                data = f.read()
+            _targets[profile] = (ImageCms.ImageCmsProfile(BytesIO(data)), data)
+    return _targets[profile]
+
+def _is_srgb(cms_profile):
+    from PIL import ImageCms
+    try:
+        return "srgb" in ImageCms.getProfileDescription(cms_profile).lower().replace(" ", "")
+    except ImageCms.PyCMSError:
+        return False
+
+def icc_transform(icc, mode, profile="sRGB"):
+    """
+    Cached ImageCms transform from the embedded profile icc (bytes; None for an untagged
+    image, taken as sRGB) for images in mode to profile; False when there is nothing to do
+    (icc already is sRGB), None when icc can't be used (unreadable, or made for another
+    colour space than mode's).
+    """
+    key = (hashlib.blake2b(icc or b"", digest_size=16).digest(), mode, profile)
+    with _lock:
+        if key in _transforms:
+            _transforms.move_to_end(key)
+            return _transforms[key]
+    from PIL import ImageCms
+    try:
+        src = ImageCms.ImageCmsProfile(BytesIO(icc) if icc else ImageCms.createProfile("sRGB"))
+        transform = profile != "sRGB" or not _is_srgb(src)
+        if transform:
+            transform = ImageCms.buildTransform(src, _target(profile)[0], mode, "RGBA" if mode == "RGBA" else "RGB")
+    except (ImageCms.PyCMSError, OSError, ValueError):
+        transform = None
+    with _lock:
+        _transforms[key] = transform
+        while len(_transforms) > _MAX_TRANSFORMS:
+            _transforms.popitem(last=False)
+    return transform
+
+def flatten_alpha(img, background=BACKGROUND):
+    """img (RGBA, LA, PA, or P with transparency) composited onto background, as RGB (L for LA)."""
+    if img.mode not in ("RGBA", "LA"):
+        img = img.convert("RGBA")  # P, PA, RGBa, La
+    if img.mode == "LA":
+        r, g, b = background
+        out = Image.new("L", img.size, round(0.299 * r + 0.587 * g + 0.114 * b))
+    else:
+        out = Image.new("RGB", img.size, background)
+    out.paste(img, (0, 0), img)  # blended through img's own alpha in one C pass
+    return out
+
+def _has_alpha(img):
+    return "A" in img.mode or (img.mode == "P" and "transparency" in img.info)
+
+def prepare_output(img, fmt, icc=None, profile="sRGB", background=BACKGROUND):
+    """
+    (img, save_kw) for encoding img as fmt: colour-managed to profile (see module docstring),
+    transparency flattened onto background where fmt can't store it, and the mode made one
+    fmt accepts. icc is the source's embedded profile (img.info may have lost it on resize).
+    """
+    fmt = fmt.upper()
+    icc = icc if icc is not None else img.info.get("icc_profile")
+    save_kw = {}
+    if icc and profile == "keep":
+        if fmt in ICC_FORMATS:
+            save_kw["icc_profile"] = icc
+    elif icc or profile not in PROFILES:
+        if img.mode == "P":
+            img = img.convert("RGBA" if _has_alpha(img) else "RGB")
+        transform = icc_transform(icc, img.mode, profile) if img.mode in _CMS_MODES else None
+        if transform:
+            from PIL import ImageCms
+            img = ImageCms.applyTransform(img, transform)
+            save_kw["icc_profile"] = _target(profile)[1]  # None: don't carry the source's over (PNG would)
+        elif transform is None and icc and fmt in ICC_FORMATS:
+            save_kw["icc_profile"] = icc  # pixels left as they are, so they keep their profile
+    if _has_alpha(img) and fmt not in ALPHA_FORMATS:
+        img = flatten_alpha(img, background)
+    if fmt == "JPEG" and img.mode not in ("RGB", "L", "CMYK") or img.mode == "CMYK" and fmt not in ("JPEG", "TIFF"):
+        img = img.convert("RGB")
+    return img, save_kw
@@ -0,0 +1,48 @@
+import os, json
+
+CONFIG_DIR = os.path.join(os.path.expanduser("~"), ".utilitytool")
+SETTINGS_PATH = os.path.join(CONFIG_DIR, "settings.json")
+PRESETS_PATH = os.path.join(CONFIG_DIR, "presets.json")
+CACHE_DIR = os.path.join(CONFIG_DIR, "cache")
+RENAME_JOURNAL = os.path.join(CONFIG_DIR, "rename_journal.jsonl")
+BATCH_REPORT = os.path.join(CONFIG_DIR, "last_batch_report.json")
+
+DEFAULT_SETTINGS = {
+    "theme": "dark",
+    "default_output": "",
+    "default_format": "JPEG",
+    "default_quality": 85,
+    "preserve_exif": False,
+    "color_profile": "sRGB",     # or "keep", or an ICC profile path (see color.py)
+    "background": "#ffffff",     # what transparency is flattened onto for JPEG
+    "remember_last": True
+}
+
+def ensure_config():
+    os.makedirs(CONFIG_DIR, exist_ok=True)
+    if not os.path.exists(SETTINGS_PATH):
+        with open(SETTINGS_PATH, "w") as f: json.dump(DEFAULT_SETTINGS, f, indent=2)
+    if not os.path.exists(PRESETS_PATH):
+        with open(PRESETS_PATH, "w") as f: json.dump({"presets": {}}, f, indent=2)
+
+def load_settings():
+    """DEFAULT_SETTINGS overlaid with the saved settings (the defaults alone if unreadable)."""
+    try:
+        with open(SETTINGS_PATH, "r") as f:
+            return dict(DEFAULT_SETTINGS, **json.load(f))
+    except (OSError, ValueError):
+        return dict(DEFAULT_SETTINGS)
+
+def load_presets():
+    """The Home tab's saved presets: {name: {"default_format", "default_quality"}} ({} if unreadable)."""
+    try:
+        with open(PRESETS_PATH, "r") as f:
+            return json.load(f).get("presets", {})
+    except (OSError, ValueError):
+        return {}
+
+def cache_dir(name):
+    """Per-feature cache folder under CONFIG_DIR/cache, created on first use."""
+    path = os.path.join(CACHE_DIR, name)
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -0,0 +1,213 @@
+import os, stat, mmap, time, hashlib, threading
+from collections import namedtuple, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from rename_plan import RenameConflictError
+
+CHUNK = 64 * 1024               # bytes hashed at each end of a file in the partial pass
+MMAP_MIN = 4 * 1024 * 1024      # files at least this big are hashed through mmap
+BUFSIZE = 1024 * 1024
+KEEP_RULES = ("oldest", "newest", "shortest path", "first listed")
+
+# paths: one per distinct file (hard links to the same inode are listed once), in input order
+DuplicateGroup = namedtuple("DuplicateGroup", "size digest paths")
+
+def _hasher():
+    return hashlib.blake2b(digest_size=20)
+
+def partial_hash(path, size, chunk=CHUNK):
+    """Hash of the first and last `chunk` bytes; for files up to 2×chunk this is full_hash()."""
+    h = _hasher()
+    with open(path, "rb") as f:
+        if size <= 2 * chunk:
+            h.update(f.read())
+        else:
+            h.update(f.read(chunk))
+            f.seek(-chunk, os.SEEK_END)
+            h.update(f.read(chunk))
+    return h.hexdigest()
+
+def full_hash(path, size=None):
+    """Hash of the whole file: mmap'd when large, else read through one reused 1 MB buffer."""
+    h = _hasher()
+    with open(path, "rb") as f:
+        if (size if size is not None else os.fstat(f.fileno()).st_size) >= MMAP_MIN:
+            try:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    if hasattr(m, "madvise"):
+                        m.madvise(mmap.MADV_SEQUENTIAL)
+                    with memoryview(m) as mv:
+                        for i in range(0, len(mv), 16 * BUFSIZE):
+                            h.update(mv[i:i + 16 * BUFSIZE])  # hashlib drops the GIL for big updates
+                return h.hexdigest()
+            except (OSError, ValueError):  # e.g. a file system that can't mmap
+                f.seek(0)
+                h = _hasher()
+        buf = bytearray(BUFSIZE)
+        with memoryview(buf) as mv:
+            while True:
+                n = f.readinto(buf)
+                if not n:
+                    break
+                h.update(mv[:n])
+    return h.hexdigest()
+
+class DuplicateFinder:
+    """
+    Finds files with identical content in three passes, each over fewer files:
+    - size: files are bucketed by size and sizes seen once are dropped (a path listed twice,
+      or hard links to one inode, count as one file: they already share their data)
+    - partial: the first and last CHUNK bytes of the remaining files are hashed
+    - full: whole files are hashed only where partial hashes still collide (files of up to
+      2×CHUNK were already read whole by the partial pass)
+    Hashing runs on `threads` threads. With a FileCache, hashes are kept by (path, size,
+    mtime) so another run over the same tree only reads new or changed files.
+    run() returns the groups, largest waste first; stats describes the passes and stamps
+    holds each grouped file's (size, mtime_ns) for plan_dedupe's safety check.
+    """
+    def __init__(self, cache=None, threads=8, min_size=1, chunk=CHUNK):
+        self.cache, self.threads, self.min_size, self.chunk = cache, threads, min_size, chunk
+        self.stamps = {}
+        self.stats = {}
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def run(self, paths, on_progress=None):
+        """paths: iterable of file paths. on_progress(stage, done, total) is called as passes advance."""
+        self._cancel.clear()
+        self.stamps = {}
+        t0 = time.perf_counter()
+        s = self.stats = {"files": 0, "skipped": 0, "size_candidates": 0, "partial_hashed": 0, "full_hashed": 0,
+                          "cache_hits": 0, "bytes_read": 0, "errors": 0, "groups": 0, "duplicates": 0,
+                          "wasted_bytes": 0, "seconds": 0.0}
+        by_size, inodes = defaultdict(list), set()
+        for path in paths:
+            s["files"] += 1
+            try:
+                st = os.stat(path)
+            except OSError:
+                s["errors"] += 1; continue
+            if not stat.S_ISREG(st.st_mode) or st.st_size < self.min_size or (st.st_dev, st.st_ino) in inodes:
+                s["skipped"] += 1; continue
+            inodes.add((st.st_dev, st.st_ino))
+            by_size[st.st_size].append((path, st))
+            if on_progress and s["files"] % 5000 == 0:
+                on_progress("size", s["files"], 0)
+        candidates = [f for files in by_size.values() if len(files) > 1 for f in files]
+        s["size_candidates"] = len(candidates)
+
+        partial = self._hash_pass("partial", candidates, lambda p, st: partial_hash(p, st.st_size, self.chunk),
+                                  lambda st: min(st.st_size, 2 * self.chunk), on_progress)
+        if self.cancelled:
+            return []
+        buckets = defaultdict(list)
+        for path, st in candidates:
+            if path in partial:
+                buckets[(st.st_size, partial[path])].append((path, st))
+        collided = [f for files in buckets.values() if len(files) > 1 for f in files]
+        big = [(p, st) for p, st in collided if st.st_size > 2 * self.chunk]
+        full = self._hash_pass("full", big, lambda p, st: full_hash(p, st.st_size), lambda st: st.st_size, on_progress)
+        if self.cancelled:
+            return []
+        full.update((p, partial[p]) for p, st in collided if st.st_size <= 2 * self.chunk)
+
+        groups = defaultdict(list)
+        for path, st in collided:
+            if path in full:
+                groups[(st.st_size, full[path])].append((path, st))
+        out = []
+        for (size, digest), files in groups.items():
+            if len(files) > 1:
+                out.append(DuplicateGroup(size, digest, [p for p, _ in files]))
+                self.stamps.update((p, (st.st_size, st.st_mtime_ns)) for p, st in files)
+        out.sort(key=lambda g: -g.size * (len(g.paths) - 1))
+        if self.cache:
+            self.cache.flush()
+        s["groups"] = len(out)
+        s["duplicates"] = sum(len(g.paths) - 1 for g in out)
+        s["wasted_bytes"] = sum(g.size * (len(g.paths) - 1) for g in out)
+        s["seconds"] = round(time.perf_counter() - t0, 3)
+        return out
+
+    def _hash_pass(self, kind, files, fn, cost, on_progress):
+        # {path: digest} for files [(path, st), ...]; cached digests are reused, unreadable files left out
+        out, todo = {}, []
+        for path, st in files:
+            v = self.cache.get(path, st, kind) if self.cache else None
+            if v is not None:
+                out[path] = v; self.stats["cache_hits"] += 1
+            else:
+                todo.append((path, st))
+        if on_progress:
+            on_progress(kind, len(out), len(files))
+        if not todo or self.cancelled:
+            return out
+        ex = ThreadPoolExecutor(self.threads)
+        try:
+            futures = {ex.submit(fn, path, st): (path, st) for path, st in todo}
+            for n, fut in enumerate(as_completed(futures), len(out) + 1):
+                path, st = futures[fut]
+                try:
+                    out[path] = v = fut.result()
+                except OSError:
+                    self.stats["errors"] += 1; continue
+                self.stats[f"{kind}_hashed"] += 1
+                self.stats["bytes_read"] += cost(st)
+                if self.cache:
+                    self.cache.put(path, st, kind, v)
+                if on_progress and (n % 200 == 0 or n == len(files)):
+                    on_progress(kind, n, len(files))
+                if self.cancelled:
+                    break
+        finally:
+            ex.shutdown(wait=True, cancel_futures=True)
+        return out
+
+def choose_keeper(paths, keep="oldest", stamps=None):
+    """The path to keep from a group, by one of KEEP_RULES (the others are the duplicates)."""
+    if keep == "first listed":
+        return paths[0]
+    if keep == "shortest path":
+        return min(paths, key=lambda p: (len(p), p))
+    mtime = lambda p: (stamps or {}).get(p, (0, os.stat(p).st_mtime_ns))[1]
+    return (min if keep == "oldest" else max)(paths, key=mtime)
+
+def plan_dedupe(groups, keep="oldest", stamps=None):
+    """
+    [(duplicate, keeper), ...] for groups. With stamps (DuplicateFinder.stamps), a file whose
+    size or mtime changed since the scan raises RenameConflictError before anything is touched.
+    """
+    pairs, conflicts = [], []
+    for g in groups:
+        keeper = choose_keeper(g.paths, keep, stamps)
+        for p in g.paths:
+            if stamps and p in stamps:
+                try:
+                    st = os.stat(p)
+                    if (st.st_size, st.st_mtime_ns) != stamps[p]:
+                        conflicts.append(("changed", p, "modified since the duplicate scan"))
+                except OSError:
+                    conflicts.append(("missing-source", p, "file not found"))
+            if p != keeper:
+                pairs.append((p, keeper))
+    if conflicts:
+        raise RenameConflictError(conflicts)
+    return pairs
+
+def move_targets(pairs, folder):
+    """New paths in folder for each duplicate, adding ' (n)' where file names clash."""
+    seen, out = set(), []
+    for dup, _ in pairs:
+        stem, ext = os.path.splitext(os.path.basename(dup))
+        name, n = stem + ext, 1
+        while name.lower() in seen or os.path.lexists(os.path.join(folder, name)):
+            n += 1
+            name = f"{stem} ({n}){ext}"
+        seen.add(name.lower())
+        out.append(os.path.join(folder, name))
+    return out
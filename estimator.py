@@ -0,0 +1,148 @@
+import os
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from PIL import Image
+from image_utils import save_options
+from color import prepare_output
+
+def _prepare(img, fmt):
+    # colour-manage and flatten alpha with the defaults, mirroring convert_resize_compress
+    return prepare_output(img, fmt)[0]
+
+def _encoded_size(img, fmt, quality, subsampling):
+    bio = BytesIO()
+    img.save(bio, fmt, **save_options(fmt, quality, subsampling))
+    return bio.tell()
+
+class _LRU:
+    """OrderedDict LRU bounded by the total 'cost' of its entries (bytes or simply 1 per entry)."""
+    def __init__(self, budget):
+        self.budget, self.used, self.items = budget, 0, OrderedDict()
+
+    def get(self, key):
+        hit = self.items.get(key)
+        if hit is not None:
+            self.items.move_to_end(key)
+            return hit[0]
+        return None
+
+    def put(self, key, value, cost=1):
+        old = self.items.pop(key, None)
+        if old is not None:
+            self.used -= old[1]
+        self.items[key] = (value, cost)
+        self.used += cost
+        while self.used > self.budget and len(self.items) > 1:
+            _, (_, c) = self.items.popitem(last=False)
+            self.used -= c
+
+class SizeEstimator:
+    """
+    Compressed-size estimates with caching, shared by the UI and headless callers.
+    - decoded images are kept in an LRU bounded by max_decoded_bytes (exact mode)
+    - a small mosaic of tiles per image is kept for fast mode
+    - results are cached by (path, mtime, format, quality, subsampling, fast)
+    Fast mode encodes tiles × tiles blocks sampled evenly over the image and extrapolates
+    the bytes per pixel, so a whole list can be re-estimated while a slider moves.
+    Thread-safe; encodes run outside the lock.
+    """
+    def __init__(self, max_decoded_bytes=512 * 1024 * 1024, max_results=50000, tiles=3, tile_px=128):
+        self.tiles, self.tile_px = tiles, tile_px
+        self._decoded = _LRU(max_decoded_bytes)
+        self._mosaics = _LRU(max_decoded_bytes // 4)
+        self._sizes = _LRU(max_results)
+        self._headers = {}
+        self._lock = threading.Lock()
+
+    def _key(self, path):
+        st = os.stat(path)
+        return path, st.st_mtime_ns, st.st_size
+
+    def decoded(self, path):
+        """Return the fully decoded image for path (cached until the file changes)."""
+        key = self._key(path)
+        with self._lock:
+            img = self._decoded.get(key)
+        if img is None:
+            img = Image.open(path)
+            img.load()
+            with self._lock:
+                self._decoded.put(key, img, img.width * img.height * len(img.getbands()))
+        return img
+
+    def _mosaic(self, key):
+        with self._lock:
+            hit = self._mosaics.get(key)
+        if hit is not None:
+            return hit
+        with Image.open(key[0]) as src:
+            # tiles are cut at full resolution: a draft/shrunk decode packs more detail per
+            # pixel and can't show how much the full size adds (noise, grain), which skewed
+            # estimates for big photos by -30%..+45%
+            src.load()
+            w, h = src.size
+            n, t = self.tiles, self.tile_px
+            if w * h <= 4 * (n * t) ** 2:
+                hit = (src.copy(), 1.0)  # small image: sampling would cost as much as encoding it
+            else:
+                tw, th = min(t, w), min(t, h)
+                mosaic = Image.new(src.mode, (tw * n, th * n))
+                if src.mode == "P":
+                    mosaic.putpalette(src.getpalette())
+                for row in range(n):
+                    for col in range(n):
+                        x = (w - tw) * (2 * col + 1) // (2 * n)
+                        y = (h - th) * (2 * row + 1) // (2 * n)
+                        mosaic.paste(src.crop((x, y, x + tw, y + th)), (col * tw, row * th))
+                hit = (mosaic, (w * h) / (mosaic.width * mosaic.height))
+        with self._lock:
+            self._mosaics.put(key, hit, hit[0].width * hit[0].height * len(hit[0].getbands()))
+        return hit
+
+    def _header_bytes(self, fmt, quality, subsampling):
+        # Fixed per-file overhead (headers, tables) that must not be scaled with the pixel count
+        k = (fmt, quality, subsampling)
+        if k not in self._headers:
+            self._headers[k] = _encoded_size(Image.new("RGB", (8, 8)), fmt, quality, subsampling)
+        return self._headers[k]
+
+    def estimate(self, path, fmt="JPEG", quality=85, subsampling="keep", fast=False):
+        """Return (estimated_bytes, ratio_vs_original), or (None, None) if the file can't be read."""
+        fmt = fmt.upper()
+        try:
+            key = self._key(path)
+            rkey = key + (fmt, int(quality), subsampling, bool(fast))
+            with self._lock:
+                hit = self._sizes.get(rkey)
+            if hit is None:
+                if fast:
+                    mosaic, scale = self._mosaic(key)
+                    size = _encoded_size(_prepare(mosaic, fmt), fmt, quality, subsampling)
+                    if scale != 1.0:
+                        header = self._header_bytes(fmt, quality, subsampling)
+                        size = header + max(0, size - header) * scale
+                    hit = int(size)
+                else:
+                    hit = _encoded_size(_prepare(self.decoded(path), fmt), fmt, quality, subsampling)
+                with self._lock:
+                    self._sizes.put(rkey, hit)
+            orig = key[2]
+            return hit, (hit / orig) if orig else 1.0
+        except Exception:
+            return None, None
+
+    def estimate_many(self, paths, fmt="JPEG", quality=85, subsampling="keep", fast=True):
+        """Yield (path, estimated_bytes, ratio) for each path."""
+        for p in paths:
+            est, ratio = self.estimate(p, fmt=fmt, quality=quality, subsampling=subsampling, fast=fast)
+            yield p, est, ratio
+
+_shared = None
+
+def shared_estimator():
+    """Process-wide SizeEstimator so every caller benefits from the same caches."""
+    global _shared
+    if _shared is None:
+        _shared = SizeEstimator()
+    return _shared
@@ -0,0 +1,114 @@
+import os, time
+from collections import OrderedDict
+from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex, QThread, pyqtSignal
+from file_utils import PathStore, iter_files
+
+class FileListModel(QAbstractListModel):
+    """
+    List model over a PathStore, so views only create what is on screen.
+    - DisplayRole: full path, or the file name when show_names is set (grid views)
+    - UserRole: full path
+    - DecorationRole / ToolTipRole: optional per-row icons (LRU-bounded) and tooltips
+    """
+    def __init__(self, parent=None, max_icons=2000):
+        super().__init__(parent)
+        self.store = PathStore()
+        self.show_names = False
+        self.placeholder = None
+        self.icons = OrderedDict()  # row -> QIcon, least recently set first
+        self.max_icons = max_icons
+        self.tips = {}
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.store)
+
+    def data(self, index, role=Qt.DisplayRole):
+        row = index.row()
+        if not index.isValid() or row >= len(self.store):
+            return None
+        if role == Qt.DisplayRole:
+            path = self.store[row]
+            return os.path.basename(path) if self.show_names else path
+        if role == Qt.UserRole:
+            return self.store[row]
+        if role == Qt.DecorationRole:
+            return self.icons.get(row, self.placeholder)
+        if role == Qt.ToolTipRole:
+            return self.tips.get(row)
+        return None
+
+    def __len__(self):
+        return len(self.store)
+
+    def paths(self):
+        return self.store
+
+    def append_paths(self, paths):
+        if not paths:
+            return
+        n = len(self.store)
+        self.beginInsertRows(QModelIndex(), n, n + len(paths) - 1)
+        self.store.extend(paths)
+        self.endInsertRows()
+
+    def set_paths(self, paths):
+        self.beginResetModel()
+        self.store = paths if isinstance(paths, PathStore) else PathStore(paths)
+        self.icons.clear(); self.tips.clear()
+        self.endResetModel()
+
+    def clear(self):
+        self.set_paths(PathStore())
+
+    def set_icon(self, row, icon):
+        if row >= len(self.store):
+            return
+        self.icons[row] = icon
+        self.icons.move_to_end(row)
+        while len(self.icons) > self.max_icons:
+            self.icons.popitem(last=False)  # evicted rows get re-requested when scrolled back into view
+        ix = self.index(row)
+        self.dataChanged.emit(ix, ix, [Qt.DecorationRole])
+
+    def set_tip(self, row, text):
+        if row < len(self.store):
+            self.tips[row] = text
+            ix = self.index(row)
+            self.dataChanged.emit(ix, ix, [Qt.ToolTipRole])
+
+    def set_show_names(self, on):
+        self.show_names = on
+        if len(self.store):
+            self.dataChanged.emit(self.index(0), self.index(len(self.store) - 1), [Qt.DisplayRole])
+
+# Streams a recursive folder walk into the model in chunks, off the UI thread
+class ScanWorker(QThread):
+    chunk = pyqtSignal(list)    # paths found since the last chunk
+    done = pyqtSignal(int)      # total files found
+
+    def __init__(self, roots, exts=None, recursive=True, chunk_size=2000, interval=0.1, parent=None):
+        super().__init__(parent)
+        self.roots = roots
+        self.exts = exts
+        self.recursive = recursive
+        self.chunk_size = chunk_size
+        self.interval = interval
+        self._stop = False
+
+    def stop(self):
+        self._stop = True
+
+    def run(self):
+        buf, total, last = [], 0, time.monotonic()
+        for path in iter_files(self.roots, exts=self.exts, recursive=self.recursive):
+            if self._stop:
+                return
+            buf.append(path)
+            if len(buf) >= self.chunk_size or time.monotonic() - last >= self.interval:
+                total += len(buf)
+                self.chunk.emit(buf)
+                buf, last = [], time.monotonic()
+        total += len(buf)
+        if buf:
+            self.chunk.emit(buf)
+        self.done.emit(total)
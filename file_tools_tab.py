@@ -1,30 +1,101 @@
 from PyQt5.QtWidgets import (
-    QWidget, QVBoxLayout, QLabel, QPushButton, QFileDialog, QListWidget, 
-    QHBoxLayout, QLineEdit, QSpinBox, QComboBox, QMessageBox
+    QWidget, QVBoxLayout, QLabel, QPushButton, QFileDialog, QListView,
+    QHBoxLayout, QLineEdit, QSpinBox, QComboBox, QMessageBox, QCheckBox
 )
-from file_utils import batch_preview, apply_renames
+from PyQt5.QtCore import QThread, QTimer, pyqtSignal
+from file_utils import RenamePipeline, apply_renames, undo_last_rename, PathStore, apply_dedupe
+from rename_plan import RenameConflictError
+from file_model import FileListModel, ScanWorker
+from duplicates import DuplicateFinder, KEEP_RULES, choose_keeper
+from filecache import FileCache
+
+def _list_view(model):
+    view = QListView()
+    view.setModel(model)
+    view.setUniformItemSizes(True)
+    view.setLayoutMode(QListView.Batched)
+    return view
+
+# Runs the rename pipeline off the UI thread; the tab never touches the pipeline while this runs
+class PreviewWorker(QThread):
+    ready = pyqtSignal(object, object)   # PathStore of new paths (None if the pass failed), error message or None
+
+    def __init__(self, pipeline, parent=None):
+        super().__init__(parent)
+        self.pipeline = pipeline
+
+    def run(self):
+        previews, error = None, None
+        try:
+            previews = PathStore(self.pipeline.run())
+            error = self.pipeline.regex_error
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        finally:
+            self.ready.emit(previews, error)  # always, or the tab would wait for this worker forever
+
+# Duplicate scan over the listed files; hashes are cached across runs in the shared FileCache
+class DuplicateWorker(QThread):
+    progress = pyqtSignal(str, int, int)          # pass ("size", "partial", "full"), done, total
+    ready = pyqtSignal(object, object, object)    # [DuplicateGroup], stats ({"error": message} on failure), stamps
+
+    def __init__(self, paths, parent=None):
+        super().__init__(parent)
+        self.paths = paths
+        self.finder = DuplicateFinder()
+
+    def cancel(self):
+        self.finder.cancel()
+
+    def run(self):
+        try:
+            self.finder.cache = cache = FileCache()
+            try:
+                groups = self.finder.run(self.paths, on_progress=self.progress.emit)
+            finally:
+                cache.close()
+        except Exception as e:  # whatever it is, ready must fire or the button stays on "Cancel"
+            self.ready.emit([], {"error": f"{type(e).__name__}: {e}"}, {}); return
+        self.ready.emit(groups, self.finder.stats, self.finder.stamps)
+
+def _size(n):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n < 1024 or unit == "GB":
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
 
 class FileToolsTab(QWidget):
     def __init__(self):
         super().__init__()
+        self.pipeline = RenamePipeline()
+        self.paths_changed = True
+        self.preview_worker, self.stale_stats = None, False
+        self.rerun = False
+        # Debounce: recompute once typing pauses, not on every keystroke
+        self.preview_timer = QTimer(self); self.preview_timer.setSingleShot(True); self.preview_timer.setInterval(150)
+        self.preview_timer.timeout.connect(self.run_preview)
 
         root = QVBoxLayout()
-        head = QLabel("📁 File Tools — Batch Rename")
+        head = QLabel("📁 File Tools — Batch Rename • Duplicates")
         head.setStyleSheet("font-size:16px; font-weight:bold;")
         root.addWidget(head)
 
-        self.listw = QListWidget()
+        self.model = FileListModel(self)
+        self.listw = _list_view(self.model)
         root.addWidget(self.listw)
+        self.scan = None
 
         row1 = QHBoxLayout()
         add_btn = QPushButton("Add Files"); add_btn.clicked.connect(self.add_files)
-        clear_btn = QPushButton("Clear"); clear_btn.clicked.connect(self.listw.clear)
-        row1.addWidget(add_btn); row1.addWidget(clear_btn)
+        add_dir = QPushButton("Add Folder…"); add_dir.clicked.connect(self.add_folder)
+        clear_btn = QPushButton("Clear"); clear_btn.clicked.connect(self.clear_files)
+        self.count_label = QLabel("0 files")
+        row1.addWidget(add_btn); row1.addWidget(add_dir); row1.addWidget(clear_btn); row1.addWidget(self.count_label)
         root.addLayout(row1)
 
         # options
         row2 = QHBoxLayout()
-        self.prefix = QLineEdit(); self.prefix.setPlaceholderText("Prefix (supports {date} / {num})")
+        self.prefix = QLineEdit(); self.prefix.setPlaceholderText("Prefix (supports {date} / {num} / {exif_date} / {width} / {height} / {camera})")
         self.suffix = QLineEdit(); self.suffix.setPlaceholderText("Suffix")
         self.start = QSpinBox(); self.start.setRange(0, 999999); self.start.setValue(1); self.start.setToolTip("Start number for {num}")
         self.pad = QSpinBox(); self.pad.setRange(1, 6); self.pad.setValue(2); self.pad.setToolTip("Zero padding for {num}")
@@ -39,52 +110,240 @@ class FileToolsTab(QWidget):
         row3.addWidget(self.regex_find); row3.addWidget(self.regex_replace); row3.addWidget(self.date_source)
         root.addLayout(row3)
 
+        for w in (self.prefix, self.suffix, self.regex_find, self.regex_replace):
+            w.textChanged.connect(self._options_changed)
+        for w in (self.start, self.pad):
+            w.valueChanged.connect(self._options_changed)
+        for w in (self.case, self.date_source):
+            w.currentTextChanged.connect(self._options_changed)
+
         # actions
         prev = QPushButton("Preview"); prev.clicked.connect(self.preview)
         apply = QPushButton("Apply"); apply.clicked.connect(self.apply)
-        root.addWidget(prev); root.addWidget(apply)
+        undo = QPushButton("Undo Last Rename"); undo.clicked.connect(self.undo)
+        root.addWidget(prev); root.addWidget(apply); root.addWidget(undo)
 
-        self.preview_list = QListWidget()
-        root.addWidget(QLabel("Preview:"))
+        self.preview_model = FileListModel(self)
+        self.preview_list = _list_view(self.preview_model)
+        prev_row = QHBoxLayout()
+        self.live = QCheckBox("Live preview"); self.live.setChecked(True)
+        self.preview_status = QLabel("")
+        prev_row.addWidget(QLabel("Preview:")); prev_row.addWidget(self.live); prev_row.addWidget(self.preview_status)
+        root.addLayout(prev_row)
         root.addWidget(self.preview_list)
 
+        # duplicates: scan the listed files, then delete / hard-link / move all but one per group
+        self.dupe_worker, self.dupe_groups, self.dupe_stamps = None, [], {}
+        dupe_row = QHBoxLayout()
+        self.find_dupes_btn = QPushButton("Find Duplicates"); self.find_dupes_btn.clicked.connect(self.find_duplicates)
+        self.keep_rule = QComboBox(); self.keep_rule.addItems(list(KEEP_RULES)); self.keep_rule.setToolTip("Which file of each group is kept")
+        self.keep_rule.currentTextChanged.connect(self._show_duplicates)
+        self.dupe_mode = QComboBox(); self.dupe_mode.addItems(["Delete", "Hard link", "Move to folder…"])
+        self.dupe_mode.setToolTip("What happens to the other files of each group (Undo Last Rename reverses it)")
+        apply_dupes = QPushButton("Apply to Duplicates"); apply_dupes.clicked.connect(self.apply_duplicates)
+        dupe_row.addWidget(self.find_dupes_btn); dupe_row.addWidget(QLabel("Keep:")); dupe_row.addWidget(self.keep_rule)
+        dupe_row.addWidget(self.dupe_mode); dupe_row.addWidget(apply_dupes)
+        root.addLayout(dupe_row)
+        self.dupe_status = QLabel("")
+        root.addWidget(self.dupe_status)
+        self.dupe_model = FileListModel(self)
+        self.dupe_list = _list_view(self.dupe_model)
+        root.addWidget(self.dupe_list)
+
         self.setLayout(root)
 
     def add_files(self):
         files, _ = QFileDialog.getOpenFileNames(self, "Select Files", "", "All Files (*)")
-        for f in files:
-            self.listw.addItem(f)
+        self.add_paths(files)
 
-    def preview(self):
-        files = [self.listw.item(i).text() for i in range(self.listw.count())]
-        if not files:
-            QMessageBox.warning(self, "No files", "Add files first")
+    def add_folder(self):
+        d = QFileDialog.getExistingDirectory(self, "Add Folder (including sub-folders)")
+        if not d:
             return
-        # Build combined prefix with tokens (we let token replacement happen in utils)
-        prefix = self.prefix.text()
-        suffix = self.suffix.text()
-
-        previews = batch_preview(
-            files,
-            prefix=prefix,
-            suffix=suffix,
+        self._stop_scan()
+        self.scan = ScanWorker([d], parent=self)
+        self.scan.chunk.connect(self.add_paths)
+        self.scan.done.connect(lambda n: self.count_label.setText(f"{len(self.model)} files"))
+        self.scan.finished.connect(self.scan.deleteLater)
+        self.count_label.setText("Scanning…")
+        self.scan.start()
+
+    def _stop_scan(self):
+        if self.scan is not None:
+            self.scan.stop()
+            self.scan.chunk.disconnect(); self.scan.done.disconnect()
+            self.scan = None
+
+    def add_paths(self, files):
+        self.model.append_paths(files)
+        self.count_label.setText(f"{len(self.model)} files" + (" — scanning…" if self.scan else ""))
+        self._files_changed()
+
+    def clear_files(self):
+        self._stop_scan()
+        self.model.clear()
+        self.preview_model.clear()
+        self.count_label.setText("0 files")
+        self._files_changed()
+
+    def _files_changed(self):
+        self.paths_changed = True
+        if self.live.isChecked():
+            self.preview_timer.start()
+
+    def _options_changed(self, *_):
+        if self.live.isChecked():
+            self.preview_timer.start()
+
+    def _options(self):
+        return dict(
+            prefix=self.prefix.text(),
+            suffix=self.suffix.text(),
             start=self.start.value(),
             pad=self.pad.value(),
             date_source=self.date_source.currentText(),
             regex_find=(self.regex_find.text() or None),
             regex_replace=(self.regex_replace.text() or None),
             case=self.case.currentText(),
-            numbering="{num}" in prefix or "{num}" in "".join(files) or True  # enable numbering if requested; fall back to True so 'start' works
+            numbering=True  # always number so 'start' works; {num} is only filled where it appears
         )
-        self.preview_list.clear()
-        for p in previews:
-            self.preview_list.addItem(p)
+
+    def run_preview(self):
+        if self.preview_worker is not None:
+            self.rerun = True  # pick up the latest fields once the running pass is done
+            return
+        if self.paths_changed:
+            self.pipeline.set_paths(self.model.paths())
+            self.paths_changed = False
+        self.pipeline.update(**self._options())  # only stages fed by changed fields are recomputed
+        if self.stale_stats:  # only between passes: the worker reads these caches
+            self.pipeline.refresh_stats()
+            self.stale_stats = False
+        self.preview_worker = PreviewWorker(self.pipeline, parent=self)
+        self.preview_worker.ready.connect(self.on_preview)
+        self.preview_worker.finished.connect(self.preview_worker.deleteLater)
+        self.preview_worker.start()
+
+    def on_preview(self, previews, error):
+        self.preview_worker = None
+        if previews is None:  # never leave an older preview around for Apply
+            self.preview_model.clear()
+            self.preview_status.setText(f"Preview failed: {error}")
+        else:
+            self.preview_model.set_paths(previews)
+            self.preview_status.setText(f"Regex error: {error}" if error else "")
+        if self.rerun:
+            self.rerun = False
+            self.run_preview()
+
+    def preview(self):
+        if not len(self.model):
+            QMessageBox.warning(self, "No files", "Add files first")
+            return
+        self.stale_stats = True  # an explicit preview re-reads file dates and metadata
+        self.run_preview()
 
     def apply(self):
-        files = [self.listw.item(i).text() for i in range(self.listw.count())]
-        previews = [self.preview_list.item(i).text() for i in range(self.preview_list.count())]
-        if not files or not previews or len(files) != len(previews):
+        files = self.model.paths()
+        previews = self.preview_model.paths()
+        if not files or not previews or len(files) != len(previews) or self.preview_worker is not None:
             QMessageBox.warning(self, "No preview", "Generate preview first")
             return
-        apply_renames(files, previews)
+        try:
+            apply_renames(files, previews)
+        except RenameConflictError as e:
+            lines = "\n".join(f"{kind}: {path} — {detail}" for kind, path, detail in e.conflicts[:20])
+            more = f"\n… and {len(e.conflicts) - 20} more" if len(e.conflicts) > 20 else ""
+            QMessageBox.warning(self, "Conflicts", f"Nothing was renamed; fix these first:\n{lines}{more}")
+            return
+        except OSError as e:
+            QMessageBox.critical(self, "Rename failed", f"{e}\nAll renames of this batch were rolled back.")
+            return
+        self.model.set_paths(PathStore(previews))
+        self.preview_model.clear()
+        self._files_changed()
         QMessageBox.information(self, "Done", "Renames applied.")
+
+    def find_duplicates(self):
+        if self.dupe_worker is not None:
+            self.dupe_worker.cancel(); return
+        if not len(self.model):
+            QMessageBox.warning(self, "No files", "Add files first"); return
+        self.dupe_worker = DuplicateWorker(self.model.paths(), parent=self)
+        self.dupe_worker.progress.connect(self.on_dupe_progress)
+        self.dupe_worker.ready.connect(self.on_duplicates)
+        self.dupe_worker.finished.connect(self.dupe_worker.deleteLater)
+        self.find_dupes_btn.setText("Cancel Scan")
+        self.dupe_status.setText("Scanning sizes…")
+        self.dupe_worker.start()
+
+    def on_dupe_progress(self, stage, done, total):
+        label = {"size": "Reading sizes", "partial": "Hashing file ends", "full": "Hashing whole files"}[stage]
+        self.dupe_status.setText(f"{label}: {done}" + (f" / {total}" if total else "") + "…")
+
+    def on_duplicates(self, groups, stats, stamps):
+        cancelled = self.dupe_worker.finder.cancelled
+        self.dupe_worker = None
+        self.find_dupes_btn.setText("Find Duplicates")
+        self.dupe_groups, self.dupe_stamps = groups, stamps
+        self._show_duplicates()
+        if cancelled:
+            self.dupe_status.setText("Scan cancelled."); return
+        if "error" in stats:
+            self.dupe_status.setText(f"Scan failed: {stats['error']}"); return
+        self.dupe_status.setText(
+            f"{stats['duplicates']} duplicates in {stats['groups']} groups, {_size(stats['wasted_bytes'])} reclaimable — "
+            f"{stats['files']} files, {stats['partial_hashed']} partly and {stats['full_hashed']} fully hashed, "
+            f"{stats['cache_hits']} cached, {_size(stats['bytes_read'])} read in {stats['seconds']:.1f}s")
+
+    def _show_duplicates(self, *_):
+        # the list shows the files an action would touch; the tooltip names the kept copy
+        keep, rows, tips = self.keep_rule.currentText(), [], []
+        for g in self.dupe_groups:
+            keeper = choose_keeper(g.paths, keep, self.dupe_stamps)
+            for p in g.paths:
+                if p != keeper:
+                    rows.append(p); tips.append(f"Same content as {keeper} ({_size(g.size)})")
+        self.dupe_model.set_paths(rows)
+        for row, tip in enumerate(tips):
+            self.dupe_model.tips[row] = tip
+
+    def apply_duplicates(self):
+        if self.dupe_worker is not None or not self.dupe_groups:
+            QMessageBox.warning(self, "No duplicates", "Find duplicates first"); return
+        mode = {"Delete": "delete", "Hard link": "link", "Move to folder…": "move"}[self.dupe_mode.currentText()]
+        folder = None
+        if mode == "move":
+            folder = QFileDialog.getExistingDirectory(self, "Move duplicates to")
+            if not folder:
+                return
+        n = len(self.dupe_model)
+        if QMessageBox.question(self, "Duplicates", f"{self.dupe_mode.currentText().rstrip('…')} {n} duplicate files?") != QMessageBox.Yes:
+            return
+        try:
+            _, done = apply_dedupe(self.dupe_groups, mode, keep=self.keep_rule.currentText(), folder=folder, stamps=self.dupe_stamps)
+        except RenameConflictError as e:
+            lines = "\n".join(f"{kind}: {path} — {detail}" for kind, path, detail in e.conflicts[:20])
+            QMessageBox.warning(self, "Conflicts", f"Nothing was changed; scan again first:\n{lines}"); return
+        except OSError as e:
+            QMessageBox.critical(self, "Failed", f"{e}\nAll changes of this batch were rolled back."); return
+        if mode != "link":
+            gone = set(self.dupe_model.paths())
+            self.model.set_paths(PathStore(p for p in self.model.paths() if p not in gone))
+            self.count_label.setText(f"{len(self.model)} files")
+            self._files_changed()
+        self.dupe_groups = []; self.dupe_model.clear()
+        self.dupe_status.setText(f"{done} duplicates handled ({self.dupe_mode.currentText().rstrip('…').lower()}). "
+                                 "Undo Last Rename reverses this.")
+
+    def undo(self):
+        res = undo_last_rename()
+        if res is None:
+            QMessageBox.information(self, "Undo", "Nothing to undo."); return
+        _, steps, failed = res
+        self.model.clear(); self.preview_model.clear()
+        self._files_changed()
+        if failed:
+            QMessageBox.warning(self, "Undo", f"Undid the last batch; {len(failed)} of {steps} files could not be restored.")
+        else:
+            QMessageBox.information(self, "Undo", f"Undid the last batch ({steps} files). Re-add the files to continue.")
@@ -1,5 +1,76 @@
-import os, re
+import os, re, glob
+from array import array
 from datetime import datetime
+from config import RENAME_JOURNAL
+from rename_plan import plan_renames, execute_plan, execute_dedupe, undo_last, RenameConflictError
+
+META_TOKENS = ("exif_date", "width", "height", "camera")  # image_meta.ImageMeta fields, read from headers
+IMAGE_EXTS = (".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp")
+
+def iter_files(patterns, exts=None, recursive=False):
+    """
+    Lazily yield file paths from directories, glob patterns or plain paths.
+    - exts: lowercase extensions to keep (e.g. IMAGE_EXTS); None keeps everything
+    - recursive: descend into sub-directories of directory arguments ('**' in globs always works)
+    """
+    if isinstance(patterns, str):
+        patterns = [patterns]
+    keep = (lambda p: True) if not exts else (lambda p: os.path.splitext(p)[1].lower() in exts)
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            stack = [pattern]
+            while stack:
+                with os.scandir(stack.pop()) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            if recursive:
+                                stack.append(entry.path)
+                        elif keep(entry.name):
+                            yield entry.path
+        elif glob.has_magic(pattern):
+            for p in glob.iglob(pattern, recursive=True):
+                if os.path.isfile(p) and keep(p):
+                    yield p
+        elif os.path.isfile(pattern):
+            yield pattern  # an explicitly named file is never filtered out
+
+class PathStore:
+    """
+    Append-only sequence of paths packed into one bytearray plus an offsets array,
+    so 100k+ file lists cost two objects instead of one str (and list slot) per path.
+    Supports len(), indexing and iteration like a list of str.
+    """
+    def __init__(self, paths=()):
+        self._data = bytearray()
+        self._offsets = array("Q", [0])
+        self.extend(paths)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i):
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError("PathStore index out of range")
+        return os.fsdecode(bytes(self._data[self._offsets[i]:self._offsets[i + 1]]))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def append(self, path):
+        self._data += os.fsencode(path)
+        self._offsets.append(len(self._data))
+
+    def extend(self, paths):
+        for p in paths:
+            self.append(p)
+
+    def clear(self):
+        self._data = bytearray()
+        self._offsets = array("Q", [0])
 
 def format_with_tokens(stem, path, number=None, pad=2, date_source="now"):
     # {date} token
@@ -11,47 +82,217 @@ def format_with_tokens(stem, path, number=None, pad=2, date_source="now"):
         stem = stem.replace("{num}", str(number).zfill(pad))
     return stem
 
-def preview_new_name(path, prefix="", suffix="", number=None, pad=2,
-                     date_source="now", regex_find=None, regex_replace=None, case="none"):
-    folder, filename = os.path.split(path)
-    stem, ext = os.path.splitext(filename)
+class RenamePipeline:
+    """
+    Rename options compiled once and applied as stages over a whole file list:
+    regex (on the stem) -> affix (prefix/suffix) -> tokens ({date}/{num}, and image_meta's
+    {exif_date}/{width}/{height}/{camera}) -> case.
+    - the regex is compiled once per change; an invalid pattern or replacement leaves stems
+      untouched (regex_error holds the message)
+    - {date} uses one timestamp per run, or file mtimes from a single stat pass cached by path
+    - metadata tokens are read from image headers only when a stem uses them, on a thread pool
+      and through the FileCache (meta_cache=False: no persistent cache), opened for that pass
+      only; {exif_date} falls back to the file's modified date for images without one
+    - update() only invalidates the stage a field feeds and the stages after it, so
+      typing in the suffix box doesn't redo the regex on 100k stems
+    """
+    STAGES = ("regex", "affix", "tokens", "case")
+    FIELDS = {"regex_find": 0, "regex_replace": 0, "prefix": 1, "suffix": 1,
+              "date_source": 2, "start": 2, "pad": 2, "numbering": 2, "case": 3}
+    DEFAULTS = dict(prefix="", suffix="", start=1, pad=2, date_source="now",
+                    regex_find=None, regex_replace=None, case="none", numbering=False)
 
-    # regex find/replace on stem
-    if regex_find:
-        try:
-            stem = re.sub(regex_find, regex_replace or "", stem)
-        except re.error:
-            pass
+    def __init__(self, paths=(), meta_cache=True, **options):
+        self.options = dict(self.DEFAULTS)
+        self.regex = self.regex_error = None
+        self._mtimes, self._meta, self._dirty = {}, {}, 0
+        self.meta_cache = meta_cache
+        self.update(**options)
+        self.set_paths(paths)
 
-    # tokens
-    stem = format_with_tokens(stem, path, number=number, pad=pad, date_source=date_source)
+    def set_paths(self, paths):
+        self.paths = paths
+        self._parts = None        # (folder, stem, ext) per path
+        self._out = [None] * len(self.STAGES)
+        self._dirty = 0
 
-    # apply prefix/suffix
-    stem = f"{prefix}{stem}{suffix}"
+    def update(self, **changes):
+        """Change options; returns the index of the first stage that must be recomputed."""
+        for k, v in changes.items():
+            if k not in self.FIELDS:
+                raise TypeError(f"unknown rename option {k!r}")
+            if self.options.get(k) != v:
+                self.options[k] = v
+                self._dirty = min(self._dirty, self.FIELDS[k])
+        if "regex_find" in changes or "regex_replace" in changes:
+            self.regex = self.regex_error = None
+            if self.options["regex_find"]:
+                try:
+                    rx = re.compile(self.options["regex_find"])
+                    rx.sub(self.options["regex_replace"] or "", "")  # checks the replacement's group references
+                    self.regex = rx
+                except re.error as e:
+                    self.regex_error = str(e)
+        return self._dirty
 
-    # case transform
-    case = (case or "none").lower()
-    if case == "lower": stem = stem.lower()
-    elif case == "upper": stem = stem.upper()
-    elif case == "title": stem = stem.title()
+    def refresh_stats(self):
+        """Forget cached mtimes and metadata (files may have been touched since)."""
+        self._mtimes.clear(); self._meta.clear()
+        self._dirty = min(self._dirty, self.FIELDS["date_source"])
 
-    return os.path.join(folder, f"{stem}{ext}")
+    def _mtime_dates(self):
+        # one stat per path, cached across runs; only the paths split in this run (the list may grow)
+        paths = [self.paths[i] for i in range(len(self._parts))]
+        for p in paths:
+            if p not in self._mtimes:
+                try:
+                    self._mtimes[p] = datetime.fromtimestamp(os.stat(p).st_mtime).strftime("%Y%m%d")
+                except OSError:
+                    self._mtimes[p] = ""
+        return [self._mtimes[p] for p in paths]
+
+    def _metadata(self):
+        # ImageMeta per path split in this run; misses are read together (threads + FileCache)
+        from image_meta import MetadataReader
+        paths = [self.paths[i] for i in range(len(self._parts))]
+        todo = [p for p in dict.fromkeys(paths) if p not in self._meta]
+        if todo:
+            from filecache import FileCache
+            cache = FileCache() if self.meta_cache else None  # per pass: runs on preview worker threads
+            try:
+                self._meta.update(zip(todo, MetadataReader(cache).read(todo)))
+            finally:
+                if cache:
+                    cache.close()
+        return [self._meta[p] for p in paths]
+
+    def run(self):
+        """Return the new path for every input path, recomputing only dirty stages."""
+        o = self.options
+        if self._parts is None:
+            self._parts = []
+            for p in self.paths:
+                folder, filename = os.path.split(p)
+                stem, ext = os.path.splitext(filename)
+                self._parts.append((folder, stem, ext))
+            self._dirty = 0
+        stems = [stem for _, stem, _ in self._parts]
+        for i in range(self._dirty, len(self.STAGES)):
+            prev = self._out[i - 1] if i else stems
+            if i == 0:
+                rx, rep = self.regex, o["regex_replace"] or ""
+                try:
+                    out = [rx.sub(rep, s) for s in prev] if rx else prev
+                except re.error as e:  # e.g. a group that didn't take part in the match
+                    out, self.regex_error = prev, str(e)
+            elif i == 1:
+                pre, suf = o["prefix"], o["suffix"]
+                out = [f"{pre}{s}{suf}" for s in prev] if pre or suf else prev
+            elif i == 2:
+                out = self._tokens(prev)
+            else:
+                case = (o["case"] or "none").lower()
+                fn = {"lower": str.lower, "upper": str.upper, "title": str.title}.get(case)
+                out = [fn(s) for s in prev] if fn else prev
+            self._out[i] = out
+        self._dirty = len(self.STAGES)
+        return [os.path.join(folder, f"{s}{ext}") for (folder, _, ext), s in zip(self._parts, self._out[-1])]
+
+    def _tokens(self, stems):
+        o = self.options
+        has_date = any("{date}" in s for s in stems)
+        has_num = o["numbering"] and any("{num}" in s for s in stems)
+        meta_tokens = [t for t in META_TOKENS if any("{%s}" % t in s for s in stems)]
+        if not has_date and not has_num and not meta_tokens:
+            return stems
+        if has_date:
+            dates = (self._mtime_dates() if o["date_source"] != "now"
+                     else [datetime.now().strftime("%Y%m%d")] * len(stems))  # one snapshot per run
+        if meta_tokens:
+            metas = self._metadata()
+            mtimes = self._mtime_dates() if "exif_date" in meta_tokens else None
+        out = []
+        for i, s in enumerate(stems):
+            if has_date and "{date}" in s:
+                s = s.replace("{date}", dates[i])
+            if has_num and "{num}" in s:
+                s = s.replace("{num}", str(o["start"] + i).zfill(o["pad"]))
+            for t in meta_tokens:
+                if "{%s}" % t in s:
+                    v = getattr(metas[i], t)
+                    s = s.replace("{%s}" % t, str(v or (mtimes[i] if t == "exif_date" else "")))
+            out.append(s)
+        return out
+
+def preview_new_name(path, prefix="", suffix="", number=None, pad=2,
+                     date_source="now", regex_find=None, regex_replace=None, case="none"):
+    rules = RenamePipeline([path], prefix=prefix, suffix=suffix, start=number or 0, pad=pad,
+                           date_source=date_source, regex_find=regex_find, regex_replace=regex_replace,
+                           case=case, numbering=number is not None)
+    return rules.run()[0]
 
 def batch_preview(paths, prefix="", suffix="", start=1, pad=2, date_source="now",
                   regex_find=None, regex_replace=None, case="none", numbering=False):
-    previews = []
-    counter = start
-    for p in paths:
-        number = counter if numbering else None
-        previews.append(preview_new_name(
-            p, prefix=prefix, suffix=suffix, number=number, pad=pad,
-            date_source=date_source, regex_find=regex_find, regex_replace=regex_replace, case=case
-        ))
-        if numbering:
-            counter += 1
-    return previews
-
-def apply_renames(paths, previews):
-    for src, dst in zip(paths, previews):
-        if src != dst:
-            os.rename(src, dst)
+    return RenamePipeline(paths, prefix=prefix, suffix=suffix, start=start, pad=pad, date_source=date_source,
+                          regex_find=regex_find, regex_replace=regex_replace, case=case,
+                          numbering=numbering).run()
+
+def apply_renames(paths, previews, journal=RENAME_JOURNAL):
+    """
+    Rename paths[i] -> previews[i] as one transaction (see rename_plan).
+    Raises RenameConflictError before touching anything if the batch would clobber files;
+    on a failed rename the finished steps are rolled back. Returns the batch id.
+    """
+    plan = plan_renames(paths, previews)
+    if not plan.ok:
+        raise RenameConflictError(plan.conflicts)
+    if journal:
+        os.makedirs(os.path.dirname(journal), exist_ok=True)
+    return execute_plan(plan, journal)
+
+def find_duplicates(paths, cache=True, threads=8, on_progress=None):
+    """
+    Return (groups, stats, stamps) for files in paths with identical content (see
+    duplicates.DuplicateFinder; pass stamps on to apply_dedupe).
+    cache: True for the shared hash cache under the config folder, a FileCache, or False.
+    """
+    from duplicates import DuplicateFinder
+    from filecache import FileCache
+    fc = FileCache() if cache is True else (cache or None)
+    try:
+        finder = DuplicateFinder(fc, threads=threads)
+        return finder.run(paths, on_progress=on_progress), finder.stats, finder.stamps
+    finally:
+        if cache is True:
+            fc.close()
+
+DEDUPE_MODES = ("delete", "link", "move")
+
+def apply_dedupe(groups, mode, keep="oldest", folder=None, stamps=None, journal=RENAME_JOURNAL):
+    """
+    Act on every duplicate in groups, keeping one file per group (chosen by `keep`, see
+    duplicates.KEEP_RULES): "delete" it, replace it with a hard "link" to the kept file, or
+    "move" it into folder. Runs through the rename journal, so undo_last_rename() reverses it.
+    Raises RenameConflictError before touching anything if files changed since the scan
+    (stamps) or a move would clobber a file. Returns (batch id, files acted on).
+    """
+    from duplicates import plan_dedupe, move_targets
+    pairs = plan_dedupe(groups, keep, stamps)
+    if not pairs:
+        return None, 0
+    if journal:
+        os.makedirs(os.path.dirname(journal), exist_ok=True)
+    if mode == "move":
+        if not folder:
+            raise ValueError("moving duplicates needs a target folder")
+        os.makedirs(folder, exist_ok=True)
+        dups = [d for d, _ in pairs]
+        plan = plan_renames(dups, move_targets(pairs, folder))
+        if not plan.ok:
+            raise RenameConflictError(plan.conflicts)
+        return execute_plan(plan, journal), len(pairs)
+    return execute_dedupe(pairs, mode, journal), len(pairs)
+
+def undo_last_rename(journal=RENAME_JOURNAL):
+    """Reverse the most recent applied batch; returns (batch_id, steps, failed_pairs) or None."""
+    return undo_last(journal)
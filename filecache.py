@@ -0,0 +1,53 @@
+import os, sqlite3, threading
+from config import cache_dir
+
+class FileCache:
+    """
+    Persistent per-file values (hashes, metadata...) in one SQLite file, keyed by
+    (path, kind) and valid only while the file keeps the size and mtime it had when the
+    value was stored, so edited or replaced files are recomputed.
+    - paths are stored as bytes (os.fsencode), so undecodable file names work too
+    - kind separates independent values for the same file ("partial", "full", ...)
+    - put() buffers; writes go out in one transaction per flush_every values and on flush()
+    Safe to use from several threads (one connection behind a lock).
+    """
+    def __init__(self, path=None, flush_every=2000):
+        self.path = path or os.path.join(cache_dir("files"), "filecache.sqlite")
+        self.flush_every = flush_every
+        self._lock = threading.Lock()
+        self._pending = []
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS files (path BLOB, kind TEXT, size INTEGER, mtime_ns INTEGER, "
+                         "value BLOB, PRIMARY KEY (path, kind)) WITHOUT ROWID")
+
+    def get(self, path, st, kind):
+        """Stored value for path if st (an os.stat result) still matches, else None."""
+        with self._lock:
+            row = self._db.execute("SELECT size, mtime_ns, value FROM files WHERE path = ? AND kind = ?",
+                                   (os.fsencode(path), kind)).fetchone()
+        if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+            return row[2]
+        return None
+
+    def put(self, path, st, kind, value):
+        with self._lock:
+            self._pending.append((os.fsencode(path), kind, st.st_size, st.st_mtime_ns, value))
+            if len(self._pending) >= self.flush_every:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            with self._db:
+                self._db.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)", self._pending)
+            self._pending = []
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._db.close()
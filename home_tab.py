@@ -1,35 +1,48 @@
 import os, json
 from PyQt5.QtWidgets import (
     QWidget, QVBoxLayout, QLabel, QFormLayout, QLineEdit, QPushButton, 
-    QHBoxLayout, QFileDialog, QMessageBox, QComboBox, QCheckBox
+    QHBoxLayout, QFileDialog, QMessageBox, QComboBox, QCheckBox, QApplication
 )
+from PyQt5.QtCore import QThread, QTimer, pyqtSignal
+from config import SETTINGS_PATH, PRESETS_PATH, DEFAULT_SETTINGS, ensure_config
+from color import parse_color
 
-CONFIG_DIR = os.path.join(os.path.expanduser("~"), ".utilitytool")
-SETTINGS_PATH = os.path.join(CONFIG_DIR, "settings.json")
-PRESETS_PATH = os.path.join(CONFIG_DIR, "presets.json")
-
-DEFAULT_SETTINGS = {
-    "theme": "dark",
-    "default_output": "",
-    "default_format": "JPEG",
-    "default_quality": 85,
-    "preserve_exif": False,
-    "remember_last": True
-}
-
-def ensure_config():
-    os.makedirs(CONFIG_DIR, exist_ok=True)
-    if not os.path.exists(SETTINGS_PATH):
-        with open(SETTINGS_PATH, "w") as f: json.dump(DEFAULT_SETTINGS, f, indent=2)
-    if not os.path.exists(PRESETS_PATH):
-        with open(PRESETS_PATH, "w") as f: json.dump({"presets": {}}, f, indent=2)
+# Creates the config folder and reads settings/presets off the UI thread, so a slow
+# (network / synced) home folder doesn't hold up the first paint
+class ConfigLoader(QThread):
+    loaded = pyqtSignal(object, object, object)   # settings, presets, error message or None
+
+    def run(self):
+        try:
+            ensure_config()
+            with open(SETTINGS_PATH, "r") as f: settings = json.load(f)
+            with open(PRESETS_PATH, "r") as f: presets = json.load(f)
+            self.loaded.emit(settings, presets, None)
+        except Exception as e:
+            self.loaded.emit(None, None, str(e))
+
+# Runs a watcher.HotFolder until stop(); its stats() are read by a timer in the tab
+class WatchThread(QThread):
+    def __init__(self, service, parent=None):
+        super().__init__(parent)
+        self.service = service
+        self.error = None
+
+    def stop(self):
+        self.service.stop()
+
+    def run(self):
+        try:
+            self.service.run()
+        except Exception as e:
+            self.error = str(e)
 
 class HomeTab(QWidget):
     def __init__(self):
         super().__init__()
-        ensure_config()
-        self.settings = self._load_json(SETTINGS_PATH)
-        self.presets = self._load_json(PRESETS_PATH)
+        # defaults until ConfigLoader delivers the saved values; writes wait for it
+        self.settings = dict(DEFAULT_SETTINGS)
+        self.presets = {"presets": {}}
 
         root = QVBoxLayout()
         title = QLabel("🏠 Home — Global Settings & Presets")
@@ -46,6 +59,12 @@ class HomeTab(QWidget):
 
         self.default_quality = QLineEdit(str(self.settings.get("default_quality", 85)))
         self.preserve_exif = QCheckBox(); self.preserve_exif.setChecked(self.settings.get("preserve_exif", False))
+        self.color_profile = QComboBox(); self.color_profile.setEditable(True); self.color_profile.addItems(["sRGB", "keep"])
+        self.color_profile.setCurrentText(self.settings.get("color_profile", "sRGB"))
+        self.color_profile.setToolTip("sRGB: convert embedded ICC profiles to sRGB · keep: embed them unchanged · "
+                                      "or the path of an ICC profile to convert to")
+        self.background = QLineEdit(self.settings.get("background", "#ffffff"))
+        self.background.setToolTip("Colour transparent areas are flattened onto for JPEG output, e.g. #ffffff")
         self.remember_last = QCheckBox(); self.remember_last.setChecked(self.settings.get("remember_last", True))
 
         form.addRow("Theme:", self.theme)
@@ -53,6 +72,8 @@ class HomeTab(QWidget):
         form.addRow("Default Format:", self.default_format)
         form.addRow("Default Quality (1–100):", self.default_quality)
         form.addRow("Preserve EXIF:", self.preserve_exif)
+        form.addRow("Colour profile:", self.color_profile)
+        form.addRow("Transparency background:", self.background)
         form.addRow("Remember last settings:", self.remember_last)
         root.addLayout(form)
 
@@ -73,6 +94,20 @@ class HomeTab(QWidget):
         p_row.addWidget(self.preset_name); p_row.addWidget(save_btn); p_row.addWidget(load_btn); p_row.addWidget(export_btn); p_row.addWidget(import_btn)
         root.addLayout(p_row)
 
+        # Watch folder: images dropped into it are converted with a saved preset until stopped
+        root.addWidget(QLabel("Watch folder (new images are converted to the default output folder):"))
+        w_row = QHBoxLayout()
+        self.watch_dir = QLineEdit(); self.watch_dir.setPlaceholderText("Folder to watch (e.g. the intake share)")
+        watch_browse = QPushButton("Browse…"); watch_browse.clicked.connect(self._pick_watch_dir)
+        self.watch_preset = QComboBox(); self.watch_preset.setToolTip("Format and quality for the converted images")
+        self.watch_btn = QPushButton("Start Watching"); self.watch_btn.clicked.connect(self._toggle_watch)
+        w_row.addWidget(self.watch_dir); w_row.addWidget(watch_browse); w_row.addWidget(self.watch_preset); w_row.addWidget(self.watch_btn)
+        root.addLayout(w_row)
+        self.watch_status = QLabel(""); root.addWidget(self.watch_status)
+        self.watch_thread = None
+        self.watch_timer = QTimer(self); self.watch_timer.setInterval(1000); self.watch_timer.timeout.connect(self._watch_tick)
+        self._fill_watch_presets()
+
         actions = QHBoxLayout()
         save_settings = QPushButton("Save Settings"); save_settings.clicked.connect(self._save_settings)
         reset = QPushButton("Reset to Defaults"); reset.clicked.connect(self._reset_defaults)
@@ -81,11 +116,32 @@ class HomeTab(QWidget):
 
         self.setLayout(root)
 
-    # Helpers
-    def _load_json(self, path):
-        with open(path, "r") as f:
-            return json.load(f)
+        self._writers = [save_btn, export_btn, import_btn, save_settings, reset]
+        for b in self._writers: b.setEnabled(False)
+        self.loader = ConfigLoader(self)
+        self.loader.loaded.connect(self._on_config)
+        self.loader.start()
+
+    def _on_config(self, settings, presets, error):
+        if error:
+            QMessageBox.warning(self, "Settings", f"Could not read settings, using defaults:\n{error}")
+        else:
+            self.settings, self.presets = settings, presets
+            self._fill(settings)
+            self._fill_watch_presets()
+        for b in self._writers: b.setEnabled(True)
+
+    def _fill(self, s):
+        self.theme.setCurrentText(s.get("theme", "dark"))
+        self.default_output.setText(s.get("default_output", ""))
+        self.default_format.setCurrentText(s.get("default_format", "JPEG"))
+        self.default_quality.setText(str(s.get("default_quality", 85)))
+        self.preserve_exif.setChecked(s.get("preserve_exif", False))
+        self.color_profile.setCurrentText(s.get("color_profile", "sRGB"))
+        self.background.setText(s.get("background", "#ffffff"))
+        self.remember_last.setChecked(s.get("remember_last", True))
 
+    # Helpers
     def _write_json(self, path, data):
         with open(path, "w") as f:
             json.dump(data, f, indent=2)
@@ -103,6 +159,8 @@ class HomeTab(QWidget):
                 "default_format": self.default_format.currentText(),
                 "default_quality": int(self.default_quality.text() or "85"),
                 "preserve_exif": self.preserve_exif.isChecked(),
+                "color_profile": self.color_profile.currentText().strip() or "sRGB",
+                "background": "#%02x%02x%02x" % parse_color(self.background.text()),
                 "remember_last": self.remember_last.isChecked()
             }
             self._write_json(SETTINGS_PATH, data)
@@ -124,6 +182,7 @@ class HomeTab(QWidget):
             "default_quality": int(self.default_quality.text() or "85")
         }
         self._write_json(PRESETS_PATH, self.presets)
+        self._fill_watch_presets()
         QMessageBox.information(self, "Preset", f"Preset '{name}' saved.")
 
     def _load_preset(self):
@@ -148,4 +207,74 @@ class HomeTab(QWidget):
             with open(src, "r") as f:
                 self.presets = json.load(f)
             self._write_json(PRESETS_PATH, self.presets)
+            self._fill_watch_presets()
             QMessageBox.information(self, "Imported", "Presets imported.")
+
+    # Watch folder
+    def _fill_watch_presets(self):
+        current = self.watch_preset.currentText()
+        self.watch_preset.clear()
+        self.watch_preset.addItem("Default format/quality")
+        self.watch_preset.addItems(sorted(self.presets.get("presets", {})))
+        self.watch_preset.setCurrentText(current)
+
+    def _pick_watch_dir(self):
+        path = QFileDialog.getExistingDirectory(self, "Choose a folder to watch")
+        if path:
+            self.watch_dir.setText(path)
+
+    def _toggle_watch(self):
+        if self.watch_thread:
+            self.watch_btn.setEnabled(False); self.watch_btn.setText("Stopping…")
+            self.watch_thread.stop()
+            return
+        folder = self.watch_dir.text().strip()
+        if not os.path.isdir(folder):
+            QMessageBox.warning(self, "Watch folder", "Choose an existing folder to watch."); return
+        from watcher import HotFolder  # only loaded once a folder is watched
+        preset = self.presets.get("presets", {}).get(self.watch_preset.currentText(), {})
+        fmt = preset.get("default_format", self.default_format.currentText())
+        quality = int(preset.get("default_quality", self.default_quality.text() or 85))
+        outdir = self.default_output.text().strip() or os.path.join(folder, "converted")
+        try:
+            background = parse_color(self.background.text())
+        except ValueError as e:
+            QMessageBox.warning(self, "Watch folder", str(e)); return
+        try:
+            service = HotFolder(folder, outdir, fmt=fmt, recursive=True, quality=quality, start_method="spawn",
+                                preserve_exif=self.preserve_exif.isChecked(),
+                                profile=self.color_profile.currentText().strip() or "sRGB", background=background)
+        except ValueError as e:
+            QMessageBox.warning(self, "Watch folder", str(e)); return
+        self.watch_thread = WatchThread(service, self)
+        self.watch_thread.finished.connect(self._watch_stopped)
+        QApplication.instance().aboutToQuit.connect(self._stop_watch_on_quit)
+        self.watch_thread.start()
+        self.watch_btn.setText("Stop Watching"); self.watch_dir.setEnabled(False); self.watch_preset.setEnabled(False)
+        self.watch_status.setText(f"Watching {folder} → {outdir} ({fmt} {quality})")
+        self.watch_timer.start()
+
+    def _watch_tick(self):
+        s = self.watch_thread.service.stats() if self.watch_thread else None
+        if not s:
+            return
+        latency = f" · latency p50 {s['latency_p50']:.1f}s, p95 {s['latency_p95']:.1f}s" if s["latency_p50"] is not None else ""
+        self.watch_status.setText(f"Watching ({s['mode']}): {s['converted']} converted, {s['skipped']} up-to-date, "
+                                  f"{s['failed']} failed · {s['settling']} settling, {s['queued']} queued, "
+                                  f"{s['in_flight']} converting{latency}")
+
+    def _watch_stopped(self):
+        self._watch_tick()
+        self.watch_timer.stop()
+        if self.watch_thread.error:
+            QMessageBox.warning(self, "Watch folder", f"Watching stopped:\n{self.watch_thread.error}")
+        self.watch_thread = None
+        QApplication.instance().aboutToQuit.disconnect(self._stop_watch_on_quit)
+        self.watch_btn.setEnabled(True); self.watch_btn.setText("Start Watching")
+        self.watch_dir.setEnabled(True); self.watch_preset.setEnabled(True)
+        self.watch_status.setText(self.watch_status.text().replace("Watching", "Stopped", 1))
+
+    def _stop_watch_on_quit(self):
+        if self.watch_thread:
+            self.watch_thread.stop()
+            self.watch_thread.wait()
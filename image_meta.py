@@ -0,0 +1,159 @@
+"""
+Image metadata for rename tokens, read from file headers only (no pixels are decoded).
+
+- JPEG (most photo dumps): the markers up to the frame header are walked directly and the
+  few EXIF tags needed are read from the TIFF structure, typically from one 64 KB read.
+  That is several times cheaper than Pillow's open(), which matters because header parsing
+  is pure Python and holds the GIL, so threads only hide I/O waits
+- other formats, and JPEGs the fast path can't make sense of, go through Pillow's open(),
+  which also parses just the header
+- MetadataReader reads many files on a thread pool and keeps the results in a FileCache
+  keyed by (path, size, mtime), so a second preview of the same folder costs only cache
+  lookups
+"""
+import os, re, json, struct
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from PIL import Image
+from passthrough import header_exif
+
+CACHE_KIND = "meta-v1"
+# EXIF tags: ExifIFD pointer, DateTimeOriginal, DateTimeDigitized, DateTime, Make, Model, Orientation
+_EXIF_IFD, _DATE_ORIGINAL, _DATE_DIGITIZED, _DATE, _MAKE, _MODEL, _ORIENTATION = \
+    0x8769, 0x9003, 0x9004, 0x0132, 0x010F, 0x0110, 0x0112
+_UNSAFE = re.compile(r'[\\/:*?"<>|\x00-\x1f]+')
+
+# exif_date: "YYYYMMDD" or "" (no EXIF date); width/height as displayed (EXIF rotation
+# applied), 0 if unreadable; camera: make + model made safe for file names, or ""
+ImageMeta = namedtuple("ImageMeta", "exif_date width height camera")
+UNREADABLE = ImageMeta("", 0, 0, "")
+
+def _exif_date(text):
+    try:
+        return datetime.strptime(str(text).strip()[:19], "%Y:%m:%d %H:%M:%S").strftime("%Y%m%d")
+    except ValueError:
+        return ""
+
+def _camera(make, model):
+    make, model = (str(make or "").strip("\x00 "), str(model or "").strip("\x00 "))
+    if make and model.lower().startswith(make.split()[0].lower()):
+        make = ""  # "Canon" + "Canon EOS R5"
+    return _UNSAFE.sub("-", " ".join(p for p in (make, model) if p)).strip(" .-")
+
+_SOF = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+def _ifd(t, offset, bo):
+    # {tag: value} of the TIFF IFD at offset: ASCII strings, SHORT and LONG scalars only
+    out = {}
+    n = struct.unpack_from(bo + "H", t, offset)[0]
+    for k in range(n):
+        tag, typ, count, raw = struct.unpack_from(bo + "HHI4s", t, offset + 2 + 12 * k)
+        if typ == 2:  # ASCII
+            start = struct.unpack(bo + "I", raw)[0] if count > 4 else None
+            data = t[start:start + count] if start is not None else raw[:count]
+            out[tag] = data.split(b"\x00", 1)[0].decode("latin-1")
+        elif typ == 3:
+            out[tag] = struct.unpack(bo + "H", raw[:2])[0]
+        elif typ == 4:
+            out[tag] = struct.unpack(bo + "I", raw)[0]
+    return out
+
+def _jpeg_meta(f):
+    # ImageMeta from a JPEG's markers and EXIF block, or None to let Pillow try
+    buf = f.read(65536)
+    if buf[:2] != b"\xff\xd8":
+        return None
+    pos, exif = 2, None
+    while True:
+        if pos + 9 > len(buf):
+            more = f.read(65536)
+            if not more:
+                return None
+            buf += more
+            continue
+        if buf[pos] != 0xFF:
+            return None
+        marker = buf[pos + 1]
+        if marker == 0xFF:  # fill byte
+            pos += 1; continue
+        length = struct.unpack_from(">H", buf, pos + 2)[0]
+        if marker in _SOF:
+            h, w = struct.unpack_from(">HH", buf, pos + 5)
+            break
+        if marker == 0xDA:
+            return None
+        if marker == 0xE1 and exif is None:
+            while pos + 2 + length > len(buf):
+                more = f.read(65536)
+                if not more:
+                    return None
+                buf += more
+            if buf[pos + 4:pos + 10] == b"Exif\x00\x00":
+                exif = buf[pos + 10:pos + 2 + length]
+        pos += 2 + length
+    date = camera = ""
+    if exif:
+        bo = "<" if exif[:2] == b"II" else ">"
+        ifd0 = _ifd(exif, struct.unpack_from(bo + "I", exif, 4)[0], bo)
+        sub = _ifd(exif, ifd0[_EXIF_IFD], bo) if _EXIF_IFD in ifd0 else {}
+        date = _exif_date(sub.get(_DATE_ORIGINAL) or sub.get(_DATE_DIGITIZED) or ifd0.get(_DATE) or "")
+        camera = _camera(ifd0.get(_MAKE), ifd0.get(_MODEL))
+        if ifd0.get(_ORIENTATION) in (5, 6, 7, 8):
+            w, h = h, w
+    return ImageMeta(date, w, h, camera)
+
+def read_meta(path):
+    """ImageMeta for path from its header; UNREADABLE if it isn't an image Pillow can open."""
+    try:
+        with open(path, "rb") as f:
+            meta = _jpeg_meta(f)
+        if meta:
+            return meta
+    except (OSError, struct.error, ValueError, KeyError):
+        pass
+    try:
+        with Image.open(path) as img:
+            w, h = img.size
+            exif = header_exif(img)  # not getexif(): on a PNG that decodes the pixels
+            if exif is None:
+                return ImageMeta("", w, h, "")
+            sub = exif.get_ifd(_EXIF_IFD)
+            date = _exif_date(sub.get(_DATE_ORIGINAL) or sub.get(_DATE_DIGITIZED) or exif.get(_DATE) or "")
+            if exif.get(_ORIENTATION) in (5, 6, 7, 8):  # stored sideways
+                w, h = h, w
+            return ImageMeta(date, w, h, _camera(exif.get(_MAKE), exif.get(_MODEL)))
+    except Exception:
+        return UNREADABLE
+
+class MetadataReader:
+    """
+    read(paths) -> [ImageMeta, ...] in input order, using `threads` threads for the files
+    the FileCache (optional) doesn't already hold. stats describes the last read.
+    """
+    def __init__(self, cache=None, threads=8):
+        self.cache, self.threads = cache, threads
+        self.stats = {}
+
+    def read(self, paths):
+        out, todo = [UNREADABLE] * len(paths), []
+        for i, path in enumerate(paths):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            v = self.cache.get(path, st, CACHE_KIND) if self.cache else None
+            if v is not None:
+                out[i] = ImageMeta(*json.loads(v))
+            else:
+                todo.append((i, path, st))
+        self.stats = {"files": len(paths), "cached": len(paths) - len(todo), "read": len(todo)}
+        if todo:
+            with ThreadPoolExecutor(self.threads) as ex:
+                for (i, path, st), meta in zip(todo, ex.map(read_meta, [p for _, p, _ in todo])):
+                    out[i] = meta
+                    if self.cache:
+                        self.cache.put(path, st, CACHE_KIND, json.dumps(meta))
+            if self.cache:
+                self.cache.flush()
+        return out
@@ -1,19 +1,36 @@
-import os, time
+import os, threading
+from collections import OrderedDict
 from PyQt5.QtWidgets import (
-    QWidget, QVBoxLayout, QLabel, QPushButton, QFileDialog, QListWidget, QProgressBar,
-    QComboBox, QHBoxLayout, QSlider, QCheckBox, QMessageBox
+    QWidget, QVBoxLayout, QLabel, QPushButton, QFileDialog, QListView, QProgressBar,
+    QComboBox, QHBoxLayout, QSlider, QCheckBox, QMessageBox, QSpinBox
 )
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
-from image_utils import convert_resize_compress, estimate_compressed_size, STANDARD_SIZES, target_dims_from_preset
+from PyQt5.QtCore import Qt, QThread, QTimer, QObject, QSize, QPoint, pyqtSignal
+from PyQt5.QtGui import QImage, QPixmap, QIcon
+from image_utils import estimate_compressed_size, STANDARD_SIZES, DOWNSCALE_MODES, BUDGET_FORMATS, target_dims_from_preset, Target
+from batch_engine import BatchEngine, default_workers
+from estimator import shared_estimator
+from thumbnails import ThumbnailCache, THUMB_PX
+from batch_stats import BatchStats, ThroughputETA
+from config import CACHE_DIR, load_settings, BATCH_REPORT
+from file_model import FileListModel, ScanWorker
+from file_utils import IMAGE_EXTS
+from color import parse_color
+from archive import is_archive
 
-# Worker thread so the UI stays responsive
+# Worker thread so the UI stays responsive; the actual work runs on a process pool
 class Worker(QThread):
     progress = pyqtSignal(int, str)      # overall %, filename
     perfile = pyqtSignal(int, str)       # per-file %, filename
     started_file = pyqtSignal(str)
+    failed = pyqtSignal(str, str)        # filename, error message
+    timing = pyqtSignal(str, object)     # filename, {stage: seconds} as measured in the pool process
+    eta = pyqtSignal(object)             # seconds left (None until measurable)
+    report_ready = pyqtSignal(object)    # BatchStats.report() at the end of the batch
     finished = pyqtSignal()
 
-    def __init__(self, files, fmt, size_tuple, keep_aspect, quality, outdir=None):
+    def __init__(self, files, fmt, size_tuple, keep_aspect, quality, outdir=None, workers=None, fast_downscale=None,
+                 max_bytes=None, incremental=False, max_memory=None, targets=None, pipeline=False,
+                 preserve_exif=False, passthrough=True, profile="sRGB", background=(255, 255, 255), archive=None):
         super().__init__()
         self.files = files
         self.fmt = fmt
@@ -21,55 +38,230 @@ class Worker(QThread):
         self.keep_aspect = keep_aspect
         self.quality = quality
         self.outdir = outdir
+        self.fast_downscale = fast_downscale
+        self.max_bytes = max_bytes
+        self.incremental = incremental
+        self.max_memory = max_memory
+        self.targets = targets  # [Target, ...]: every output from one decode per image
+        self.preserve_exif = preserve_exif
+        self.passthrough = passthrough  # copy images that already match the output instead of re-encoding
+        self.profile, self.background = profile, background  # see color.py
+        self.archive = archive  # write every output into this ZIP / TAR instead of a folder
+        self.skipped = 0
+        # pipeline: prefetch sources, write outputs behind; spawn: never fork the Qt process
+        self.engine = BatchEngine(workers, pipeline=pipeline, start_method="spawn")
+        self.errors = []
+        self.probes = 0          # encodes spent searching for max_bytes
+        self.over_budget = []    # files that could not be brought under max_bytes
+        self.stats = BatchStats()
+        self.report, self.report_path = None, None
+
+    def cancel(self):
+        self.engine.cancel()
 
     def run(self):
         total = len(self.files)
-        for i, path in enumerate(self.files):
-            self.started_file.emit(path)
-            # Simple staged per-file progress simulation
-            for step in (10, 30, 60, 90):
-                self.perfile.emit(step, path)
-                time.sleep(0.06)
-            # Process conversion/resizing/compression
-            out_path = None
-            if self.outdir:
-                base = os.path.splitext(os.path.basename(path))[0]
-                out_path = os.path.join(self.outdir, f"{base}_out.{self.fmt.lower()}")
-            convert_resize_compress(
-                path, out_fmt=self.fmt, out_path=out_path,
-                size=self.size, keep_aspect=self.keep_aspect, quality=self.quality
-            )
-            self.perfile.emit(100, path)
-            pct = int(((i + 1) / total) * 100)
-            self.progress.emit(pct, path)
+        files = (self.files[i] for i in range(total))  # the store may still grow while a folder scan runs
+        eta = ThroughputETA(total)
+        results = self.engine.run(
+            files, fmt=self.fmt, size=self.size,
+            keep_aspect=self.keep_aspect, quality=self.quality, outdir=self.outdir,
+            fast_downscale=self.fast_downscale, max_bytes=self.max_bytes, incremental=self.incremental,
+            max_memory=self.max_memory, ordered=False, on_header=eta.set_cost, targets=self.targets,
+            preserve_exif=self.preserve_exif, passthrough=self.passthrough, profile=self.profile,
+            background=self.background, archive=self.archive
+        )
+        # Results arrive as they finish (largest files are scheduled first), so progress counts them
+        for n, r in enumerate(results, 1):
+            self.started_file.emit(r.path)
+            if r.error:
+                self.errors.append((r.path, r.error))
+                self.failed.emit(r.path, r.error)
+            if (r.info or {}).get("skipped"):
+                self.skipped += 1
+            budget = (r.info or {}).get("budget")
+            if budget:
+                self.probes += budget["probes"]
+                if not budget["fits"]:
+                    self.over_budget.append(r.path)
+            self.stats.add(r)
+            stages = (r.info or {}).get("stages")
+            if stages:
+                self.timing.emit(r.path, stages)
+            eta.finish(r.index, (r.info or {}).get("pixels", 0))
+            self.perfile.emit(100, r.path)
+            pct = int((n / total) * 100)
+            self.progress.emit(pct, r.path)
+            self.eta.emit(eta.eta())
+        self.stats.schedule, self.stats.pipeline = self.engine.schedule, self.engine.pipeline
+        self.report = report = self.stats.report()
+        try:
+            self.report_path = self.stats.write(BATCH_REPORT, cancelled=self.engine.cancelled)
+        except OSError:
+            pass
+        self.report_ready.emit(report)
         self.finished.emit()
 
+# Perceptual-hash grouping of the listed images (hashes cached across runs in the FileCache)
+class SimilarWorker(QThread):
+    progress = pyqtSignal(int, int)       # images hashed, total
+    ready = pyqtSignal(object, object)    # [SimilarGroup], stats ({"error": message} on failure)
+
+    def __init__(self, paths, max_distance, parent=None):
+        super().__init__(parent)
+        from similar import SimilarFinder  # NumPy is only needed once this is used
+        self.paths = paths
+        self.max_distance = max_distance
+        self.finder = SimilarFinder()
+
+    def cancel(self):
+        self.finder.cancel()
+
+    def run(self):
+        from filecache import FileCache
+        try:
+            self.finder.cache = cache = FileCache()
+            try:
+                groups = self.finder.run(self.paths, self.max_distance, on_progress=self.progress.emit)
+            finally:
+                cache.close()
+        except Exception as e:  # whatever it is, ready must fire or the tab stays "searching"
+            self.ready.emit([], {"error": f"{type(e).__name__}: {e}"}); return
+        self.ready.emit(groups, self.finder.stats)
+
+class SheetWorker(QThread):
+    progress = pyqtSignal(str, int, int)  # sheet saved, images done, total
+    ready = pyqtSignal(object)            # [SheetTile], or the error message
+
+    def __init__(self, paths, out_path, parent=None):
+        super().__init__(parent)
+        self.paths, self.out_path = paths, out_path
+
+    def run(self):
+        from image_utils import contact_sheets
+        try:
+            self.ready.emit(contact_sheets(self.paths, self.out_path, on_sheet=self.progress.emit))
+        except Exception as e:  # whatever it is, ready must fire or the button stays disabled
+            self.ready.emit(f"{type(e).__name__}: {e}")
+
+# Background estimator for the whole list; restarted whenever quality/format changes
+class EstimateWorker(QThread):
+    estimated = pyqtSignal(int, object)       # row, estimated bytes (None if unreadable)
+    totals = pyqtSignal(object, object, int)  # estimated bytes, original bytes, files counted
+
+    def __init__(self, files, fmt, quality, parent=None):
+        super().__init__(parent)  # parented so a superseded run can finish after we drop our reference
+        self.files = files
+        self.fmt = fmt
+        self.quality = quality
+        self._stop = False
+
+    def stop(self):
+        self._stop = True
+
+    def run(self):
+        est_total, orig_total, n = 0, 0, 0
+        for row, (path, est, ratio) in enumerate(shared_estimator().estimate_many(self.files, fmt=self.fmt, quality=self.quality)):
+            if self._stop:
+                return
+            self.estimated.emit(row, est)
+            if est is not None:
+                est_total += est; orig_total += round(est / ratio) if ratio else 0; n += 1
+        self.totals.emit(est_total, orig_total, n)
+
+# Thumbnails are produced on plain threads (Pillow releases the GIL while decoding);
+# results reach the UI thread through the queued `ready` signal.
+class ThumbnailLoader(QObject):
+    ready = pyqtSignal(int, str, QImage)   # row, path, thumbnail
+
+    def __init__(self, cache, threads=2, parent=None):
+        super().__init__(parent)
+        self.cache = cache
+        self._queue = OrderedDict()   # pending (row, path), front is served first
+        self._cond = threading.Condition()
+        self._generation = 0          # bumped by clear() so stale results are dropped
+        for _ in range(threads):
+            threading.Thread(target=self._loop, daemon=True).start()
+
+    def request_front(self, items):
+        # newly visible rows jump the queue, in on-screen order
+        with self._cond:
+            for key in reversed(items):
+                self._queue[key] = None
+                self._queue.move_to_end(key, last=False)
+            self._cond.notify_all()
+
+    def clear(self):
+        with self._cond:
+            self._queue.clear()
+            self._generation += 1
+
+    def _loop(self):
+        try:
+            self.cache.prepare()  # folder creation and size scan happen here, not on the UI thread
+        except OSError:
+            pass  # get() fails the same way and the rows keep their placeholder
+        while True:
+            with self._cond:
+                while not self._queue:
+                    self._cond.wait()
+                (row, path), _ = self._queue.popitem(last=False)
+                gen = self._generation
+            try:
+                img = QImage.fromData(self.cache.get(path), "JPG")
+            except Exception:
+                continue  # unreadable images simply keep the placeholder
+            if gen == self._generation:
+                self.ready.emit(row, path, img)
+
 class ImageToolsTab(QWidget):
     def __init__(self):
         super().__init__()
         self.output_dir = None
-        self.t0 = None
+        self.est_worker = None
+        # Debounce live estimates so dragging the slider doesn't queue a run per tick
+        self.est_timer = QTimer(self); self.est_timer.setSingleShot(True); self.est_timer.setInterval(200)
+        self.est_timer.timeout.connect(self.estimate_all)
 
         root = QVBoxLayout()
         head = QLabel("🖼 Image Tools — Convert • Resize • Compress")
         head.setStyleSheet("font-size:16px; font-weight:bold;")
         root.addWidget(head)
 
-        # File list (drag & drop supported by Qt at OS level when picking files — simplest path: use Add Images button)
-        self.listw = QListWidget()
-        self.listw.setSelectionMode(self.listw.ExtendedSelection)
+        # File list: a model over a compact path store, so 100k+ files only cost what is on screen
+        self.model = FileListModel(self)
+        blank = QPixmap(THUMB_PX, THUMB_PX); blank.fill(Qt.darkGray)
+        self.model.placeholder = QIcon(blank)
+        self.listw = QListView()
+        self.listw.setModel(self.model)
+        self.listw.setSelectionMode(QListView.ExtendedSelection)
+        self.listw.setIconSize(QSize(THUMB_PX, THUMB_PX))
+        self.listw.setUniformItemSizes(True)
+        self.listw.setLayoutMode(QListView.Batched)
         root.addWidget(self.listw)
+        self.scan = None
+
+        # Thumbnails: generated in the background for visible rows only, cached on disk
+        self.thumbs = ThumbnailLoader(ThumbnailCache(os.path.join(CACHE_DIR, "thumbs")), parent=self)
+        self.thumbs.ready.connect(self.on_thumbnail)
+        self.visible_timer = QTimer(self); self.visible_timer.setSingleShot(True); self.visible_timer.setInterval(50)
+        self.visible_timer.timeout.connect(self.prioritize_visible)
+        self.listw.verticalScrollBar().valueChanged.connect(self.visible_timer.start)
 
         row = QHBoxLayout()
         add_btn = QPushButton("Add Images"); add_btn.clicked.connect(self.add_files)
-        clear_btn = QPushButton("Clear"); clear_btn.clicked.connect(self.listw.clear)
-        row.addWidget(add_btn); row.addWidget(clear_btn)
+        add_dir = QPushButton("Add Folder…"); add_dir.clicked.connect(self.add_folder)
+        clear_btn = QPushButton("Clear"); clear_btn.clicked.connect(self.clear_files)
+        self.grid = QCheckBox("Thumbnail grid"); self.grid.toggled.connect(self.toggle_grid)
+        self.count_label = QLabel("0 files")
+        row.addWidget(add_btn); row.addWidget(add_dir); row.addWidget(clear_btn); row.addWidget(self.grid); row.addWidget(self.count_label)
         root.addLayout(row)
 
         # Format + size preset
         row2 = QHBoxLayout()
         row2.addWidget(QLabel("Format:"))
         self.fmt = QComboBox(); self.fmt.addItems(["JPEG", "PNG", "WEBP", "TIFF", "BMP"])
+        self.fmt.currentTextChanged.connect(self.est_timer.start)
         row2.addWidget(self.fmt)
 
         row2.addWidget(QLabel("Size Preset:"))
@@ -80,27 +272,94 @@ class ImageToolsTab(QWidget):
 
         self.keep_aspect = QCheckBox("Keep Aspect"); self.keep_aspect.setChecked(True)
         row2.addWidget(self.keep_aspect)
+
+        row2.addWidget(QLabel("Downscale:"))
+        self.downscale = QComboBox(); self.downscale.addItems(list(DOWNSCALE_MODES))
+        self.downscale.setToolTip("Fast/Fastest shrink large photos while decoding — much quicker for small output sizes")
+        row2.addWidget(self.downscale)
         root.addLayout(row2)
 
         # Compression
         comp_row = QHBoxLayout()
         comp_row.addWidget(QLabel("Quality:"))
         self.quality = QSlider(Qt.Horizontal); self.quality.setRange(1, 100); self.quality.setValue(85)
+        self.quality.valueChanged.connect(self.est_timer.start)
         comp_row.addWidget(self.quality)
 
+        comp_row.addWidget(QLabel("Max size:"))
+        self.max_kb = QSpinBox(); self.max_kb.setRange(0, 1000000); self.max_kb.setSuffix(" KB"); self.max_kb.setSpecialValueText("Off")
+        self.max_kb.setToolTip("JPEG/WEBP: lower the quality (never above the slider) until each file fits")
+        comp_row.addWidget(self.max_kb)
+
         self.est_label = QLabel("Estimated size: —")
         comp_row.addWidget(self.est_label)
         root.addLayout(comp_row)
 
+        # Multi-output: each source is decoded once and written once per listed output
+        out_list_row = QHBoxLayout()
+        out_list_row.addWidget(QLabel("Outputs:"))
+        self.targets = []
+        self.outputs = QComboBox(); self.outputs.addItem("One output (settings above)")
+        self.outputs.setToolTip("Add Output stores the current format, size preset and quality as an extra output. "
+                                "With outputs listed, every image is decoded once and all of them are written.")
+        out_list_row.addWidget(self.outputs, 1)
+        add_out = QPushButton("Add Output"); add_out.clicked.connect(self.add_target)
+        clear_out = QPushButton("Clear Outputs"); clear_out.clicked.connect(self.clear_targets)
+        out_list_row.addWidget(add_out); out_list_row.addWidget(clear_out)
+        root.addLayout(out_list_row)
+
+        # Near-duplicates: perceptual hashes group resized / recompressed copies of the same picture
+        sim_row = QHBoxLayout()
+        self.similar_worker, self.similar_groups = None, []
+        self.similar_btn = QPushButton("Find Similar"); self.similar_btn.clicked.connect(self.find_similar)
+        self.similar_btn.setToolTip("Group visually identical images (resized, recompressed or converted copies)")
+        self.similar_dist = QSpinBox(); self.similar_dist.setRange(0, 14)  # similar.MAX_INDEXED_K - 1
+        self.similar_dist.setValue(6)
+        self.similar_dist.setToolTip("Maximum pHash difference in bits (of 64): 0–4 near-exact copies, 8+ looser matches")
+        self.similar_list = QComboBox(); self.similar_list.currentIndexChanged.connect(self.select_similar)
+        self.similar_status = QLabel("")
+        sim_row.addWidget(self.similar_btn); sim_row.addWidget(QLabel("Max distance:")); sim_row.addWidget(self.similar_dist)
+        sim_row.addWidget(self.similar_list, 1); sim_row.addWidget(self.similar_status)
+        root.addLayout(sim_row)
+
         est_btn = QPushButton("Estimate Selected")
-        est_btn.setToolTip("Estimates compressed size for the first selected file (or top file if none selected).")
+        est_btn.setToolTip("Exact compressed size for the first selected file (or top file if none selected). "
+                           "The total above is a live sampled estimate for the whole list.")
         est_btn.clicked.connect(self.estimate_selected)
-        root.addWidget(est_btn)
+        self.sheet_worker = None
+        self.sheet_btn = QPushButton("Contact Sheet…"); self.sheet_btn.clicked.connect(self.make_contact_sheet)
+        self.sheet_btn.setToolTip("Save the list as 6×5 grids of named thumbnails (several pages become NAME_001, NAME_002…)")
+        self.sheet_status = QLabel("")
+        est_row = QHBoxLayout()
+        est_row.addWidget(est_btn, 1); est_row.addWidget(self.sheet_btn); est_row.addWidget(self.sheet_status)
+        root.addLayout(est_row)
 
         # Output folder
         out_row = QHBoxLayout()
         pick_out = QPushButton("Choose Output Folder…"); pick_out.clicked.connect(self.choose_output)
         out_row.addWidget(pick_out)
+        out_row.addWidget(QLabel("Workers:"))
+        self.workers = QSpinBox(); self.workers.setRange(1, max(1, os.cpu_count() or 1)); self.workers.setValue(default_workers())
+        self.workers.setToolTip("Number of processes converting images in parallel")
+        out_row.addWidget(self.workers)
+        out_row.addWidget(QLabel("Memory/worker:"))
+        self.max_memory = QSpinBox(); self.max_memory.setRange(0, 65536); self.max_memory.setSingleStep(256)
+        self.max_memory.setSuffix(" MB"); self.max_memory.setSpecialValueText("No limit")
+        self.max_memory.setToolTip("Decode larger images (big TIFF/PNG scans) in strips so each worker holds at most this much image data")
+        out_row.addWidget(self.max_memory)
+        self.incremental = QCheckBox("Skip up-to-date")
+        self.incremental.setToolTip("Skip images already converted with the same settings (also resumes an interrupted batch);\n"
+                                    "keeps a small manifest file in each output folder")
+        out_row.addWidget(self.incremental)
+        self.overlap_io = QCheckBox("Overlap I/O")
+        self.overlap_io.setToolTip("Read ahead and write behind while images convert (faster on network shares and USB disks)")
+        out_row.addWidget(self.overlap_io)
+        self.passthrough = QCheckBox("Copy if unchanged"); self.passthrough.setChecked(True)
+        self.passthrough.setToolTip("Copy images that already have the output format, size and quality instead of re-encoding them")
+        out_row.addWidget(self.passthrough)
+        self.to_archive = QCheckBox("Save as ZIP")
+        self.to_archive.setToolTip("Write the outputs straight into one ZIP (or TAR) file instead of a folder; asks for the file on Start")
+        out_row.addWidget(self.to_archive)
         root.addLayout(out_row)
 
         # Progress
@@ -109,27 +368,129 @@ class ImageToolsTab(QWidget):
         self.eta_label = QLabel("ETA: —")
         root.addWidget(self.perfile_bar); root.addWidget(self.global_bar); root.addWidget(self.eta_label)
 
-        start = QPushButton("Start"); start.clicked.connect(self.start_process)
-        root.addWidget(start)
+        run_row = QHBoxLayout()
+        self.start_btn = QPushButton("Start"); self.start_btn.clicked.connect(self.start_process)
+        self.cancel_btn = QPushButton("Cancel"); self.cancel_btn.clicked.connect(self.cancel_process); self.cancel_btn.setEnabled(False)
+        run_row.addWidget(self.start_btn); run_row.addWidget(self.cancel_btn)
+        root.addLayout(run_row)
 
         self.setLayout(root)
 
     def add_files(self):
         files, _ = QFileDialog.getOpenFileNames(self, "Select Images", "", "Images (*.png *.jpg *.jpeg *.bmp *.tif *.tiff *.webp)")
-        for f in files:
-            self.listw.addItem(f)
+        self.add_paths(files)
+
+    def add_folder(self):
+        d = QFileDialog.getExistingDirectory(self, "Add Folder (including sub-folders)")
+        if not d:
+            return
+        self._stop_scan()
+        self.scan = ScanWorker([d], exts=IMAGE_EXTS, parent=self)
+        self.scan.chunk.connect(self.add_paths)
+        self.scan.done.connect(lambda n: self.count_label.setText(f"{len(self.model)} files"))
+        self.scan.finished.connect(self.scan.deleteLater)
+        self.count_label.setText("Scanning…")
+        self.scan.start()
+
+    def _stop_scan(self):
+        if self.scan is not None:
+            self.scan.stop()
+            self.scan.chunk.disconnect(); self.scan.done.disconnect()
+            self.scan = None
+
+    def add_paths(self, files):
+        if not files:
+            return
+        self.model.append_paths(files)
+        self.count_label.setText(f"{len(self.model)} files" + (" — scanning…" if self.scan else ""))
+        self.visible_timer.start()
+        self.est_timer.start()
+
+    def paths(self):
+        return self.model.paths()
+
+    def toggle_grid(self, on):
+        self.listw.setViewMode(QListView.IconMode if on else QListView.ListMode)
+        self.listw.setResizeMode(QListView.Adjust)
+        self.listw.setWordWrap(on)
+        self.listw.setGridSize(QSize(THUMB_PX + 40, THUMB_PX + 36) if on else QSize())
+        self.model.set_show_names(on)
+        self.visible_timer.start()
+
+    def _row_near(self, y, direction):
+        # first row hit walking from y into the viewport; icon-mode cells have gaps between items
+        g = self.listw.gridSize()
+        x, h = (g.width() // 2, g.height()) if g.isValid() else (8, 8)
+        for dy in range(0, h + 1, max(1, h // 4)):
+            ix = self.listw.indexAt(QPoint(x, y + direction * dy))
+            if ix.isValid():
+                return ix.row()
+        return -1
+
+    def prioritize_visible(self):
+        if not len(self.model):
+            return
+        vp = self.listw.viewport().rect()
+        first = max(0, self._row_near(vp.top(), 1))
+        last = self._row_near(vp.bottom(), -1)
+        if last < first:  # not laid out yet: assume a generous first page
+            last = first + 100
+        # the visible page plus one page of prefetch below it, skipping rows that have an icon
+        last = min(len(self.model) - 1, last + (last - first + 1))
+        store = self.model.paths()
+        self.thumbs.request_front([(r, store[r]) for r in range(first, last + 1) if r not in self.model.icons])
+
+    def on_thumbnail(self, row, path, img):
+        if row < len(self.model) and self.model.paths()[row] == path:
+            self.model.set_icon(row, QIcon(QPixmap.fromImage(img)))
+
+    def clear_files(self):
+        self._stop_scan()
+        self._stop_estimates()
+        self.thumbs.clear()
+        self.model.clear()
+        self.count_label.setText("0 files")
+        self.est_label.setText("Estimated size: —")
+        self.similar_groups = []; self.similar_list.clear(); self.similar_status.setText("")
 
     def choose_output(self):
         d = QFileDialog.getExistingDirectory(self, "Select Output Folder")
         if d:
             self.output_dir = d
 
+    def _stop_estimates(self):
+        if self.est_worker is not None:
+            self.est_worker.stop()
+            self.est_worker.estimated.disconnect(); self.est_worker.totals.disconnect()
+            self.est_worker = None
+
+    def estimate_all(self):
+        files = self.paths()
+        self._stop_estimates()
+        if not files:
+            return
+        self.est_label.setText("Estimated total: …")
+        self.est_worker = EstimateWorker(files, self.fmt.currentText(), self.quality.value(), parent=self)
+        self.est_worker.finished.connect(self.est_worker.deleteLater)
+        self.est_worker.estimated.connect(self.on_estimated)
+        self.est_worker.totals.connect(self.on_estimate_totals)
+        self.est_worker.start()
+
+    def on_estimated(self, row, est):
+        self.model.set_tip(row, "Estimated size: —" if est is None else f"Estimated size: ≈{max(1, round(est / 1024))} KB")
+
+    def on_estimate_totals(self, est, orig, n):
+        if not n:
+            self.est_label.setText("Estimated size: —"); return
+        ratio = est / orig if orig else 1.0
+        self.est_label.setText(f"Estimated total: ≈{est / 1048576:.1f} MB for {n} files (≈{ratio:.2f}× of original)")
+
     def estimate_selected(self):
-        if self.listw.count() == 0:
+        if len(self.model) == 0:
             QMessageBox.information(self, "No files", "Add images first.")
             return
-        items = self.listw.selectedItems()
-        path = items[0].text() if items else self.listw.item(0).text()
+        rows = self.listw.selectionModel().selectedRows()
+        path = self.model.paths()[rows[0].row() if rows else 0]
         est, ratio = estimate_compressed_size(path, fmt=self.fmt.currentText(), quality=self.quality.value())
         if est is None:
             self.est_label.setText("Estimated size: —")
@@ -137,24 +498,144 @@ class ImageToolsTab(QWidget):
             kb = max(1, round(est / 1024))
             self.est_label.setText(f"Estimated size: {kb} KB (≈{ratio:.2f}× of original)")
 
+    def find_similar(self):
+        if self.similar_worker is not None:
+            self.similar_worker.cancel(); return
+        if not len(self.model):
+            QMessageBox.information(self, "No files", "Add images first."); return
+        try:
+            self.similar_worker = SimilarWorker(self.paths(), self.similar_dist.value(), parent=self)
+        except ImportError:
+            QMessageBox.warning(self, "Find Similar", "Finding similar images needs NumPy (pip install numpy)."); return
+        self.similar_worker.progress.connect(lambda done, n: self.similar_status.setText(f"Hashing {done} / {n}…"))
+        self.similar_worker.ready.connect(self.on_similar)
+        self.similar_worker.finished.connect(self.similar_worker.deleteLater)
+        self.similar_btn.setText("Cancel")
+        self.similar_worker.start()
+
+    def on_similar(self, groups, stats):
+        cancelled = self.similar_worker.finder.cancelled
+        self.similar_worker = None
+        self.similar_btn.setText("Find Similar")
+        self.similar_groups = groups
+        self.similar_list.blockSignals(True)
+        self.similar_list.clear()
+        for n, g in enumerate(groups, 1):
+            self.similar_list.addItem(f"Group {n}: {len(g.rows)} images — {os.path.basename(g.paths[0])}"
+                                      + (f" (≤{g.max_distance} bits apart)" if g.max_distance else " (identical)"))
+        self.similar_list.blockSignals(False)
+        if cancelled:
+            self.similar_status.setText("Cancelled."); return
+        if "error" in stats:
+            self.similar_status.setText(f"Search failed: {stats['error']}"); return
+        self.similar_status.setText(f"{stats['similar']} images in {stats['groups']} groups "
+                                    f"({stats['decoded']} hashed, {stats['cached']} cached; "
+                                    f"{stats['hash_seconds'] + stats['search_seconds']:.1f}s)")
+        if groups:
+            self.select_similar(0)
+
+    def select_similar(self, index):
+        # select the group's rows in the list and scroll to them; the thumbnails do the comparing
+        if not 0 <= index < len(self.similar_groups):
+            return
+        rows = [r for r in self.similar_groups[index].rows if r < len(self.model)]
+        sel = self.listw.selectionModel()
+        sel.clearSelection()
+        for r in rows:
+            sel.select(self.model.index(r), sel.Select)
+        if rows:
+            self.listw.scrollTo(self.model.index(rows[0]))
+
+    def make_contact_sheet(self):
+        if self.sheet_worker is not None:
+            return
+        if not len(self.model):
+            QMessageBox.information(self, "No files", "Add images first."); return
+        out, _ = QFileDialog.getSaveFileName(self, "Save Contact Sheet", os.path.join(self.output_dir or "", "contact_sheet.jpg"),
+                                             "Images (*.jpg *.png *.webp)")
+        if not out:
+            return
+        self.sheet_worker = SheetWorker(self.paths(), out, parent=self)
+        self.sheet_worker.progress.connect(lambda sheet, done, n: self.sheet_status.setText(f"{done} / {n} images…"))
+        self.sheet_worker.ready.connect(self.on_contact_sheet)
+        self.sheet_worker.finished.connect(self.sheet_worker.deleteLater)
+        self.sheet_btn.setEnabled(False)
+        self.sheet_status.setText("Decoding…")
+        self.sheet_worker.start()
+
+    def on_contact_sheet(self, tiles):
+        self.sheet_worker = None
+        self.sheet_btn.setEnabled(True)
+        if isinstance(tiles, str):
+            self.sheet_status.setText(""); QMessageBox.warning(self, "Contact Sheet", tiles); return
+        sheets = len({t.sheet for t in tiles})
+        bad = sum(t.box is None for t in tiles)
+        self.sheet_status.setText(f"{sheets} sheet{'s' * (sheets != 1)}, {len(tiles)} images"
+                                  + (f" ({bad} unreadable)" if bad else ""))
+
+    def add_target(self):
+        preset = self.sizepreset.currentText()
+        t = Target(target_dims_from_preset(preset) if preset != "None" else None, self.fmt.currentText(), self.quality.value())
+        if t in self.targets:
+            return
+        if not self.targets:
+            self.outputs.clear()
+        self.targets.append(t)
+        self.outputs.addItem(f"{preset if t.size else 'Original size'} → {t.fmt} q{t.quality}")
+        self.outputs.setCurrentIndex(self.outputs.count() - 1)
+
+    def clear_targets(self):
+        self.targets = []
+        self.outputs.clear(); self.outputs.addItem("One output (settings above)")
+
     def start_process(self):
-        files = [self.listw.item(i).text() for i in range(self.listw.count())]
+        files = self.paths()
         if not files:
             QMessageBox.warning(self, "No files", "Please add images."); return
         size = None
         if self.sizepreset.currentText() != "None":
             size = target_dims_from_preset(self.sizepreset.currentText())
-        self.t0 = time.time()
+        max_bytes = self.max_kb.value() * 1024 or None
+        if max_bytes and self.fmt.currentText() not in BUDGET_FORMATS:
+            QMessageBox.warning(self, "Max size", f"Max size works with {' / '.join(BUDGET_FORMATS)} output only."); return
+        if max_bytes and self.targets:
+            QMessageBox.warning(self, "Max size", "Max size works with a single output only; clear the outputs list."); return
+        settings = load_settings()
+        try:
+            background = parse_color(settings.get("background", "#ffffff"))
+        except ValueError as e:
+            QMessageBox.warning(self, "Settings", str(e)); return
+        archive = None
+        if self.to_archive.isChecked():
+            archive, _ = QFileDialog.getSaveFileName(self, "Save Outputs As", os.path.join(self.output_dir or "", "images.zip"),
+                                                     "Archives (*.zip *.tar *.tar.gz *.tgz *.tar.bz2 *.tar.xz)")
+            if not archive:
+                return
+            if not is_archive(archive):
+                archive += ".zip"
         self.worker = Worker(
             files, self.fmt.currentText(), size, self.keep_aspect.isChecked(),
-            self.quality.value(), outdir=self.output_dir
+            self.quality.value(), outdir=self.output_dir, workers=self.workers.value(),
+            fast_downscale=DOWNSCALE_MODES[self.downscale.currentText()], max_bytes=max_bytes,
+            incremental=self.incremental.isChecked() and not archive, max_memory=(self.max_memory.value() << 20) or None,
+            targets=list(self.targets) or None, pipeline=self.overlap_io.isChecked(),
+            preserve_exif=settings.get("preserve_exif", False), passthrough=self.passthrough.isChecked(),
+            profile=settings.get("color_profile", "sRGB"), background=background, archive=archive
         )
         self.worker.perfile.connect(self.on_perfile)
         self.worker.progress.connect(self.on_progress)
+        self.worker.eta.connect(self.on_eta)
         self.worker.started_file.connect(self.on_started_file)
         self.worker.finished.connect(self.on_finished)
+        self.start_btn.setEnabled(False); self.cancel_btn.setEnabled(True)
         self.worker.start()
 
+    def cancel_process(self):
+        if getattr(self, "worker", None) and self.worker.isRunning():
+            self.cancel_btn.setEnabled(False)
+            self.eta_label.setText("ETA: — Cancelling…")
+            self.worker.cancel()
+
     def on_started_file(self, path):
         self.perfile_bar.setValue(0)
 
@@ -163,13 +644,58 @@ class ImageToolsTab(QWidget):
 
     def on_progress(self, pct, _):
         self.global_bar.setValue(pct)
-        elapsed = time.time() - self.t0
-        if pct > 0:
-            total_est = elapsed / (pct / 100.0)
-            eta = max(0, int(total_est - elapsed))
-            self.eta_label.setText(f"ETA: {eta}s")
+
+    def on_eta(self, seconds):
+        # pixel-throughput model: a folder of thumbnails after a few huge scans is not "almost done"
+        if seconds is not None:
+            self.eta_label.setText(f"ETA: {int(seconds)}s")
+
+    def _schedule_note(self, sched):
+        if not sched:
+            return ""
+        return (f"\nSchedule: {sched['tasks']} tasks, largest first ({sched['batched_files']} small files in "
+                f"{sched['batches']} groups); peak {sched['peak_inflight_mp']:.0f} of {sched['budget_mp']:.0f} MP decoded, "
+                f"{sched['budget_waits']} waited for memory")
 
     def on_finished(self):
+        self.start_btn.setEnabled(True); self.cancel_btn.setEnabled(False)
+        errors = self.worker.errors
+        if self.worker.engine.cancelled:
+            self.eta_label.setText("ETA: — Cancelled")
+            QMessageBox.information(self, "Cancelled", f"Batch cancelled at {self.global_bar.value()}%.")
+            return
         self.perfile_bar.setValue(100)
         self.eta_label.setText("ETA: 0s — Done")
-        QMessageBox.information(self, "Done", "All images processed.")
+        if self.worker.max_bytes:
+            n = len(self.worker.files) - len(errors)
+            note = f"Max size: {self.worker.probes} encodes for {n} images (≈{self.worker.probes / max(1, n):.1f} per image)"
+            if self.worker.over_budget:
+                note += f"; {len(self.worker.over_budget)} could not get under {self.max_kb.value()} KB"
+            self.eta_label.setText(f"ETA: 0s — Done. {note}")
+        if self.worker.targets:
+            self.eta_label.setText(self.eta_label.text() + f" ({len(self.worker.targets)} outputs per image, decoded once)")
+        if self.worker.skipped:
+            self.eta_label.setText(self.eta_label.text() + f" ({self.worker.skipped} up-to-date, skipped)")
+        outputs = self.worker.report.get("outputs", {})
+        if outputs.get("copied") or outputs.get("lossless"):
+            self.eta_label.setText(self.eta_label.text() + f" ({outputs['copied']} copied, {outputs['lossless']} "
+                                   f"metadata-only, {outputs['re-encoded']} re-encoded)")
+        mem = self.worker.report.get("memory")
+        if mem and mem["strips"]:
+            self.eta_label.setText(self.eta_label.text() + f" ({mem['strips']} large images done in strips, "
+                                   f"peak {mem['peak'] >> 20} of {mem['limit'] >> 20} MB)")
+        stages = self.worker.report["stages"]
+        if stages:
+            top = max(stages, key=lambda s: stages[s]["total"])
+            self.eta_label.setToolTip("Time per stage (all files):\n" + "\n".join(
+                f"{s}: {v['total']:.1f}s ({v['share']:.0%}), p95 {v['p95_ms']:.0f} ms" for s, v in stages.items())
+                + self._schedule_note(self.worker.report.get("schedule"))
+                + (f"\nReport: {self.worker.report_path}" if self.worker.report_path else ""))
+            self.eta_label.setText(self.eta_label.text() + f" — most time in {top} ({stages[top]['share']:.0%})")
+        if self.worker.archive:
+            self.eta_label.setText(self.eta_label.text() + f" (saved to {os.path.basename(self.worker.archive)})")
+        if errors:
+            details = "\n".join(f"{os.path.basename(p)}: {e}" for p, e in errors[:20])
+            QMessageBox.warning(self, "Done with errors", f"{len(errors)} of {len(self.worker.files)} images failed:\n{details}")
+        else:
+            QMessageBox.information(self, "Done", "All images processed.")
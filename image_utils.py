@@ -1,6 +1,11 @@
-from PIL import Image
+from PIL import Image, ImageDraw, ImageFont
 from io import BytesIO
-import os
+from collections import namedtuple
+import os, time
+from concurrent.futures import ThreadPoolExecutor
+from tiled import resize_bounded, decoded_bytes, no_pixel_limit, target_size
+from passthrough import plan_passthrough, strip_metadata, copy_file, orientation, exif_for_save, EXIF_FORMATS
+from color import prepare_output, BACKGROUND, PROFILES
 
 # Standard, practical sizes. Pixels are computed at 300 DPI when mm/in given.
 STANDARD_SIZES = {
@@ -46,51 +51,495 @@ def target_dims_from_preset(preset_key):
         return inches_to_px(w, h, dpi)
     return None
 
-def estimate_compressed_size(image_path, fmt="JPEG", quality=85, subsampling="keep"):
+def estimate_compressed_size(image_path, fmt="JPEG", quality=85, subsampling="keep", fast=False):
     """
     Return (estimated_bytes, ratio_vs_original).
-    Uses an in-memory save to approximate final size.
+    Uses an in-memory save to approximate final size. Decodes and results are cached by
+    the shared SizeEstimator; fast=True encodes sampled tiles and extrapolates.
     """
-    try:
-        img = Image.open(image_path)
-        save_kwargs = {}
-        if fmt.upper() == "JPEG":
-            # JPEG doesn't support alpha; convert to RGB
-            if img.mode in ("RGBA", "P"):
-                img = img.convert("RGB")
-            save_kwargs["quality"] = int(quality)
-            save_kwargs["optimize"] = True
-            if subsampling != "keep":
-                save_kwargs["subsampling"] = subsampling  # 0,1,2 acceptable for PIL
+    from estimator import shared_estimator
+    return shared_estimator().estimate(image_path, fmt=fmt, quality=quality, subsampling=subsampling, fast=fast)
+
+# Shrink-on-load settings for convert_resize_compress(fast_downscale=...).
+# The value is how many times larger than the target the decoder-reduced image must stay
+# before the final high-quality resample: bigger is sharper, smaller is faster.
+DOWNSCALE_MODES = {
+    "Standard": None,   # decode at full size (thumbnail still applies Pillow's own draft)
+    "Fast": 2.0,        # visually identical to Standard for photos
+    "Fastest": 1.0,     # largest JPEG DCT scaling / integer reduce that still covers the target
+}
+
+def shrink_on_load(img, size, gap):
+    """
+    Reduce img cheaply towards size before the real resample.
+    JPEG: DCT-domain scaling via draft() (1/2, 1/4, 1/8) so discarded pixels are never decoded.
+    Others: integer box reduce() while the result stays >= gap × size.
+    Must be called before the image is loaded for draft() to take effect.
+    """
+    w, h = size
+    if img.format == "JPEG":
+        img.draft(img.mode, (int(w * gap), int(h * gap)))
+    factor = max(1, min(img.width // max(1, int(w * gap)), img.height // max(1, int(h * gap))))
+    if factor > 1 and img.mode not in ("P", "1", "I;16"):  # modes reduce() can't average
+        img = img.reduce(factor)
+    return img
+
+def save_options(fmt, quality=85, subsampling="keep"):
+    """Pillow save() keyword arguments used for every encode of fmt."""
+    fmt = fmt.upper()
+    kw = {}
+    if fmt == "JPEG":
+        kw.update(quality=int(quality), optimize=True)
+        if subsampling != "keep":
+            kw["subsampling"] = subsampling  # 0,1,2 acceptable for PIL
+    elif fmt == "WEBP":
+        kw["quality"] = int(quality)
+    return kw
+
+BUDGET_FORMATS = ("JPEG", "WEBP")
+
+def encode_to_budget(img, fmt, max_bytes, quality=85, min_quality=5, subsampling="keep",
+                     allow_subsampling=True, allow_downscale=False, min_scale=0.25, save_kw=None):
+    """
+    Encode img in memory at the highest quality whose output is <= max_bytes.
+    Bisects quality in [min_quality, quality]; if even min_quality is too big it tries 4:2:0
+    chroma subsampling (JPEG) and then, if allowed, smaller dimensions.
+    Returns (data, info); info has quality, subsampling, scale, bytes, probes and fits.
+    When nothing fits, data is the smallest encode tried and info["fits"] is False.
+    save_kw: extra save() arguments for every probe (e.g. exif, from exif_for_save).
+    """
+    fmt = fmt.upper()
+    if fmt not in BUDGET_FORMATS:
+        raise ValueError(f"max size is only supported for {', '.join(BUDGET_FORMATS)}, not {fmt}")
+    probes = 0
+
+    def encode(im, q, sub):
+        nonlocal probes
+        probes += 1
         bio = BytesIO()
-        img.save(bio, fmt.upper(), **save_kwargs)
-        est_bytes = bio.getvalue()
-        orig = os.path.getsize(image_path)
-        ratio = (len(est_bytes) / orig) if orig else 1.0
-        return len(est_bytes), ratio
-    except Exception:
-        return None, None
+        im.save(bio, fmt, **save_options(fmt, q, sub), **(save_kw or {}))
+        return bio.getvalue()
+
+    def search(im, sub):
+        # Highest quality that fits, or (None, smallest) when min_quality is already too big
+        data = encode(im, quality, sub)
+        if len(data) <= max_bytes:
+            return quality, data
+        smallest = encode(im, min_quality, sub)
+        if len(smallest) > max_bytes:
+            return None, smallest
+        lo, hi, best = min_quality, quality - 1, (min_quality, smallest)
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            data = encode(im, mid, sub)
+            if len(data) <= max_bytes:
+                lo, best = mid, (mid, data)
+            else:
+                hi = mid - 1
+        return best
 
-def convert_resize_compress(image_path, out_fmt="JPEG", out_path=None, size=None, keep_aspect=True, quality=85):
+    subs = [subsampling]
+    if allow_subsampling and fmt == "JPEG" and subsampling not in (2, "4:2:0"):
+        subs.append(2)
+    scale, im, smallest = 1.0, img, None
+    while True:
+        for sub in subs:
+            q, data = search(im, sub)
+            if smallest is None or len(data) < len(smallest[1]):
+                smallest = (min_quality, data, sub)
+            if q is not None:
+                return data, dict(quality=q, subsampling=sub, scale=round(scale, 3), bytes=len(data),
+                                  probes=probes, fits=True)
+        if not allow_downscale or scale <= min_scale:
+            break
+        # bytes grow roughly with pixel count: shrink by the overshoot plus a margin
+        scale = max(min_scale, scale * min(0.9, (max_bytes / len(smallest[1])) ** 0.5 * 0.95))
+        im = img.resize((max(1, round(img.width * scale)), max(1, round(img.height * scale))))
+        subs = subs[-1:]  # keep the cheapest subsampling found above
+    q, data, sub = smallest
+    return data, dict(quality=q, subsampling=sub, scale=round(scale, 3), bytes=len(data),
+                      probes=probes, fits=False)
+
+def _check_report(write, report):
+    if not write and report is None:
+        raise ValueError("write=False returns the encoded bytes in report['encoded']; pass a report dict")
+
+def convert_resize_compress(image_path, out_fmt="JPEG", out_path=None, size=None, keep_aspect=True, quality=85,
+                            fast_downscale=None, max_bytes=None, allow_downscale=False, max_memory=None, report=None,
+                            source=None, write=True, preserve_exif=False, passthrough=True, profile="sRGB",
+                            background=BACKGROUND):
     """
     Convert with optional resize and compression. Returns output path.
     - size: (w, h) px if provided
     - keep_aspect True => thumbnail; False => exact resize
+    - fast_downscale: None for a full decode, or a DOWNSCALE_MODES gap to shrink on load
+    - max_bytes: JPEG/WEBP only; quality (at most `quality`) is searched to fit the budget,
+      allow_downscale lets the search also shrink the image
+    - max_memory: bytes of decoded image data to hold at once; larger sources are decoded and
+      resampled in strips (see tiled.py) and the output is encoded straight to disk
+    - report: optional dict, filled with details of how the file was produced: "stages"
+      (seconds spent in each of STAGES), "pixels" (source), "bytes_in", "bytes_out", and
+      with max_memory "memory" (limit, peak bytes held, "full" or "strips")
+    - source: the file's bytes, already read (image_path is then only used for naming and
+      strip decoding); write=False leaves the writing to the caller: the encoded bytes are
+      returned in report["encoded"] (see batch_engine's pipelined mode), so it needs a report
+      dict (ValueError otherwise)
+    - preserve_exif: keep the source's EXIF block; otherwise only its orientation tag is kept
+    - passthrough: a source that already matches the output (see passthrough.py) is copied or
+      has only its metadata rewritten instead of being re-encoded; report["output"] says
+      which: "copied", "lossless" or "re-encoded"
+    - profile / background: colour management and alpha flattening (see color.py): "sRGB"
+      converts embedded ICC profiles to sRGB, "keep" embeds them as they are, a profile file
+      converts every image to it (so no output is copied as it is)
     """
-    img = Image.open(image_path)
-    if size:
+    _check_report(write, report)
+    stages, lap = _stage_timer()
+    fp = BytesIO(source) if source is not None else image_path
+    if max_memory:
+        with no_pixel_limit():  # huge scans are the point here; the memory limit guards instead
+            img = Image.open(fp)
+    else:
+        img = Image.open(fp)
+    pixels = img.width * img.height
+    if out_path is None:
+        base, _ = os.path.splitext(image_path)
+        out_path = f"{base}_out.{out_fmt.lower()}"
+    bytes_in = len(source) if source is not None else os.path.getsize(image_path)
+    passthrough = passthrough and profile in PROFILES
+    outcome = passthrough and plan_passthrough(img, out_fmt, size, keep_aspect, quality, max_bytes, preserve_exif, bytes_in)
+    save_kw = exif_for_save(img, out_fmt, preserve_exif)
+    icc = img.info.get("icc_profile")
+    lap("open")
+    if outcome:
+        data, method = _pass_through(img, image_path, out_path, outcome, source, write)
+        lap("write")
+        if report is not None:
+            report.update(stages={k: round(v, 6) for k, v in stages.items()}, pixels=pixels, bytes_in=bytes_in,
+                          bytes_out=bytes_in if data is None else len(data), output=outcome)
+            if method:
+                report["copy"] = method
+            if not write:
+                report["encoded"] = data
+        return out_path
+    if max_memory and decoded_bytes(img) > max_memory:
+        img = resize_bounded(img, image_path, size, keep_aspect, int(max_memory), report)
+        lap("decode")  # decoding and resampling are interleaved strip by strip
+        size = None
+    elif size:
         w, h = size
+        box = (w, h)
+        if keep_aspect:  # the box that thumbnail() will actually fill
+            scale = min(w / img.width, h / img.height, 1.0)
+            box = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+        if fast_downscale:
+            img = shrink_on_load(img, box, fast_downscale)
+        elif keep_aspect and img.format == "JPEG":
+            img.draft(img.mode, (box[0] * 2, box[1] * 2))  # what thumbnail() does itself, but only on an unloaded image
+    img.load()  # decode now, so decoding and resampling are timed apart
+    lap("decode")
+    if max_memory and report is not None and "memory" not in report:
+        report["memory"] = {"limit": int(max_memory), "peak": decoded_bytes(img), "mode": "full"}
+    if size:
         if keep_aspect:
             img.thumbnail((w, h))
         else:
             img = img.resize((w, h))
-    if out_fmt.upper() == "JPEG" and img.mode in ("RGBA", "P"):
-        img = img.convert("RGB")
-    if out_path is None:
-        base, _ = os.path.splitext(image_path)
-        out_path = f"{base}_out.{out_fmt.lower()}"
-    save_kwargs = {}
-    if out_fmt.upper() == "JPEG":
-        save_kwargs.update(dict(quality=int(quality), optimize=True))
-    img.save(out_path, out_fmt.upper(), **save_kwargs)
+    lap("resize")
+    img, color_kw = prepare_output(img, out_fmt, icc, profile, background)
+    save_kw.update(color_kw)
+    lap("convert")
+    if max_bytes:
+        data, info = encode_to_budget(img, out_fmt, int(max_bytes), quality=quality, allow_downscale=allow_downscale,
+                                      save_kw=save_kw)
+        if report is not None:
+            report["budget"] = info
+    elif max_memory and write:
+        img.save(out_path, out_fmt.upper(), **save_options(out_fmt, quality), **save_kw)  # streams to disk, no encoded copy
+        data = None
+    else:
+        bio = BytesIO()
+        img.save(bio, out_fmt.upper(), **save_options(out_fmt, quality), **save_kw)
+        data = bio.getbuffer() if write else bio.getvalue()
+    lap("encode")
+    if not write:
+        report["encoded"] = data
+    elif data is not None:
+        with open(out_path, "wb") as f:
+            f.write(data)
+    lap("write")
+    if report is not None:
+        report.update(stages={k: round(v, 6) for k, v in stages.items()}, pixels=pixels, bytes_in=bytes_in,
+                      bytes_out=os.path.getsize(out_path) if data is None else len(data), output="re-encoded")
     return out_path
+
+def _pass_through(img, image_path, out_path, outcome, source=None, write=True):
+    # Produce out_path from the source file without decoding it (see passthrough.py).
+    # Returns (data, copy method): data is None when the file was copied on disk.
+    if outcome == "copied" and source is None and write:
+        if os.path.exists(out_path) and os.path.samefile(image_path, out_path):
+            return None, None
+        return None, copy_file(image_path, out_path)
+    if source is None:
+        with open(image_path, "rb") as f:
+            source = f.read()
+    data = strip_metadata(source, img.format, orientation(img)) if outcome == "lossless" else source
+    if write:
+        with open(out_path, "wb") as f:
+            f.write(data)
+    return data, None
+
+# One output of a multi-output job: size is a (w, h) box in px (see target_dims_from_preset)
+# or None to keep the source size
+Target = namedtuple("Target", "size fmt quality", defaults=("JPEG", 85))
+
+def convert_multi(image_path, targets, out_paths, keep_aspect=True, fast_downscale=None, max_memory=None, report=None,
+                  source=None, write=True, preserve_exif=False, passthrough=True, profile="sRGB", background=BACKGROUND):
+    """
+    Produce every Target in targets from a single decode of image_path; returns out_paths.
+    - the source is decoded once, only as large as the largest output needs (JPEG draft /
+      shrink_on_load, or strips under max_memory as in convert_resize_compress)
+    - outputs are made largest first, each resampled from the smallest image made so far
+      that still covers it, so small outputs never resample the full-size source
+    - every output is encoded in the same call; keep_aspect, fast_downscale and max_memory
+      mean the same as for convert_resize_compress
+    - report: as convert_resize_compress (stages summed over all outputs), plus "outputs":
+      [{"path", "size", "format", "bytes", "output"}, ...] in targets order
+    - source / write: as convert_resize_compress; report["encoded"] is then a list in targets order
+    - preserve_exif / passthrough / profile / background: as convert_resize_compress, per output; when every output can
+      be copied the source is never decoded. report["output"] is "copied" or "lossless" only if
+      all outputs were, else "re-encoded"
+    """
+    _check_report(write, report)
+    stages, lap = _stage_timer()
+    fp = BytesIO(source) if source is not None else image_path
+    if max_memory:
+        with no_pixel_limit():
+            img = Image.open(fp)
+    else:
+        img = Image.open(fp)
+    src, pixels = img.size, img.width * img.height
+    bytes_in = len(source) if source is not None else os.path.getsize(image_path)
+    passthrough = passthrough and profile in PROFILES
+    outcomes = [passthrough and plan_passthrough(img, t.fmt, t.size, keep_aspect, t.quality, None, preserve_exif, bytes_in)
+                for t in targets]
+    save_kw = exif_for_save(img, "JPEG", preserve_exif)  # the same block for every output format that takes one
+    icc = img.info.get("icc_profile")
+    # outputs that can be copied need no decode (dims None)
+    dims = [None if o else target_size(src, t.size, keep_aspect) if t.size else src for o, t in zip(outcomes, targets)]
+    outputs = [None] * len(targets)
+    if not write:
+        report["encoded"] = [None] * len(targets)
+    lap("open")
+    for i, outcome in enumerate(outcomes):
+        if outcome:
+            data, _ = _pass_through(img, image_path, out_paths[i], outcome, source, write)
+            if not write:
+                report["encoded"][i] = data
+            outputs[i] = {"path": out_paths[i], "size": list(src), "format": targets[i].fmt.upper(),
+                          "bytes": bytes_in if data is None else len(data), "output": outcome}
+            lap("write")
+    left = [d for d in dims if d]
+    if left:
+        top = (max(d[0] for d in left), max(d[1] for d in left))  # covers every output
+        if max_memory and decoded_bytes(img) > max_memory:
+            img = resize_bounded(img, image_path, top, False, int(max_memory), report)
+            lap("decode")
+        else:
+            if top != src:
+                if fast_downscale:
+                    img = shrink_on_load(img, top, fast_downscale)
+                elif img.format == "JPEG":
+                    img.draft(img.mode, (top[0] * 2, top[1] * 2))
+            img.load()
+            lap("decode")
+            if max_memory and report is not None and "memory" not in report:
+                report["memory"] = {"limit": int(max_memory), "peak": decoded_bytes(img), "mode": "full"}
+    levels = [img]
+    for i in sorted((i for i, d in enumerate(dims) if d), key=lambda i: -dims[i][0] * dims[i][1]):
+        t, d = targets[i], dims[i]
+        base = min((l for l in levels if l.width >= d[0] and l.height >= d[1]),
+                   key=lambda l: l.width * l.height, default=img)
+        out = base
+        if base.size != d:
+            out = base.resize(d, Image.BICUBIC, reducing_gap=2.0)  # thumbnail()'s filter
+            levels.append(out)
+        lap("resize")
+        fmt = t.fmt.upper()
+        out, color_kw = prepare_output(out, fmt, icc, profile, background)
+        lap("convert")
+        bio = BytesIO()
+        out.save(bio, fmt, **save_options(fmt, t.quality), **(save_kw if fmt in EXIF_FORMATS else {}), **color_kw)
+        lap("encode")
+        if write:
+            with open(out_paths[i], "wb") as f:
+                f.write(bio.getbuffer())
+        else:
+            report["encoded"][i] = bio.getvalue()
+        lap("write")
+        outputs[i] = {"path": out_paths[i], "size": list(out.size), "format": fmt, "bytes": bio.tell(),
+                      "output": "re-encoded"}
+    if report is not None:
+        report.update(stages={k: round(v, 6) for k, v in stages.items()}, pixels=pixels, bytes_in=bytes_in,
+                      bytes_out=sum(o["bytes"] for o in outputs), outputs=outputs,
+                      output=outcomes[0] if len(set(outcomes)) == 1 and outcomes[0] else "re-encoded")
+    return out_paths
+
+# Perceptual hashes: 64-bit fingerprints that survive resizing and recompression.
+# hash_thumb() decodes (small) and perceptual_hashes() hashes a whole batch at once with NumPy.
+HASH_KINDS = ("ahash", "dhash", "phash")
+HASH_SIDE = 32
+
+def hash_thumb(path, side=HASH_SIDE):
+    """side×side grayscale pixels (bytes) of path, decoded with shrink_on_load."""
+    with Image.open(path) as img:
+        img = shrink_on_load(img, (side, side), 2.0)
+        if img.mode not in ("L", "RGB"):
+            img = img.convert("RGBA" if "A" in img.mode or "transparency" in img.info else "RGB")
+        return img.convert("L").resize((side, side), Image.BOX).tobytes()
+
+_HASH_MATRICES = {}
+
+def _hash_matrices():
+    # box-resampling matrices 32 -> 8 and 32 -> 9, and the 32-point DCT-II basis
+    import numpy as np
+    if not _HASH_MATRICES:
+        def box(out, inp):
+            m = np.zeros((out, inp), np.float32)
+            for i in range(out):
+                lo, hi = i * inp / out, (i + 1) * inp / out
+                for j in range(int(lo), min(inp, int(np.ceil(hi)))):
+                    m[i, j] = min(hi, j + 1) - max(lo, j)
+            return m / m.sum(axis=1, keepdims=True)
+        n = np.arange(HASH_SIDE)
+        dct = np.cos(np.pi * (2 * n[None, :] + 1) * n[:, None] / (2 * HASH_SIDE)).astype(np.float32)
+        _HASH_MATRICES.update(r8=box(8, HASH_SIDE), r9=box(9, HASH_SIDE), dct=dct)
+    return _HASH_MATRICES
+
+def perceptual_hashes(thumbs):
+    """
+    aHash, dHash and pHash of a batch of hash_thumb() results, computed for the whole batch
+    with NumPy matrix products. Returns an (n, 3) uint64 array, columns in HASH_KINDS order.
+    - aHash: 8×8 box means above their mean
+    - dHash: 8×9 box means, each brighter than its left neighbour
+    - pHash: 8×8 lowest DCT frequencies above their median (DC term excluded)
+    """
+    import numpy as np
+    m = _hash_matrices()
+    x = np.frombuffer(b"".join(thumbs), np.uint8).reshape(-1, HASH_SIDE, HASH_SIDE).astype(np.float32)
+    a = m["r8"] @ x @ m["r8"].T
+    d = m["r8"] @ x @ m["r9"].T
+    p = (m["dct"][:8] @ x @ m["dct"][:8].T).reshape(len(x), 64)
+    bits = np.stack([(a > a.mean(axis=(1, 2), keepdims=True)).reshape(-1, 64),
+                     (d[:, :, 1:] > d[:, :, :-1]).reshape(-1, 64),
+                     p > np.median(p[:, 1:], axis=1, keepdims=True)], axis=1)
+    return np.packbits(bits, axis=2).reshape(len(x), 3, 8).view(">u8")[..., 0].astype(np.uint64)
+
+STAGES = ("read", "open", "decode", "resize", "convert", "encode", "write")  # "read": pipelined prefetch only
+
+def _stage_timer():
+    # lap(name) books the time since the previous lap under name
+    stages, last = {}, [time.perf_counter()]
+    def lap(name):
+        now = time.perf_counter()
+        stages[name] = stages.get(name, 0.0) + now - last[0]
+        last[0] = now
+    return stages, lap
+
+# Contact / sprite sheets: shrink-on-load tiles pasted straight into one reused canvas, a
+# sheet at a time, so memory stays at one sheet plus the tiles of the pages being decoded.
+SheetTile = namedtuple("SheetTile", "path sheet box")   # box: (x, y, w, h) on sheet; None if unreadable
+_TRANSPOSE = {2: Image.FLIP_LEFT_RIGHT, 3: Image.ROTATE_180, 4: Image.FLIP_TOP_BOTTOM,
+              5: Image.TRANSPOSE, 6: Image.ROTATE_270, 7: Image.TRANSVERSE, 8: Image.ROTATE_90}
+
+def sheet_tile(path, tile):
+    """path decoded to fit tile (w, h), upright, as RGB or RGBA (pasted with its own mask); None if unreadable."""
+    try:
+        with Image.open(path) as img:
+            turn, icc = orientation(img), img.info.get("icc_profile")
+            w, h = tile if turn < 5 else tile[::-1]  # 5-8 are stored sideways
+            scale = min(w / img.width, h / img.height, 1.0)
+            img = shrink_on_load(img, (max(1, round(img.width * scale)), max(1, round(img.height * scale))), 1.0)
+            img.thumbnail((w, h), Image.LANCZOS)
+            img.load()  # a source that already fits comes back unloaded, and the file closes below
+            if turn in _TRANSPOSE:
+                img = img.transpose(_TRANSPOSE[turn])
+            img, _ = prepare_output(img, "PNG", icc)  # to sRGB, alpha kept
+            if img.mode not in ("RGB", "RGBA"):
+                img = img.convert("RGBA" if "A" in img.mode or "transparency" in img.info else "RGB")
+            return img
+    except Exception:
+        return None
+
+def _sheet_font(size):
+    try:
+        return ImageFont.load_default(size)
+    except TypeError:  # Pillow < 10.1: fixed-size bitmap font only
+        return ImageFont.load_default()
+
+def _fit_caption(draw, text, font, width):
+    if draw.textlength(text, font=font) <= width:
+        return text
+    while text and draw.textlength(text + "…", font=font) > width:
+        text = text[:-1]
+    return text + "…"
+
+def sheet_paths(out_path, pages):
+    """The file for each of `pages` sheets: out_path itself, or out_path with _001, _002… before the extension."""
+    if pages == 1:
+        return [out_path]
+    stem, ext = os.path.splitext(out_path)
+    return [f"{stem}_{n:03d}{ext}" for n in range(1, pages + 1)]
+
+def contact_sheets(paths, out_path, cols=6, rows=5, tile=(240, 240), gap=8, caption=True, background=(255, 255, 255),
+                   fmt=None, quality=85, threads=4, on_sheet=None):
+    """
+    Lay paths out on cols×rows grids, one sheet per page (rows=None: all on one sheet), with
+    the file name under each picture unless caption is False (gap=0, caption=False: a sprite
+    sheet). Returns [SheetTile, ...] in input order; on_sheet(sheet_path, done, total) after each save.
+    - tiles are decoded on `threads` threads with shrink_on_load; the next page is decoded
+      while the current one is composed and encoded
+    - every sheet is drawn into the same preallocated canvas, each tile pasted once at its
+      final place (alpha composited through its own mask)
+    - fmt defaults to the format of out_path's extension; the last sheet is cropped to its rows
+    """
+    paths = list(paths)
+    if not paths:
+        return []
+    tw, th = tile
+    per = cols * (rows or max(1, -(-len(paths) // cols)))
+    pages = [paths[i:i + per] for i in range(0, len(paths), per)]
+    outs = sheet_paths(out_path, len(pages))
+    fmt = (fmt or Image.registered_extensions().get(os.path.splitext(out_path)[1].lower(), "JPEG")).upper()
+    font = _sheet_font(max(10, min(16, tw // 14))) if caption else None
+    cap_h = font.getbbox("Ag")[3] + 4 if caption else 0
+    cell_h = th + cap_h
+    canvas = Image.new("RGB", (gap + cols * (tw + gap), gap + (per // cols) * (cell_h + gap)), background)
+    draw = ImageDraw.Draw(canvas)
+    ink = (0, 0, 0) if sum(background) > 384 else (230, 230, 230)
+    out, done = [], 0
+    with ThreadPoolExecutor(threads) as ex:
+        pending = [ex.submit(sheet_tile, p, tile) for p in pages[0]]
+        for k, page in enumerate(pages):
+            futures = pending
+            pending = [ex.submit(sheet_tile, p, tile) for p in pages[k + 1]] if k + 1 < len(pages) else []
+            if k:
+                canvas.paste(background, (0, 0) + canvas.size)
+            for i, (path, fut) in enumerate(zip(page, futures)):
+                r, c = divmod(i, cols)
+                x0, y0 = gap + c * (tw + gap), gap + r * (cell_h + gap)
+                img, box = fut.result(), None
+                if img is not None:
+                    box = (x0 + (tw - img.width) // 2, y0 + (th - img.height) // 2, img.width, img.height)
+                    canvas.paste(img, box[:2], img if img.mode == "RGBA" else None)
+                    img.close()
+                if caption:
+                    text = _fit_caption(draw, os.path.basename(path), font, tw)
+                    draw.text((x0 + (tw - draw.textlength(text, font=font)) / 2, y0 + th + 2), text, fill=ink, font=font)
+                out.append(SheetTile(path, outs[k], box))
+            used = -(-len(page) // cols)
+            sheet = canvas if used == per // cols else canvas.crop((0, 0, canvas.width, gap + used * (cell_h + gap)))
+            sheet.save(outs[k], fmt, **save_options(fmt, quality))
+            done += len(page)
+            if on_sheet:
+                on_sheet(outs[k], done, len(paths))
+    return out
@@ -1,11 +1,24 @@
+import time
+_T0 = time.perf_counter()  # startup probe: everything below counts as import time
 import sys
 import os
+import multiprocessing
 from PyQt5.QtWidgets import QApplication, QMainWindow, QTabWidget, QWidget, QVBoxLayout
 from PyQt5.QtGui import QPalette, QColor
 from PyQt5 import QtCore, QtWidgets
 from home_tab import HomeTab
-from image_tools_tab import ImageToolsTab
-from file_tools_tab import FileToolsTab
+
+# Tabs other than Home are built on first activation; their modules pull in PIL and the
+# batch machinery, so importing them here would put that on the path to the first paint.
+def _image_tools():
+    from image_tools_tab import ImageToolsTab
+    return ImageToolsTab()
+
+def _file_tools():
+    from file_tools_tab import FileToolsTab
+    return FileToolsTab()
+
+TABS = [("Home", HomeTab), ("Image Tools", _image_tools), ("File Tools", _file_tools)]
 
 
 def apply_dark(app):
@@ -28,23 +41,68 @@ if sys.platform == "darwin":
     plugin_path = os.path.join(os.path.dirname(QtCore.__file__), 'Qt', 'plugins')
     os.environ['QT_QPA_PLATFORM_PLUGIN_PATH'] = plugin_path
 
+class LazyTab(QWidget):
+    """Empty page that builds the real tab (factory()) the first time it is shown."""
+    def __init__(self, factory):
+        super().__init__()
+        self.factory, self.widget = factory, None
+        lay = QVBoxLayout(); lay.setContentsMargins(0, 0, 0, 0); self.setLayout(lay)
+
+    def build(self):
+        if self.widget is None:
+            self.widget = self.factory()
+            self.layout().addWidget(self.widget)
+        return self.widget
+
 class MainWindow(QMainWindow):
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Utility Tool")
         self.resize(1100, 720)
 
-        tabs = QTabWidget()
-        tabs.addTab(HomeTab(), "Home")
-        tabs.addTab(ImageToolsTab(), "Image Tools")
-        tabs.addTab(FileToolsTab(), "File Tools")
+        self.tabs = QTabWidget()
+        for name, factory in TABS:
+            self.tabs.addTab(LazyTab(factory), name)
+        self.tabs.currentChanged.connect(self._build_tab)
+        self._build_tab(self.tabs.currentIndex())
 
-        c = QWidget(); lay = QVBoxLayout(); lay.addWidget(tabs); c.setLayout(lay)
+        c = QWidget(); lay = QVBoxLayout(); lay.addWidget(self.tabs); c.setLayout(lay)
         self.setCentralWidget(c)
 
+    def _build_tab(self, index):
+        page = self.tabs.widget(index)
+        if page is not None and page.widget is None:
+            QtWidgets.QApplication.setOverrideCursor(QtCore.Qt.WaitCursor)
+            try:
+                page.build()
+            finally:
+                QtWidgets.QApplication.restoreOverrideCursor()
+
+def startup_probe(w, t_imports, t_window):
+    """
+    --startup-probe / UTILITYTOOL_STARTUP_PROBE=1: print startup timings to stderr and quit.
+    - import: main.py's imports; window: MainWindow built; first_paint: the event loop has
+      painted the shown window (ms since main.py started)
+    - heavy: which of the lazily imported modules got loaded anyway
+    """
+    def done():
+        ms = lambda t: round((t - _T0) * 1000, 1)
+        heavy = [m for m in ("PIL.Image", "numpy", "image_utils", "batch_engine", "file_utils") if m in sys.modules]
+        print(f"startup: import={ms(t_imports)}ms window={ms(t_window)}ms "
+              f"first_paint={ms(time.perf_counter())}ms heavy={','.join(heavy) or '-'}", file=sys.stderr)
+        QApplication.quit()
+    w.repaint()  # paint synchronously so the timer below fires after the first frame
+    QtCore.QTimer.singleShot(0, done)
+
 if __name__ == "__main__":
-    app = QApplication(sys.argv)
+    multiprocessing.freeze_support()  # image batches run on a process pool, also in frozen builds
+    t_imports = time.perf_counter()
+    probe = "--startup-probe" in sys.argv or os.environ.get("UTILITYTOOL_STARTUP_PROBE") == "1"
+    app = QApplication([a for a in sys.argv if a != "--startup-probe"])
     apply_dark(app)
     w = MainWindow()
+    t_window = time.perf_counter()
     w.show()
+    if probe:
+        startup_probe(w, t_imports, t_window)
     sys.exit(app.exec_())
@@ -0,0 +1,121 @@
+import os, json, time, hashlib
+
+MANIFEST_NAME = ".utilitytool-manifest.jsonl"
+
+def params_digest(params):
+    """Stable short digest of a conversion parameter dict."""
+    blob = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()[:16]
+
+def file_sha1(path, bufsize=1024 * 1024):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(bufsize), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+class Manifest:
+    """
+    Per-output-directory record of what a batch produced, used to skip up-to-date outputs
+    and to resume interrupted runs.
+    - one JSON line per finished output, append-only; the last line for a source wins
+    - records are buffered and flushed (with fsync) every flush_every records or
+      flush_seconds, so a crash only loses the unflushed tail, which is redone next run
+    - a torn final line from a crash is ignored on load
+    - close() compacts the file atomically when superseded lines pile up
+    """
+    def __init__(self, outdir, flush_every=200, flush_seconds=2.0):
+        self.path = os.path.join(outdir, MANIFEST_NAME)
+        self.flush_every, self.flush_seconds = flush_every, flush_seconds
+        self.entries, self.lines = {}, 0
+        self._buffer, self._last_flush = [], time.monotonic()
+        if os.path.exists(self.path):
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        e = json.loads(line)
+                    except ValueError:
+                        continue  # partial line from an interrupted write
+                    self.entries[e["src"]] = e
+                    self.lines += 1
+
+    def needs_hash(self, src, st, digest):
+        """True if only src's content hash can tell whether it is current (touched, same size)."""
+        e = self.entries.get(src)
+        return (e is not None and e["params"] == digest and bool(e.get("sha1"))
+                and e["size"] == st.st_size and e["mtime_ns"] != st.st_mtime_ns)
+
+    def is_current(self, src, st, digest, sha1=None):
+        """
+        True if src (with os.stat result st) was already converted with these parameters.
+        A touched source is compared by content: sha1 if given (see needs_hash), else it is
+        hashed here. On a match its new mtime is recorded, so the next run needn't hash again.
+        """
+        e = self.entries.get(src)
+        if e is None or e["params"] != digest:
+            return False
+        touched = (e["size"], e["mtime_ns"]) != (st.st_size, st.st_mtime_ns)
+        if touched:
+            # touched or copied but maybe identical: only a recorded content hash can tell
+            if not e.get("sha1") or e["size"] != st.st_size or (sha1 or file_sha1(src)) != e["sha1"]:
+                return False
+        try:
+            out = os.stat(e["out"])
+        except OSError:
+            return False
+        if (out.st_size, out.st_mtime_ns) != (e["out_size"], e["out_mtime_ns"]):
+            return False
+        if touched:
+            self._add(dict(e, mtime_ns=st.st_mtime_ns))
+        return True
+
+    def record(self, src, st, digest, out_path, sha1=None):
+        out = os.stat(out_path)
+        e = {"src": src, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "params": digest,
+             "out": out_path, "out_size": out.st_size, "out_mtime_ns": out.st_mtime_ns}
+        if sha1:
+            e["sha1"] = sha1
+        self._add(e)
+
+    def _add(self, e):
+        self.entries[e["src"]] = e
+        self._buffer.append(json.dumps(e, ensure_ascii=False))
+        if len(self._buffer) >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(self._buffer) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.lines += len(self._buffer)
+            self._buffer = []
+        self._last_flush = time.monotonic()
+
+    def close(self):
+        self.flush()
+        if self.lines > 2 * len(self.entries) + 100:
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                for e in self.entries.values():
+                    f.write(json.dumps(e, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+            self.lines = len(self.entries)
+
+class ManifestSet:
+    """Lazily opens one Manifest per output directory (outputs may sit next to their sources)."""
+    def __init__(self, **options):
+        self.options, self.manifests = options, {}
+
+    def for_output(self, out_path):
+        d = os.path.dirname(os.path.abspath(out_path))
+        if d not in self.manifests:
+            self.manifests[d] = Manifest(d, **self.options)
+        return self.manifests[d]
+
+    def close(self):
+        for m in self.manifests.values():
+            m.close()
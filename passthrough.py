@@ -0,0 +1,157 @@
+"""
+Header-only checks that let a conversion skip decoding and re-encoding.
+
+plan_passthrough() looks at an opened (not yet decoded) image and the requested output and answers:
+- "copied": the file already is what a re-encode would produce, or better: same format,
+  already inside the size box, within max_bytes and, for JPEG, saved at no higher quality
+  than requested (estimated from its quantization tables), so re-encoding would only lose
+  detail. The bytes are copied as they are (copy_file_range / sendfile where available)
+- "lossless": as "copied", but the EXIF block has to go (preserve_exif off). JPEG segments
+  or PNG chunks are rewritten without EXIF/XMP; the pixel data is not touched, and the
+  orientation tag is kept so the picture still shows the right way up
+- None: decode and re-encode as usual
+"""
+import os, errno, shutil, struct, zlib
+from PIL import Image
+
+FORMATS = ("JPEG", "PNG")    # formats copied / edited losslessly; the others always re-encode
+EXIF_FORMATS = ("JPEG", "PNG", "WEBP")  # formats Pillow writes an exif block for
+ORIENTATION = 0x0112
+OUTCOMES = ("copied", "lossless", "re-encoded")
+
+# IJG (libjpeg) base luminance table: quality q scales it by 5000/q (q < 50) or 200 - 2q
+_IJG_LUMA = (16, 11, 10, 16, 24, 40, 51, 61, 12, 12, 14, 19, 26, 58, 60, 55, 14, 13, 16, 24, 40, 57, 69, 56,
+             14, 17, 22, 29, 51, 87, 80, 62, 18, 22, 37, 56, 68, 109, 103, 77, 24, 35, 55, 64, 81, 104, 113, 92,
+             49, 64, 78, 87, 103, 121, 120, 101, 72, 92, 95, 98, 112, 100, 103, 99)
+_XMP = b"http://ns.adobe.com/xap/1.0/\x00"
+
+def jpeg_quality(img):
+    """Estimated IJG quality (1-100) of an opened JPEG from its luminance table; None if unknown."""
+    q = getattr(img, "quantization", None)
+    if not q or 0 not in q:
+        return None
+    scale = sum(q[0]) * 100 / sum(_IJG_LUMA)
+    return max(1, min(100, round(5000 / scale if scale > 100 else (200 - scale) / 2)))
+
+def header_exif(img):
+    """
+    img's EXIF from header data only, or None. getexif() on a PNG without an eXIf chunk before
+    the pixels loads the whole image looking for one, which would defeat strip decoding.
+    """
+    if "exif" not in img.info and img.format != "TIFF":  # TIFF keeps its tags in the header
+        return None
+    try:
+        return img.getexif()
+    except Exception:  # a broken EXIF block is no reason to fail the conversion
+        return None
+
+def orientation(img):
+    exif = header_exif(img)
+    return exif.get(ORIENTATION, 1) if exif is not None else 1
+
+def orientation_exif(value):
+    """A minimal EXIF block holding only the orientation tag (None for the default orientation)."""
+    if value in (None, 1):
+        return None
+    exif = Image.Exif()
+    exif[ORIENTATION] = value
+    return exif.tobytes()
+
+def exif_for_save(img, fmt, preserve_exif):
+    """save() keyword arguments for the EXIF of a re-encode: all of it, or just the orientation."""
+    if fmt.upper() not in EXIF_FORMATS:
+        return {}
+    exif = img.info.get("exif") if preserve_exif else orientation_exif(orientation(img))
+    return {"exif": exif} if exif else {}
+
+def plan_passthrough(img, out_fmt, size=None, keep_aspect=True, quality=85, max_bytes=None, preserve_exif=False, nbytes=0):
+    """"copied", "lossless" or None (re-encode) for an opened, undecoded img; nbytes is the file size."""
+    fmt = out_fmt.upper()
+    if img.format != fmt or fmt not in FORMATS or getattr(img, "n_frames", 1) > 1:
+        return None
+    if size:
+        w, h = size
+        if (img.width > w or img.height > h) if keep_aspect else img.size != (w, h):
+            return None
+    if max_bytes and nbytes > max_bytes:
+        return None
+    if fmt == "JPEG":
+        q = jpeg_quality(img)
+        if q is None or q > quality:
+            return None
+    if preserve_exif or ("exif" not in img.info and not (fmt == "JPEG" and _has_xmp(img))):
+        return "copied"
+    return "lossless"
+
+def _has_xmp(img):
+    return any(name == "APP1" and d.startswith(_XMP) for name, d in getattr(img, "applist", ()))
+
+def strip_metadata(data, fmt, keep_orientation=1):
+    """data (a JPEG or PNG file) without its EXIF (and JPEG XMP), plus orientation_exif(keep_orientation)."""
+    exif = orientation_exif(keep_orientation)
+    if fmt.upper() == "JPEG":
+        return _strip_jpeg(data, exif)
+    return _strip_png(data, exif)
+
+def _strip_jpeg(data, exif):
+    out, pos = [data[:2]], 2
+    if exif:
+        body = exif if exif.startswith(b"Exif\x00\x00") else b"Exif\x00\x00" + exif
+        out.append(b"\xff\xe1" + struct.pack(">H", len(body) + 2) + body)
+    while pos + 4 <= len(data):
+        marker = data[pos + 1]
+        if data[pos] != 0xFF:
+            raise ValueError("corrupt JPEG segment")
+        if marker == 0xDA:  # start of scan: the rest is entropy-coded data
+            break
+        length = struct.unpack(">H", data[pos + 2:pos + 4])[0]
+        seg = data[pos:pos + 2 + length]
+        body = seg[4:]
+        if not (marker == 0xE1 and (body.startswith(b"Exif\x00\x00") or body.startswith(_XMP))):
+            out.append(seg)
+        pos += 2 + length
+    out.append(data[pos:])
+    return b"".join(out)
+
+def _strip_png(data, exif):
+    out, pos = [data[:8]], 8
+    while pos + 8 <= len(data):
+        length, kind = struct.unpack(">I4s", data[pos:pos + 8])
+        chunk = data[pos:pos + 12 + length]
+        if kind != b"eXIf":
+            out.append(chunk)
+        if kind == b"IHDR" and exif:  # eXIf has to come before the image data
+            body = exif[6:] if exif.startswith(b"Exif\x00\x00") else exif
+            out.append(struct.pack(">I4s", len(body), b"eXIf") + body + struct.pack(">I", zlib.crc32(b"eXIf" + body)))
+        pos += 12 + length
+    return b"".join(out)
+
+def copy_file(src, dst):
+    """
+    Copy src to dst inside the kernel where possible: copy_file_range (Linux; reflinks on
+    Btrfs/XFS, server-side copies on NFS/SMB), then sendfile, then a plain read/write loop.
+    Returns the method used.
+    """
+    with open(src, "rb") as fi, open(dst, "wb") as fo:
+        n = os.fstat(fi.fileno()).st_size
+        for method in ("copy_file_range", "sendfile"):
+            if not hasattr(os, method):
+                continue
+            done = 0
+            try:
+                while done < n:
+                    if method == "copy_file_range":
+                        k = os.copy_file_range(fi.fileno(), fo.fileno(), n - done)
+                    else:
+                        k = os.sendfile(fo.fileno(), fi.fileno(), done, n - done)
+                    if not k:
+                        break
+                    done += k
+            except OSError as e:
+                if e.errno not in (errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF):
+                    raise
+            if done == n:
+                return method
+            fi.seek(0); fo.seek(0); fo.truncate()
+        shutil.copyfileobj(fi, fo, 1024 * 1024)
+    return "read/write"
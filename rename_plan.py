@@ -0,0 +1,231 @@
+import os, json, time, uuid, shutil
+from collections import Counter
+
+class RenameConflictError(ValueError):
+    """Raised when a rename batch can't be applied safely; .conflicts lists (kind, path, detail)."""
+    def __init__(self, conflicts):
+        self.conflicts = conflicts
+        kind, path, detail = conflicts[0]
+        more = f" (+{len(conflicts) - 1} more)" if len(conflicts) > 1 else ""
+        super().__init__(f"{kind}: {path} — {detail}{more}")
+
+def _key(path):
+    # identity of a path on this platform (case-insensitive on Windows)
+    return os.path.normcase(os.path.abspath(path))
+
+class RenamePlan:
+    """
+    Ordered os.rename steps for a batch, built by plan_renames().
+    - steps: [(src, dst), ...] in a safe order; cycles go through temporary names
+    - conflicts: [(kind, path, detail), ...]; a plan with conflicts must not be executed
+    """
+    def __init__(self, steps, conflicts, renames):
+        self.steps, self.conflicts, self.renames = steps, conflicts, renames
+
+    @property
+    def ok(self):
+        return not self.conflicts
+
+def plan_renames(paths, previews):
+    """
+    Build a RenamePlan for renaming paths[i] -> previews[i] (unchanged pairs are dropped).
+    Detects up front: missing sources, a source listed twice, two sources with the same
+    target, and targets that already exist and are not themselves being renamed away (a
+    case-only rename on a case-insensitive filesystem is a single direct step).
+    Chains (a->b, b->c) run back to front and swaps/cycles (a->b, b->a) break through a
+    temporary name. Everything is dict/set based: O(n) for n renames.
+    """
+    moves, conflicts = {}, []
+    for src, dst in zip(paths, previews):
+        if src == dst:
+            continue
+        k = _key(src)
+        if k in moves:
+            conflicts.append(("duplicate-source", src, "listed more than once"))
+            continue
+        moves[k] = (src, dst)
+    for dk, n in Counter(_key(dst) for _, dst in moves.values()).items():
+        if n > 1:
+            conflicts.append(("duplicate-target", dk, f"{n} files would get this name"))
+    for k, (src, dst) in moves.items():
+        if not os.path.lexists(src):
+            conflicts.append(("missing-source", src, "file not found"))
+        dk = _key(dst)
+        if dk != k and dk not in moves and os.path.lexists(dst) and not _case_only(dst, src):
+            conflicts.append(("target-exists", dst, f"would overwrite an existing file (from {os.path.basename(src)})"))
+    renames = list(moves.values())
+    if conflicts:
+        return RenamePlan([], conflicts, renames)
+
+    # With unique targets every node has in-degree <= 1, so the graph is chains and simple cycles.
+    token = uuid.uuid4().hex[:8]
+    nxt = {k: _key(dst) for k, (src, dst) in moves.items()}
+    state, steps = {}, []   # state: 1 = on the chain being walked, 2 = scheduled
+    for start in moves:
+        if start in state:
+            continue
+        chain, node = [], start
+        while node in moves and node not in state:
+            state[node] = 1
+            chain.append(node)
+            node = nxt[node]
+        walked = list(chain)
+        # a one-node "cycle" is a case-only rename of the same file: a single direct step is fine
+        if state.get(node) == 1 and node != chain[-1]:
+            # cycle: park its entry under a temporary name, run the rest, then place the entry
+            i = chain.index(node)
+            src, dst = moves[node]
+            tmp = os.path.join(os.path.dirname(src), f".{os.path.basename(src)}.{token}.tmp")
+            steps.append((src, tmp))
+            steps.extend(moves[k] for k in reversed(chain[i + 1:]))
+            steps.append((tmp, dst))
+            chain = chain[:i]
+        steps.extend(moves[k] for k in reversed(chain))
+        for k in walked:
+            state[k] = 2
+    return RenamePlan(steps, [], renames)
+
+def _append(journal, records):
+    data = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records).encode("utf-8")
+    with open(journal, "ab+") as f:
+        if f.seek(0, os.SEEK_END):
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                data = b"\n" + data  # after a torn line from a crash: don't glue onto it
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+def execute_plan(plan, journal=None, batch=1000):
+    """
+    Run plan.steps. With a journal path, each block of `batch` steps is appended (and
+    fsync'd) before it runs, so the batch can be rolled back after a crash or undone later.
+    If a rename fails, the steps already done are reversed and the error is re-raised.
+    """
+    if not plan.ok:
+        raise RenameConflictError(plan.conflicts)
+    bid = uuid.uuid4().hex
+    if journal:
+        _append(journal, [{"op": "begin", "batch": bid, "time": time.time(), "steps": len(plan.steps)}])
+    done = 0
+    try:
+        for i in range(0, len(plan.steps), batch):
+            block = plan.steps[i:i + batch]
+            if journal:
+                _append(journal, [{"op": "rename", "batch": bid, "src": s, "dst": d} for s, d in block])
+            for src, dst in block:
+                os.rename(src, dst)
+                done += 1
+    except Exception:
+        _reverse(plan.steps[:done])
+        if journal:
+            _append(journal, [{"op": "rolled_back", "batch": bid}])
+        raise
+    if journal:
+        _append(journal, [{"op": "commit", "batch": bid}])
+    return bid
+
+DEDUPE_ACTIONS = ("delete", "link")
+
+def execute_dedupe(pairs, action, journal=None, batch=1000):
+    """
+    For each (duplicate, keeper) in pairs, delete the duplicate ("delete") or replace it with
+    a hard link to the keeper ("link"). Journaled like execute_plan; since a duplicate has its
+    keeper's content, undo_last() restores it as a copy of the keeper.
+    If a step fails, the finished steps are reversed and the error is re-raised.
+    """
+    if action not in DEDUPE_ACTIONS:
+        raise ValueError(f"unknown duplicate action: {action}")
+    bid, token = uuid.uuid4().hex, uuid.uuid4().hex[:8]
+    if journal:
+        _append(journal, [{"op": "begin", "batch": bid, "time": time.time(), "steps": len(pairs)}])
+    done = 0
+    try:
+        for i in range(0, len(pairs), batch):
+            block = pairs[i:i + batch]
+            if journal:
+                _append(journal, [{"op": action, "batch": bid, "src": s, "dst": d} for s, d in block])
+            for dup, keep in block:
+                if action == "delete":
+                    os.remove(dup)
+                else:
+                    tmp = f"{dup}.{token}.tmp"  # link beside it, then swap in atomically
+                    os.link(keep, tmp)
+                    os.replace(tmp, dup)
+                done += 1
+    except Exception:
+        _restore(pairs[:done])
+        if journal:
+            _append(journal, [{"op": "rolled_back", "batch": bid}])
+        raise
+    if journal:
+        _append(journal, [{"op": "commit", "batch": bid}])
+    return bid
+
+def _restore(pairs):
+    # Bring back deleted / hard-linked duplicates as copies of their keepers
+    failed = []
+    for dup, keep in reversed(pairs):
+        try:
+            if os.path.lexists(dup) and not os.path.samefile(dup, keep):
+                continue  # never removed, or already replaced by something else
+            tmp = f"{dup}.{uuid.uuid4().hex[:8]}.tmp"
+            shutil.copy2(keep, tmp)
+            os.replace(tmp, dup)
+        except OSError:
+            failed.append((keep, dup))
+    return failed
+
+def _case_only(src, dst):
+    # a case-only rename on a case-insensitive filesystem, after it ran: src "exists" because
+    # it is dst; _case_only(dst, src) is the same test before it runs
+    if src == dst or src.casefold() != dst.casefold():
+        return False
+    try:
+        names = os.listdir(os.path.dirname(dst) or ".")
+        return os.path.samefile(src, dst) and os.path.basename(dst) in names and os.path.basename(src) not in names
+    except OSError:
+        return False
+
+def _reverse(steps):
+    # Undo in reverse order; steps whose effect isn't on disk (never ran, crash) are skipped
+    failed = []
+    for src, dst in reversed(steps):
+        if os.path.lexists(dst) and (not os.path.lexists(src) or _case_only(src, dst)):
+            try:
+                os.rename(dst, src)
+            except OSError:
+                failed.append((dst, src))
+    return failed
+
+def undo_last(journal):
+    """
+    Reverse the most recent batch in the journal that is not yet undone or rolled back
+    (also repairs a batch interrupted by a crash); renames are renamed back, deleted or
+    hard-linked duplicates are restored from their keepers. Returns (batch_id, steps, failed_pairs),
+    or None if there is nothing to undo.
+    """
+    if not journal or not os.path.exists(journal):
+        return None
+    batches, closed, order = {}, set(), []
+    with open(journal, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                r = json.loads(line)
+            except ValueError:
+                continue  # torn line from a crash
+            b = r.get("batch")
+            if r["op"] == "begin":
+                batches[b] = []; order.append(b)
+            elif r["op"] in ("rename",) + DEDUPE_ACTIONS and b in batches:
+                batches[b].append((r["op"], r["src"], r["dst"]))
+            elif r["op"] in ("undone", "rolled_back"):
+                closed.add(b)
+    for b in reversed(order):
+        if b not in closed:
+            failed = []
+            for op, src, dst in reversed(batches[b]):
+                failed += _reverse([(src, dst)]) if op == "rename" else _restore([(src, dst)])
+            _append(journal, [{"op": "undone", "batch": b, "time": time.time()}])
+            return b, len(batches[b]), failed
+    return None
@@ -0,0 +1,136 @@
+import os, math, time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+BYTES_PER_PIXEL = 4  # Pillow stores RGB/RGBA/CMYK pixels 4 bytes wide
+
+# jobs: [(index, path, out_path, stat), ...]; cost: decoded megapixels held while the task runs
+Task = namedtuple("Task", "id jobs cost")
+
+def physical_memory():
+    """Installed RAM in bytes, or None if the platform won't say."""
+    try:
+        return os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    except (AttributeError, ValueError, OSError):
+        pass
+    try:  # Windows
+        import ctypes
+        class MEMORYSTATUSEX(ctypes.Structure):
+            _fields_ = [("dwLength", ctypes.c_ulong), ("dwMemoryLoad", ctypes.c_ulong)] + \
+                       [(n, ctypes.c_ulonglong) for n in ("total", "avail", "pt", "apt", "vt", "avt", "ave")]
+        m = MEMORYSTATUSEX(); m.dwLength = ctypes.sizeof(m)
+        return m.total if ctypes.windll.kernel32.GlobalMemoryStatusEx(ctypes.byref(m)) else None
+    except Exception:
+        return None
+
+def default_budget_mp():
+    """Half the RAM, in decoded megapixels (4 GB assumed when unknown)."""
+    return (physical_memory() or 4 << 30) / 2 / BYTES_PER_PIXEL / 1e6
+
+def image_header(path):
+    """(width, height, format) from the header only; None if unreadable."""
+    try:
+        with Image.open(path) as img:
+            return img.width, img.height, img.format
+    except Exception:
+        return None
+
+def decoded_mp(header, size=None, keep_aspect=True, fast_downscale=None, max_memory=None):
+    """Megapixels convert_resize_compress will hold decoded for a source with this header."""
+    if header is None:
+        return 0.0
+    w, h, fmt = header
+    px = w * h
+    if fmt == "JPEG" and size and (keep_aspect or fast_downscale):
+        # draft() decodes at 1/2, 1/4 or 1/8 scale while that still covers ~2x the target
+        gap = fast_downscale or 2.0
+        tw, th = size
+        if keep_aspect:
+            s = min(tw / w, th / h, 1.0)
+            tw, th = w * s, h * s
+        for f in (8, 4, 2):
+            if w / f >= tw * gap and h / f >= th * gap:
+                px //= f * f
+                break
+    if max_memory:
+        px = min(px, max_memory // BYTES_PER_PIXEL)
+    return px / 1e6
+
+class Scheduler:
+    """
+    Turns a batch into tasks for the process pool and decides when each may start.
+    - headers are read up front (threads; nothing is decoded) to price every file in
+      decoded megapixels
+    - files of at least small_mp run as their own task, largest first, so the longest jobs
+      don't end up alone at the tail of the batch
+    - smaller files are grouped (up to batch_files files / batch_mp megapixels, in input
+      order) so thousands of thumbnails don't pay one pool round-trip each; with workers
+      set, a group holds at most 1/workers of them, so a handful still spreads over the pool
+    - admit() lets a task start only while the in-flight cost stays within budget_mp; a task
+      bigger than the whole budget runs alone
+    report() describes the decisions for the batch report.
+    """
+    def __init__(self, budget_mp=None, small_mp=1.0, batch_files=32, batch_mp=8.0, header_threads=8, workers=None):
+        self.budget_mp = float(budget_mp or default_budget_mp())
+        self.workers = workers
+        self.small_mp, self.batch_files, self.batch_mp = small_mp, batch_files, batch_mp
+        self.header_threads = header_threads
+        self.inflight, self._waited = 0.0, set()
+        self.stats = {"budget_mp": round(self.budget_mp, 1), "order": "largest-first", "files": 0, "tasks": 0,
+                      "batched_files": 0, "batches": 0, "largest_mp": 0.0, "oversized": 0,
+                      "peak_inflight_mp": 0.0, "budget_waits": 0, "header_seconds": 0.0}
+
+    def plan(self, jobs, on_header=None, **cost_options):
+        """
+        jobs: [(index, path, out_path, stat), ...]. cost_options: size, keep_aspect,
+        fast_downscale, max_memory as passed to convert_resize_compress. on_header(index, pixels)
+        is called for every file once its header is read. Returns [Task, ...] in start order.
+        """
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(self.header_threads) as ex:
+            headers = list(ex.map(image_header, [j[1] for j in jobs]))
+        self.stats["header_seconds"] = round(time.perf_counter() - t0, 3)
+        costs = []
+        for job, header in zip(jobs, headers):
+            if on_header:
+                on_header(job[0], header[0] * header[1] if header else 0)
+            costs.append(decoded_mp(header, **cost_options))
+
+        big = sorted(((c, j) for c, j in zip(costs, jobs) if c >= self.small_mp), key=lambda cj: -cj[0])
+        per_group = self.batch_files
+        if self.workers:
+            per_group = min(per_group, max(1, math.ceil((len(jobs) - len(big)) / self.workers)))
+        groups, group = [], None
+        for c, j in zip(costs, jobs):
+            if c < self.small_mp:
+                if group is None or len(group[1]) >= per_group or group[0] + c > self.batch_mp:
+                    group = [0.0, []]
+                    groups.append(group)
+                group[0] += c; group[1].append(j)
+        groups.sort(key=lambda g: -g[0])
+        tasks = [(c, [j]) for c, j in big] + [tuple(g) for g in groups]
+        s = self.stats
+        s["files"] = len(jobs)
+        s["tasks"] = len(tasks)
+        s["batches"] = sum(1 for g in groups if len(g[1]) > 1)
+        s["batched_files"] = sum(len(g[1]) for g in groups if len(g[1]) > 1)
+        s["largest_mp"] = round(max(costs, default=0.0), 1)
+        s["oversized"] = sum(1 for c in costs if c > self.budget_mp)
+        return [Task(i, jobs, cost) for i, (cost, jobs) in enumerate(tasks)]
+
+    def admit(self, task, running):
+        """True if task may start now (running: number of tasks in flight)."""
+        if running and self.inflight + task.cost > self.budget_mp:
+            self._waited.add(task.id)
+            self.stats["budget_waits"] = len(self._waited)  # tasks that had to wait for memory
+            return False
+        self.inflight += task.cost
+        self.stats["peak_inflight_mp"] = round(max(self.stats["peak_inflight_mp"], self.inflight), 1)
+        return True
+
+    def release(self, task):
+        self.inflight = max(0.0, self.inflight - task.cost)
+
+    def report(self):
+        return dict(self.stats)
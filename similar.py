@@ -0,0 +1,173 @@
+import os, time, threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from image_utils import HASH_KINDS, hash_thumb, perceptual_hashes
+
+CACHE_KIND = "perceptual-v1"   # FileCache kind: the three hashes as 24 bytes
+MAX_INDEXED_K = 15             # k must stay below this; shorter chunks would narrow nothing down
+
+# paths / rows (indices into the input) of images within max_distance of another group member
+SimilarGroup = namedtuple("SimilarGroup", "paths rows max_distance")
+
+def popcount(x):
+    """Set bits per element of a uint64 array."""
+    if hasattr(np, "bitwise_count"):  # NumPy 2
+        return np.bitwise_count(x)
+    return np.unpackbits(x.view(np.uint8).reshape(*x.shape, 8), axis=-1).sum(axis=-1)
+
+def _check_k(k):
+    if not 0 <= k < MAX_INDEXED_K:
+        raise ValueError(f"max distance must be 0–{MAX_INDEXED_K - 1} bits, got {k}")
+
+def hamming_pairs(hashes, k, block=1024):
+    """
+    All pairs within Hamming distance k among 64-bit hashes, as (i, j, distance) arrays, i < j.
+    Multi-index hashing: the bits are cut into k+1 chunks; by pigeonhole two hashes within
+    distance k agree exactly on at least one chunk, so only hashes sharing a chunk value are
+    compared (vectorized, `block` rows at a time), and a pair is kept only for the first chunk
+    it agrees on. Near-linear for 100k+ hashes instead of n² comparisons. k=0 is a single
+    chunk, the whole hash. ValueError unless 0 <= k < MAX_INDEXED_K.
+    """
+    _check_k(k)
+    h = np.ascontiguousarray(hashes, dtype=np.uint64)
+    n = len(h)
+    out_i, out_j, out_d = [], [], []
+    bounds = np.linspace(0, 64, k + 2).astype(int)
+    chunks = []
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        mask = np.uint64((1 << int(hi - lo)) - 1)
+        chunks.append((h >> np.uint64(lo)) & mask)
+    for c, key in enumerate(chunks):
+        order = np.argsort(key, kind="stable")
+        sk = key[order]
+        starts = np.flatnonzero(np.r_[True, sk[1:] != sk[:-1]])
+        ends = np.r_[starts[1:], n]
+        for s, e in zip(starts[ends - starts > 1], ends[ends - starts > 1]):
+            members = np.sort(order[s:e])
+            for r0 in range(0, len(members), block):
+                rows, cols = members[r0:r0 + block], members[r0:]  # upper triangle only
+                d = popcount(h[rows, None] ^ h[None, cols])
+                ri, ci = np.nonzero((d <= k) & (rows[:, None] < cols[None, :]))
+                if not len(ri):
+                    continue
+                i, j, dist = rows[ri], cols[ci], d[ri, ci]
+                earlier = np.zeros(len(i), bool)
+                for prev in chunks[:c]:  # found already through an earlier chunk
+                    earlier |= prev[i] == prev[j]
+                out_i.append(i[~earlier]); out_j.append(j[~earlier]); out_d.append(dist[~earlier])
+    if not out_i:
+        empty = np.zeros(0, np.int64)
+        return empty, empty, empty
+    return np.concatenate(out_i), np.concatenate(out_j), np.concatenate(out_d)
+
+def group_pairs(n, i, j):
+    """
+    Connected components of the graph on n nodes with edges i[x]-j[x]: (labels, count), where
+    labels[node] is its component number, or -1 for nodes without an edge.
+    """
+    parent = list(range(n))
+    def find(a):
+        while parent[a] != a:
+            parent[a] = parent[parent[a]]
+            a = parent[a]
+        return a
+    for a, b in zip(i.tolist(), j.tolist()):
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+    labels, ids = np.full(n, -1, np.int64), {}
+    for a in sorted(set(i.tolist()) | set(j.tolist())):
+        labels[a] = ids.setdefault(find(a), len(ids))
+    return labels, len(ids)
+
+class SimilarFinder:
+    """
+    Groups visually near-identical images (resized, recompressed or converted copies).
+    - hashes: aHash/dHash/pHash per image from image_utils.perceptual_hashes; decodes run on
+      `threads` threads (shrink-on-load, a few ms per photo) and are hashed `batch` at a time
+    - with a FileCache the hashes are kept by (path, size, mtime), so later runs only decode
+      new or changed images
+    - pairs within max distance come from hamming_pairs(); groups are their connected components
+    stats describes the last run.
+    """
+    def __init__(self, cache=None, threads=4, batch=256):
+        self.cache, self.threads, self.batch = cache, threads, batch
+        self.stats = {}
+        self._cancel = threading.Event()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def hashes(self, paths, on_progress=None):
+        """(n, 3) uint64 array of hashes for paths (rows of unreadable images are 0) and a bool 'ok' array."""
+        n = len(paths)
+        out, ok = np.zeros((n, len(HASH_KINDS)), np.uint64), np.zeros(n, bool)
+        todo = []
+        for row in range(n):
+            path = paths[row]
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            v = self.cache.get(path, st, CACHE_KIND) if self.cache else None
+            if v is not None:
+                out[row] = np.frombuffer(v, "<u8"); ok[row] = True
+            else:
+                todo.append((row, path, st))
+        self.stats.update(cached=int(ok.sum()), decoded=0, unreadable=0)
+
+        def thumb(item):
+            try:
+                return hash_thumb(item[1])
+            except Exception:
+                return None
+        with ThreadPoolExecutor(self.threads) as ex:
+            for b in range(0, len(todo), self.batch):
+                if self.cancelled:
+                    break
+                items = todo[b:b + self.batch]
+                thumbs = list(ex.map(thumb, items))
+                good = [(item, t) for item, t in zip(items, thumbs) if t is not None]
+                self.stats["unreadable"] += len(items) - len(good)
+                if good:
+                    hs = perceptual_hashes([t for _, t in good])
+                    for ((row, path, st), _), hv in zip(good, hs):
+                        out[row] = hv; ok[row] = True
+                        if self.cache:
+                            self.cache.put(path, st, CACHE_KIND, hv.astype("<u8").tobytes())
+                    self.stats["decoded"] += len(good)
+                if on_progress:
+                    on_progress(self.stats["cached"] + b + len(items), n)
+        if self.cache:
+            self.cache.flush()
+        return out, ok
+
+    def run(self, paths, max_distance=6, kind="phash", on_progress=None):
+        """[SimilarGroup, ...] for paths (a sequence), biggest groups first."""
+        _check_k(max_distance)  # before hashing, not after
+        self._cancel.clear()
+        t0 = time.perf_counter()
+        self.stats = {"images": len(paths)}
+        hashes, ok = self.hashes(paths, on_progress)
+        if self.cancelled:
+            return []
+        t1 = time.perf_counter()
+        rows = np.flatnonzero(ok)
+        i, j, d = hamming_pairs(hashes[rows, HASH_KINDS.index(kind)], max_distance)
+        labels, count = group_pairs(len(rows), i, j)
+        worst = np.zeros(count, np.int64)
+        np.maximum.at(worst, labels[i], d)
+        members = [[] for _ in range(count)]
+        for node in np.flatnonzero(labels >= 0).tolist():
+            members[labels[node]].append(int(rows[node]))
+        groups = [SimilarGroup([paths[r] for r in m], m, int(w)) for m, w in zip(members, worst)]
+        groups.sort(key=lambda g: (-len(g.rows), g.rows[0]))
+        self.stats.update(kind=kind, max_distance=max_distance, pairs=len(i), groups=len(groups),
+                          similar=sum(len(g.rows) for g in groups), hash_seconds=round(t1 - t0, 3),
+                          search_seconds=round(time.perf_counter() - t1, 3))
+        return groups
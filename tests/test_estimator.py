@@ -0,0 +1,30 @@
+import pytest
+from PIL import Image
+from estimator import SizeEstimator, _encoded_size
+
+def _photo(path, size, grain=40):
+    # smooth colour gradients under sensor-like grain: the fine detail a shrunk decode loses
+    r = Image.linear_gradient("L").resize(size)
+    g = Image.linear_gradient("L").rotate(90).resize(size)
+    b = Image.radial_gradient("L").resize(size)
+    noise = Image.effect_noise(size, grain).convert("RGB")
+    Image.blend(Image.merge("RGB", (r, g, b)), noise, 0.2).save(path, quality=92)
+    return path
+
+def _real_size(path, fmt, quality):
+    with Image.open(path) as img:
+        return _encoded_size(img.convert("RGB"), fmt, quality, "keep")
+
+# tile_px=48 on 3600x2400: the mosaic is small next to the image, where sampling a shrunk
+# (draft) decode would underestimate by half
+@pytest.mark.parametrize("size, tile_px", [((1600, 1200), 128), ((3600, 2400), 48)])
+@pytest.mark.parametrize("fmt, quality", [("JPEG", 60), ("JPEG", 85), ("WEBP", 80)])
+def test_fast_estimate_close_to_encoded_size(tmp_path, size, tile_px, fmt, quality):
+    path = _photo(str(tmp_path / "photo.jpg"), size)
+    fast, _ = SizeEstimator(tile_px=tile_px).estimate(path, fmt, quality, fast=True)
+    real = _real_size(path, fmt, quality)
+    assert abs(fast / real - 1) < 0.25, (fast, real)
+
+def test_exact_estimate_is_the_encoded_size(tmp_path):
+    path = _photo(str(tmp_path / "photo.jpg"), (800, 600))
+    assert SizeEstimator().estimate(path, "JPEG", 75)[0] == _real_size(path, "JPEG", 75)
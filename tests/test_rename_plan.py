@@ -0,0 +1,108 @@
+import os
+import pytest
+import rename_plan
+from rename_plan import plan_renames, execute_plan, undo_last, RenameConflictError
+
+def _files(d, contents):
+    # {name: content} -> {name: path}, each file holding its own content
+    paths = {}
+    for name, text in contents.items():
+        paths[name] = str(d / name)
+        with open(paths[name], "w") as f:
+            f.write(text)
+    return paths
+
+def _tree(d):
+    out = {}
+    for name in sorted(os.listdir(d)):
+        if name.endswith(".jsonl"):
+            continue
+        with open(d / name) as f:
+            out[name] = f.read()
+    return out
+
+def _run(d, pairs, journal=None):
+    plan = plan_renames([str(d / s) for s, _ in pairs], [str(d / t) for _, t in pairs])
+    assert plan.ok, plan.conflicts
+    return execute_plan(plan, journal)
+
+def test_chain_runs_back_to_front(tmp_path):
+    _files(tmp_path, {"a": "A", "b": "B"})
+    _run(tmp_path, [("a", "b"), ("b", "c")])
+    assert _tree(tmp_path) == {"b": "A", "c": "B"}
+
+def test_swap(tmp_path):
+    _files(tmp_path, {"a": "A", "b": "B"})
+    _run(tmp_path, [("a", "b"), ("b", "a")])
+    assert _tree(tmp_path) == {"a": "B", "b": "A"}
+
+def test_three_cycle(tmp_path):
+    _files(tmp_path, {"a": "A", "b": "B", "c": "C"})
+    _run(tmp_path, [("a", "b"), ("b", "c"), ("c", "a")])
+    assert _tree(tmp_path) == {"a": "C", "b": "A", "c": "B"}
+
+def test_duplicate_target_is_a_conflict(tmp_path):
+    p = _files(tmp_path, {"a": "A", "b": "B"})
+    plan = plan_renames([p["a"], p["b"]], [str(tmp_path / "x"), str(tmp_path / "x")])
+    assert [c[0] for c in plan.conflicts] == ["duplicate-target"]
+    with pytest.raises(RenameConflictError):
+        execute_plan(plan)
+    assert _tree(tmp_path) == {"a": "A", "b": "B"}
+
+def test_existing_target_is_a_conflict(tmp_path):
+    p = _files(tmp_path, {"a": "A", "b": "B"})
+    plan = plan_renames([p["a"]], [p["b"]])
+    assert [c[0] for c in plan.conflicts] == ["target-exists"]
+
+def test_failed_rename_rolls_back(tmp_path, monkeypatch):
+    _files(tmp_path, {"a": "A", "b": "B", "c": "C"})
+    journal = str(tmp_path / "journal.jsonl")
+    real, calls = os.rename, []
+    def flaky(src, dst):
+        calls.append(src)
+        if len(calls) == 3:
+            raise OSError("disk full")
+        real(src, dst)
+    monkeypatch.setattr(rename_plan.os, "rename", flaky)
+    with pytest.raises(OSError):
+        _run(tmp_path, [("a", "b"), ("b", "c"), ("c", "a")], journal)
+    assert _tree(tmp_path) == {"a": "A", "b": "B", "c": "C"}
+    assert undo_last(journal) is None  # rolled back: nothing left to undo
+
+def test_undo_last_after_torn_journal_line(tmp_path):
+    _files(tmp_path, {"a": "A", "b": "B"})
+    journal = str(tmp_path / "journal.jsonl")
+    _run(tmp_path, [("a", "b"), ("b", "c")], journal)
+    with open(journal, "a") as f:
+        f.write('{"op": "rena')  # crash mid-append
+    bid, steps, failed = undo_last(journal)
+    assert (steps, failed) == (2, [])
+    assert _tree(tmp_path) == {"a": "A", "b": "B"}
+    assert undo_last(journal) is None
+
+def test_undo_repairs_an_interrupted_batch(tmp_path):
+    # journal says three steps, the crash came after the first
+    p = _files(tmp_path, {"a": "A", "b": "B"})
+    journal = str(tmp_path / "journal.jsonl")
+    plan = plan_renames([p["a"], p["b"]], [p["b"], str(tmp_path / "c")])
+    rename_plan._append(journal, [{"op": "begin", "batch": "x", "steps": 2}]
+                        + [{"op": "rename", "batch": "x", "src": s, "dst": d} for s, d in plan.steps])
+    os.rename(*plan.steps[0])
+    undo_last(journal)
+    assert _tree(tmp_path) == {"a": "A", "b": "B"}
+
+def test_case_only_rename_on_case_insensitive_volume(tmp_path, monkeypatch):
+    # emulate a case-insensitive volume: names match whatever their case
+    def lexists(path):
+        d, name = os.path.split(path)
+        return os.path.isdir(d) and any(n.casefold() == name.casefold() for n in os.listdir(d))
+    def samefile(a, b):
+        return a.casefold() == b.casefold() and lexists(a)
+    monkeypatch.setattr(rename_plan.os.path, "lexists", lexists)
+    monkeypatch.setattr(rename_plan.os.path, "samefile", samefile)
+    _files(tmp_path, {"a.JPG": "A"})
+    journal = str(tmp_path / "journal.jsonl")
+    _run(tmp_path, [("a.JPG", "a.jpg")], journal)
+    assert _tree(tmp_path) == {"a.jpg": "A"}
+    undo_last(journal)
+    assert _tree(tmp_path) == {"a.JPG": "A"}
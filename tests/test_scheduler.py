@@ -0,0 +1,25 @@
+from PIL import Image
+from scheduler import Scheduler
+
+def _jobs(tmp_path, n, size=(64, 64)):
+    jobs = []
+    for i in range(n):
+        path = str(tmp_path / f"{i}.png")
+        Image.new("RGB", size).save(path)
+        jobs.append((i, path, path + ".out", None))
+    return jobs
+
+def test_small_files_spread_over_the_workers(tmp_path):
+    tasks = Scheduler(1000, workers=4).plan(_jobs(tmp_path, 9))
+    assert [len(t.jobs) for t in tasks] == [3, 3, 3]  # was one task of 9 on a single process
+
+def test_small_files_grouped_up_to_batch_files(tmp_path):
+    tasks = Scheduler(1000, workers=2, batch_files=4).plan(_jobs(tmp_path, 20))
+    assert [len(t.jobs) for t in tasks] == [4] * 5
+
+def test_big_files_run_alone_largest_first(tmp_path):
+    jobs = _jobs(tmp_path, 2) + [(2, str(tmp_path / "big.png"), None, None), (3, str(tmp_path / "bigger.png"), None, None)]
+    Image.new("RGB", (1500, 1000)).save(jobs[2][1]); Image.new("RGB", (2000, 1500)).save(jobs[3][1])
+    tasks = Scheduler(1000, workers=4).plan(jobs)
+    assert [[j[0] for j in t.jobs] for t in tasks][:2] == [[3], [2]]
+    assert sum(len(t.jobs) for t in tasks) == 4
@@ -0,0 +1,92 @@
+import os, hashlib, threading
+from io import BytesIO
+from PIL import Image
+from image_utils import shrink_on_load
+
+THUMB_PX = 96
+
+def make_thumbnail(path, px=THUMB_PX):
+    """Return JPEG bytes of a px-bounded thumbnail, decoding only what is needed (draft/reduce)."""
+    with Image.open(path) as img:
+        scale = min(px / img.width, px / img.height, 1.0)
+        img = shrink_on_load(img, (max(1, round(img.width * scale)), max(1, round(img.height * scale))), 1.0)
+        img.thumbnail((px, px))
+        if img.mode in ("RGBA", "LA", "P", "PA"):
+            img = img.convert("RGBA")
+            bg = Image.new("RGB", img.size, (45, 45, 45))  # the dark theme's AlternateBase
+            bg.paste(img, mask=img.getchannel("A"))
+            img = bg
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+        bio = BytesIO()
+        img.save(bio, "JPEG", quality=80)
+        return bio.getvalue()
+
+class ThumbnailCache:
+    """
+    On-disk thumbnail cache keyed by (path, mtime, size, thumbnail px).
+    - entries live as <cache>/<k[:2]>/<k>.jpg; a hit bumps the file's mtime
+    - when the folder grows past max_bytes the least recently used entries are evicted
+      down to 90% of the budget (one scan per eviction, not per lookup)
+    - creating a cache never touches the disk: prepare() creates and measures the folder,
+      called from the loader threads (or done by the first miss)
+    Safe to use from several threads.
+    """
+    def __init__(self, root, max_bytes=256 * 1024 * 1024, px=THUMB_PX):
+        self.root, self.max_bytes, self.px = root, max_bytes, px
+        self._lock = threading.Lock()
+        self.used = None  # bytes in the folder, measured by prepare()
+
+    def prepare(self):
+        """Create the folder and measure it, once; slow on a network home, so not on the UI thread."""
+        with self._lock:
+            if self.used is None:
+                os.makedirs(self.root, exist_ok=True)
+                self.used = sum(f.stat().st_size for d in _scandirs(self.root) for f in os.scandir(d) if f.is_file())
+
+    def _entry(self, path):
+        st = os.stat(path)
+        k = hashlib.sha1(f"{path}\0{st.st_mtime_ns}\0{st.st_size}\0{self.px}".encode("utf-8", "surrogateescape")).hexdigest()
+        return os.path.join(self.root, k[:2], k + ".jpg")
+
+    def get(self, path):
+        """Return thumbnail JPEG bytes for path, generating and storing it on a miss."""
+        entry = self._entry(path)
+        try:
+            with open(entry, "rb") as f:
+                data = f.read()
+            os.utime(entry)  # LRU bump
+            return data
+        except OSError:
+            pass
+        data = make_thumbnail(path, self.px)
+        self.prepare()
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        tmp = f"{entry}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, entry)
+        with self._lock:
+            self.used += len(data)
+            if self.used > self.max_bytes:
+                self._evict()
+        return data
+
+    def _evict(self):
+        files = [f for d in _scandirs(self.root) for f in os.scandir(d) if f.is_file()]
+        files.sort(key=lambda f: f.stat().st_mtime)
+        total = sum(f.stat().st_size for f in files)
+        target = int(self.max_bytes * 0.9)
+        for f in files:
+            if total <= target:
+                break
+            try:
+                size = f.stat().st_size
+                os.remove(f.path)
+                total -= size
+            except OSError:
+                pass
+        self.used = total
+
+def _scandirs(root):
+    return [d.path for d in os.scandir(root) if d.is_dir()] if os.path.isdir(root) else []
@@ -0,0 +1,290 @@
+"""
+Bounded-memory resizing for images too large to decode at once.
+
+The source is decoded in horizontal bands and resampled into the (small) output as the
+bands arrive, so peak memory depends on the source width and the limit, not its height.
+- PNG (non-interlaced, 8-bit): the IDAT stream is inflated incrementally and each band is
+  decoded by Pillow, seeded with the previous band's last row so row filters carry over
+- TIFF (strips or tiles, any compression Pillow reads): each band's strips/tiles are copied
+  into a small in-memory TIFF and decoded on their own
+- JPEG: decoded at the smallest DCT scale (draft) that still covers the target
+Bands are box-reduced towards 2x the target (like thumbnail()'s reducing_gap) and then
+resampled with overlapping rows, so band seams don't show in the result.
+"""
+import io, zlib, struct
+from contextlib import contextmanager
+from PIL import Image, TiffImagePlugin
+
+# filter support in source pixels at scale 1 (Pillow's values)
+_SUPPORT = {Image.NEAREST: 0.5, Image.BOX: 0.5, Image.BILINEAR: 1.0, Image.HAMMING: 1.0,
+            Image.BICUBIC: 2.0, Image.LANCZOS: 3.0}
+# image-structure tags copied into per-band TIFFs (no metadata blobs)
+_TIFF_TAGS = (256, 257, 258, 259, 262, 266, 273, 277, 278, 279, 280, 281, 284, 317, 320, 322, 323, 324, 325,
+              338, 339, 347, 529, 530, 531, 532)
+_PNG_RAWMODES = ("1", "L", "LA", "RGB", "RGBA", "P")
+
+def pixel_bytes(mode):
+    """Bytes Pillow allocates per pixel for mode (3-band images are stored 4 bytes wide)."""
+    if mode in ("1", "L", "P"):
+        return 1
+    if mode.startswith("I;16"):
+        return 2
+    return 4
+
+def decoded_bytes(img):
+    return img.width * img.height * pixel_bytes(img.mode)
+
+@contextmanager
+def no_pixel_limit():
+    # Pillow refuses > MAX_IMAGE_PIXELS (decompression-bomb guard); the memory limit is the guard here.
+    # Changes a module global: only for single-threaded callers such as pool processes.
+    saved = Image.MAX_IMAGE_PIXELS
+    Image.MAX_IMAGE_PIXELS = None
+    try:
+        yield
+    finally:
+        Image.MAX_IMAGE_PIXELS = saved
+
+def process_peak_rss():
+    """High-water mark of this process's resident memory in bytes (Linux), else None."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def target_size(src_size, size, keep_aspect):
+    """Output size convert_resize_compress produces: thumbnail() box fit, or exactly size."""
+    w, h = size
+    if not keep_aspect:
+        return w, h
+    scale = min(w / src_size[0], h / src_size[1], 1.0)
+    return max(1, round(src_size[0] * scale)), max(1, round(src_size[1] * scale))
+
+class _Budget:
+    # tracks the image buffers alive at once (the part of memory that scales with the image)
+    def __init__(self, limit):
+        self.limit, self.peak = limit, 0
+
+    def hold(self, *nbytes):
+        self.peak = max(self.peak, sum(nbytes))
+
+def _vstack(top, bottom):
+    if top is None or not top.height:
+        return bottom
+    out = Image.new(top.mode, (top.width, top.height + bottom.height))
+    out.paste(top, (0, 0)); out.paste(bottom, (0, top.height))
+    return out
+
+# --- band sources: yield full-resolution row bands top to bottom ---
+
+def _png_bands(img, path, rows):
+    rawmode = img.tile[0][3] if img.tile else None
+    if isinstance(rawmode, tuple):
+        rawmode = rawmode[0]
+    if img.format != "PNG" or img.info.get("interlace") or rawmode not in _PNG_RAWMODES or len(img.tile) != 1:
+        return None
+    w = img.width
+    stride = len(Image.new(img.mode, (w, 1)).tobytes("raw", rawmode)) + 1  # filter byte + packed row
+
+    def gen():
+        inflate, buf, prev, y = zlib.decompressobj(), bytearray(), None, 0
+        with open(path, "rb") as f:
+            f.read(8)
+            while y < img.height:
+                head = f.read(8)
+                if len(head) < 8:
+                    raise OSError("truncated PNG")
+                length, ctype = struct.unpack(">I4s", head)
+                if ctype != b"IDAT":
+                    f.seek(length + 4, 1)
+                    continue
+                left = length
+                while left:
+                    data = f.read(min(left, 1 << 16)); left -= len(data)
+                    if not data:
+                        raise OSError("truncated PNG")
+                    while data:
+                        buf += inflate.decompress(data, 1 << 20)  # bounded even for very compressible data
+                        data = inflate.unconsumed_tail
+                        while len(buf) >= rows * stride or (buf and len(buf) >= (img.height - y) * stride):
+                            n = min(rows, img.height - y)
+                            block = bytes(buf[:n * stride]); del buf[:n * stride]
+                            # the previous band's last row, unfiltered, seeds the row filters of this band
+                            seed = b"\0" + prev.tobytes("raw", rawmode) if prev is not None else b""
+                            band = Image.frombytes(img.mode, (w, n + bool(seed)), zlib.compress(seed + block, 0),
+                                                   "zip", rawmode)
+                            if seed:
+                                band = band.crop((0, 1, w, band.height))
+                            if img.mode == "P":
+                                band.putpalette(img.palette.palette, img.palette.rawmode or img.palette.mode)
+                            prev = band.crop((0, n - 1, w, n))
+                            y += n
+                            yield band, len(block) * 2
+                            if y >= img.height:
+                                return
+                f.read(4)  # CRC
+    return gen()
+
+def _tiff_band(tags, width, rows, chunks, tiled, rows_per_strip):
+    ifd = TiffImagePlugin.ImageFileDirectory_v2(prefix=b"II")
+    for k in _TIFF_TAGS:
+        if k in tags and k not in (273, 278, 279, 324, 325):
+            ifd[k] = tags[k]
+            if k in tags.tagtype:
+                ifd.tagtype[k] = tags.tagtype[k]
+    ifd[256], ifd[257] = width, rows
+    rel, o = [], 0
+    for c in chunks:
+        rel.append(o); o += len(c)
+    offs, counts = (324, 325) if tiled else (273, 279)
+    ifd[counts] = tuple(len(c) for c in chunks); ifd.tagtype[counts] = 4
+    ifd[offs] = tuple(rel); ifd.tagtype[offs] = 4
+    if tiled:  # tobytes() only relocates StripOffsets; place tile data after the IFD by hand
+        ifd[offs] = tuple(8 + len(ifd.tobytes(8)) + r for r in rel)
+    else:
+        ifd[278] = rows_per_strip
+    return b"II*\0" + struct.pack("<I", 8) + ifd.tobytes(8) + b"".join(chunks)
+
+def _tiff_bands(img, path, rows):
+    if img.format != "TIFF" or getattr(img, "n_frames", 1) > 1:
+        return None
+    tags = img.tag_v2
+    if tags.get(284, 1) != 1:
+        return None  # separate colour planes
+    w, h = img.size
+    tiled, raw = 324 in tags, tags.get(259, 1) == 1
+    if tiled:
+        tw, tl = tags[322], tags[323]
+        across = -(-w // tw)
+        units = [(min(tl, h - y), [(tags[324][i], tags[325][i]) for i in range(r * across, (r + 1) * across)])
+                 for r, y in enumerate(range(0, h, tl))]
+    else:
+        rps = min(tags.get(278, h), h)
+        units = []
+        for s, (off, cnt) in enumerate(zip(tags[273], tags[279])):
+            n = min(rps, h - s * rps)
+            if raw:  # uncompressed: every row is addressable, even inside one huge strip
+                units += [(1, [(off + r * (cnt // n), cnt // n)]) for r in range(n)]
+            else:
+                units.append((n, [(off, cnt)]))
+    per_band = max(1, rows // units[0][0])
+
+    def gen():
+        with open(path, "rb") as f:
+            for i in range(0, len(units), per_band):
+                group = units[i:i + per_band]
+                chunks = []
+                for _, parts in group:
+                    for off, cnt in parts:
+                        f.seek(off); chunks.append(f.read(cnt))
+                n = sum(u[0] for u in group)
+                if raw and not tiled:
+                    data = _tiff_band(tags, w, n, [b"".join(chunks)], False, n)
+                else:
+                    data = _tiff_band(tags, w, n, chunks, tiled, units[0][0])
+                with Image.open(io.BytesIO(data)) as band:
+                    band.load()
+                    band = band.copy()
+                yield band, len(data)
+    return gen()
+
+# --- streaming resample ---
+
+def _working(band, info):
+    # modes reduce()/resize() can't average, converted the way convert_resize_compress would see them
+    if "transparency" in info:
+        band.info["transparency"] = info["transparency"]
+    if band.mode == "P":
+        return band.convert("RGBA" if "transparency" in info else "RGB")
+    if band.mode == "1":
+        return band.convert("L")
+    if band.mode.startswith("I;16"):
+        return band.convert("I")
+    return band
+
+def _resample(bands, src_size, out_size, resample, budget):
+    sw, sh = src_size
+    tw, th = out_size
+    # box-reduce towards 2x the target first, like thumbnail()'s reducing_gap=2.0
+    fx, fy = max(1, sw // (tw * 2)), max(1, sh // (th * 2))
+    rw, rh = sw / fx, sh / fy            # extent of the reduced image (float, as Pillow's reducing_gap uses)
+    scale = rh / th
+    margin = _SUPPORT.get(resample, 3.0) * max(scale, 1.0) + 2
+    out, window, wy0, oy, carry = None, None, 0, 0, None
+    for band, last, extra in bands:
+        # reduce() needs whole fy-row groups; hold back the remainder for the next band
+        band = _vstack(carry, band)
+        keep = band.height if last else band.height // fy * fy
+        carry = band.crop((0, keep, band.width, band.height)) if keep < band.height else None
+        band = band.crop((0, 0, band.width, keep)) if keep < band.height else band
+        if band.height:
+            small = band.reduce((fx, fy)) if fx > 1 or fy > 1 else band
+            window = _vstack(window, small)
+        if window is None:
+            continue
+        if out is None:
+            out = Image.new(window.mode, (tw, th))
+        budget.hold(extra, pixel_bytes(band.mode) * band.width * band.height,
+                    decoded_bytes(window), decoded_bytes(out))
+        wy1 = wy0 + window.height
+        oy1 = th if last else min(th, int((wy1 - margin) / scale))
+        if oy1 > oy:
+            box = (0, oy * scale - wy0, rw, min(oy1 * scale - wy0, window.height))
+            out.paste(window.resize((tw, oy1 - oy), resample, box=box), (0, oy))
+            oy = oy1
+        drop = max(0, int(oy * scale - margin) - wy0)
+        if drop:
+            window = window.crop((0, drop, window.width, window.height)); wy0 += drop
+    return out
+
+def resize_bounded(img, path, size, keep_aspect, limit, report=None):
+    """
+    Return img resized like convert_resize_compress would (thumbnail box fit, or exact size),
+    holding at most about `limit` bytes of image data at once. img must be freshly opened
+    (not loaded). report["memory"] gets the limit, the peak held, how it was processed and
+    the process's resident high-water mark.
+    Raises MemoryError if the image can't be processed within the limit.
+    """
+    info = dict(img.info)
+    out_size = target_size(img.size, size, keep_aspect) if size else img.size
+    resample = Image.BICUBIC  # what thumbnail() and resize() default to, i.e. convert_resize_compress's filter
+    budget, how = _Budget(limit), "full"
+    if img.format == "JPEG":
+        img.draft(img.mode, out_size)  # smallest DCT scale that still covers the target
+    full = decoded_bytes(img)
+    if full <= limit:
+        budget.hold(full)
+        img = _working(img, info)
+        if out_size != img.size:
+            img = img.resize(out_size, resample, reducing_gap=2.0)
+    elif out_size == img.size:
+        raise MemoryError(f"{img.width}x{img.height} needs ~{full >> 20} MB decoded, over the "
+                          f"{limit >> 20} MB limit; set a target size to process it in strips")
+    else:
+        # rows per band: a band is decoded at full width, next to its compressed input and its working copy
+        row_cost = img.width * (pixel_bytes(img.mode) * 3 + (4 if img.mode in ("P", "1") else 0))
+        reserve = out_size[0] * out_size[1] * 4 * 2
+        rows = max(1, (limit - reserve) // row_cost)
+        bands = _png_bands(img, path, rows) or _tiff_bands(img, path, rows)
+        if bands is None:
+            raise MemoryError(f"{img.format} {img.width}x{img.height} needs ~{full >> 20} MB decoded, over the "
+                              f"{limit >> 20} MB limit, and can't be decoded in strips")
+
+        def tagged():
+            done, prev = 0, None
+            for band, extra in bands:
+                if prev is not None:
+                    yield prev[0], False, prev[1]
+                done += band.height
+                prev = (_working(band, info), extra)
+            yield prev[0], True, prev[1]
+        img = _resample(tagged(), img.size, out_size, resample, budget)
+        how = "strips"
+    if report is not None:
+        report["memory"] = {"limit": limit, "peak": budget.peak, "decoded": full, "mode": how,
+                            "rss_peak": process_peak_rss()}
+    return img
@@ -0,0 +1,416 @@
+"""
+Headless entry point: `python -m utilitytool <command> ...`
+
+Everything here works without PyQt5 or a display. Results are written to stdout
+as JSON lines, one object per event, so the output can be piped into jq or a log.
+The same functions are importable for use from other Python code:
+
+    import utilitytool
+    for r in utilitytool.convert(["photos/"], fmt="WEBP", preset="Instagram Post (1080×1080 px)"):
+        ...
+"""
+import sys, os, re, json, time, argparse
+from rename_plan import RenameConflictError
+from file_utils import iter_files, IMAGE_EXTS, batch_preview, apply_renames, undo_last_rename, find_duplicates, apply_dedupe
+
+def resolve_preset(name):
+    """Return the STANDARD_SIZES key matching name exactly or as a unique case-insensitive substring."""
+    from image_utils import STANDARD_SIZES
+    if name in STANDARD_SIZES:
+        return name
+    hits = [k for k in STANDARD_SIZES if name.lower() in k.lower()]
+    if len(hits) != 1:
+        raise ValueError(f"preset {name!r} matches {len(hits)} sizes; run 'sizes' to list them")
+    return hits[0]
+
+def parse_size(text):
+    w, _, h = text.lower().partition("x")
+    return int(w), int(h)
+
+def parse_color(text):
+    from color import parse_color
+    try:
+        return parse_color(text)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def parse_target(text):
+    """'SIZE:FORMAT[:QUALITY]' -> image_utils.Target; SIZE is WxH, a preset (or unique part of one) or 'full'."""
+    from image_utils import Target, target_dims_from_preset
+    parts = text.split(":")
+    quality = int(parts.pop()) if len(parts) > 2 and parts[-1].isdigit() else 85
+    if len(parts) != 2:
+        raise argparse.ArgumentTypeError(f"expected SIZE:FORMAT[:QUALITY], got {text!r}")
+    size, fmt = parts
+    if size.lower() == "full":
+        size = None
+    elif re.fullmatch(r"\d+[xX]\d+", size):
+        size = parse_size(size)
+    else:
+        try:
+            size = target_dims_from_preset(resolve_preset(size))
+        except ValueError as e:
+            raise argparse.ArgumentTypeError(str(e))
+    return Target(size, fmt.upper(), quality)
+
+def convert(patterns, fmt="JPEG", size=None, preset=None, keep_aspect=True, quality=85,
+            outdir=None, workers=None, recursive=False, fast_downscale=None, max_bytes=None, allow_downscale=False,
+            incremental=False, hash_content=False, max_memory=None, ordered=True, engine=None, targets=None,
+            preserve_exif=False, passthrough=True, profile="sRGB", background=(255, 255, 255)):
+    """
+    Yield a BatchResult per discovered image, in discovery order (or as finished with ordered=False).
+    Pass engine (a BatchEngine) to choose workers/memory budget or read its .schedule afterwards.
+    targets ([image_utils.Target, ...]) writes all of them from one decode per image instead of
+    the single fmt/size/quality output. Images that already match the output are copied rather
+    than re-encoded unless passthrough is False (info["output"] says what happened).
+    profile ("sRGB", "keep" or an ICC file) and background (r, g, b) are described in color.py.
+    An outdir ending in .zip, .tar, .tar.gz/.tgz, .tar.bz2 or .tar.xz is written as that archive
+    (see archive.py); out paths are then "<archive>/<member>".
+    """
+    from batch_engine import BatchEngine
+    from image_utils import target_dims_from_preset, BUDGET_FORMATS
+    from archive import is_archive
+    if max_bytes and fmt.upper() not in BUDGET_FORMATS:
+        raise ValueError(f"a max size needs {' or '.join(BUDGET_FORMATS)} output")
+    if preset:
+        size = target_dims_from_preset(resolve_preset(preset))
+    archive = outdir if is_archive(outdir) else None
+    if outdir and not archive:
+        os.makedirs(outdir, exist_ok=True)
+    files = iter_files(patterns, exts=IMAGE_EXTS, recursive=recursive)
+    engine = engine or BatchEngine(workers)
+    yield from engine.run(files, fmt=fmt, size=size, keep_aspect=keep_aspect, archive=archive,
+                          quality=quality, outdir=None if archive else outdir, fast_downscale=fast_downscale,
+                          max_bytes=max_bytes, allow_downscale=allow_downscale,
+                          incremental=incremental, hash_content=hash_content,
+                          max_memory=max_memory, ordered=ordered, targets=targets,
+                          preserve_exif=preserve_exif, passthrough=passthrough, profile=profile,
+                          background=tuple(background))
+
+def estimate(patterns, fmt="JPEG", quality=85, subsampling="keep", recursive=False, fast=False):
+    """Yield (path, estimated_bytes, ratio_vs_original) per discovered image."""
+    from estimator import shared_estimator
+    files = iter_files(patterns, exts=IMAGE_EXTS, recursive=recursive)
+    yield from shared_estimator().estimate_many(files, fmt=fmt, quality=quality, subsampling=subsampling, fast=fast)
+
+def rename(patterns, apply=False, recursive=False, **options):
+    """Return [(old, new), ...] for the discovered files; renames on disk only if apply is True."""
+    paths = list(iter_files(patterns, recursive=recursive))
+    previews = batch_preview(paths, **options)
+    if apply:
+        apply_renames(paths, previews)
+    return list(zip(paths, previews))
+
+# --- command line ---
+
+def _emit(obj):
+    sys.stdout.write(json.dumps(obj, ensure_ascii=False) + "\n")
+    sys.stdout.flush()
+
+def _cmd_convert(a):
+    from batch_stats import BatchStats
+    from batch_engine import BatchEngine
+    t0, done, failed, probes, skipped = time.time(), 0, 0, 0, 0
+    stats = BatchStats()
+    engine = BatchEngine(a.workers, budget_mp=a.budget_mp, pipeline=a.pipeline, read_ahead=a.read_ahead,
+                         write_behind=a.write_behind, io_threads=a.io_threads)
+    for r in convert(a.paths, fmt=a.format, size=a.size, preset=a.preset, keep_aspect=not a.exact,
+                     quality=a.quality, outdir=a.outdir, workers=a.workers, recursive=a.recursive,
+                     fast_downscale=a.fast_downscale, max_bytes=a.max_kb and a.max_kb * 1024,
+                     allow_downscale=a.allow_downscale, incremental=a.incremental, hash_content=a.hash,
+                     max_memory=a.max_memory and a.max_memory << 20, ordered=not a.as_completed, engine=engine,
+                     targets=a.target, preserve_exif=a.keep_exif, passthrough=not a.always_reencode,
+                     profile=a.profile, background=a.background):
+        done += 1
+        failed += bool(r.error)
+        stats.add(r)
+        event = {"event": "result", "done": done, "path": r.path, "out": r.out_path, "error": r.error}
+        if r.info:
+            event.update(r.info)
+            skipped += bool(r.info.get("skipped"))
+            probes += r.info.get("budget", {}).get("probes", 0)
+        _emit(event)
+    summary = {"event": "summary", "total": done, "failed": failed, "seconds": round(time.time() - t0, 3)}
+    if a.max_kb:
+        summary["probes"] = probes
+    if a.incremental:
+        summary["skipped"] = skipped
+    if a.outdir and os.path.isfile(a.outdir):  # written as an archive
+        summary["archive"], summary["archive_bytes"] = a.outdir, os.path.getsize(a.outdir)
+    stats.schedule, stats.pipeline = engine.schedule, engine.pipeline
+    report = stats.report()
+    summary["schedule"] = report.get("schedule")
+    if "pipeline" in report:
+        summary["pipeline"] = report["pipeline"]
+    summary["outputs"] = report["outputs"]
+    summary["stages"] = {s: v["total"] for s, v in report["stages"].items()}
+    if "memory" in report:
+        summary["memory"] = report["memory"]
+    if a.report:
+        summary["report"] = stats.write(a.report)
+    _emit(summary)
+    return 1 if failed else 0
+
+def _cmd_estimate(a):
+    subsampling = a.subsampling if a.subsampling == "keep" else int(a.subsampling)
+    for path, est, ratio in estimate(a.paths, fmt=a.format, quality=a.quality,
+                                     subsampling=subsampling, recursive=a.recursive, fast=a.fast):
+        _emit({"event": "estimate", "path": path, "bytes": est, "ratio": ratio})
+    return 0
+
+def _cmd_rename(a):
+    pairs = rename(a.paths, apply=a.apply, recursive=a.recursive, prefix=a.prefix, suffix=a.suffix,
+                   start=a.start, pad=a.pad, date_source=a.date_source, regex_find=a.find,
+                   regex_replace=a.replace, case=a.case, numbering=a.numbering)
+    for old, new in pairs:
+        _emit({"event": "rename", "from": old, "to": new, "applied": a.apply})
+    return 0
+
+def _cmd_duplicates(a):
+    from duplicates import choose_keeper
+    groups, stats, stamps = find_duplicates(iter_files(a.paths, recursive=a.recursive), cache=not a.no_cache,
+                                            threads=a.threads)
+    for g in groups:
+        keeper = choose_keeper(g.paths, a.keep, stamps)
+        _emit({"event": "duplicates", "size": g.size, "hash": g.digest, "keep": keeper,
+               "duplicates": [p for p in g.paths if p != keeper]})
+    summary = dict({"event": "summary"}, **stats)
+    if a.action:
+        summary["batch"], summary["acted"] = apply_dedupe(groups, a.action, keep=a.keep, folder=a.to, stamps=stamps)
+        summary["action"] = a.action
+    _emit(summary)
+    return 0
+
+def _cmd_similar(a):
+    from similar import SimilarFinder
+    from filecache import FileCache
+    cache = None if a.no_cache else FileCache()
+    finder = SimilarFinder(cache, threads=a.threads)
+    try:
+        groups = finder.run(list(iter_files(a.paths, exts=IMAGE_EXTS, recursive=a.recursive)), a.max_distance, a.hash)
+    finally:
+        if cache:
+            cache.close()
+    for g in groups:
+        _emit({"event": "similar", "paths": g.paths, "max_distance": g.max_distance})
+    _emit(dict({"event": "summary"}, **finder.stats))
+    return 0
+
+def _cmd_montage(a):
+    from image_utils import contact_sheets
+    files = list(iter_files(a.paths, exts=IMAGE_EXTS, recursive=a.recursive))
+    if not files:
+        raise ValueError("no images found")
+    tiles = contact_sheets(files, a.out, cols=a.cols, rows=a.rows or None, tile=a.tile, gap=a.gap,
+                           caption=not a.no_captions, background=a.background, quality=a.quality, threads=a.threads)
+    sheets = {}
+    for t in tiles:
+        sheets.setdefault(t.sheet, []).append({"path": t.path, "box": t.box})
+    for sheet, items in sheets.items():
+        _emit({"event": "sheet", "path": sheet, "tiles": items})
+    _emit({"event": "summary", "sheets": len(sheets), "images": len(tiles),
+           "unreadable": sum(t.box is None for t in tiles)})
+    return 0
+
+def _cmd_watch(a):
+    import threading
+    from watcher import HotFolder
+    from config import load_settings, load_presets
+    from image_utils import target_dims_from_preset
+    from color import parse_color
+    settings = load_settings()
+    fmt, quality = settings.get("default_format", "JPEG"), settings.get("default_quality", 85)
+    if a.preset:
+        presets = load_presets()
+        if a.preset not in presets:
+            raise ValueError(f"no saved preset {a.preset!r}; saved: {', '.join(presets) or 'none'}")
+        fmt = presets[a.preset].get("default_format", fmt); quality = presets[a.preset].get("default_quality", quality)
+    size = a.size or (target_dims_from_preset(resolve_preset(a.size_preset)) if a.size_preset else None)
+    lock = threading.Lock()
+
+    def on_result(r, latency):
+        event = {"event": "result", "path": r.path, "out": r.out_path, "error": r.error, "latency": round(latency, 3)}
+        if r.info:
+            event["output"] = r.info.get("output")
+            event["skipped"] = bool(r.info.get("skipped"))
+        with lock:
+            _emit(event)
+    service = HotFolder(a.folder, a.outdir, fmt=a.format or fmt, workers=a.workers, settle=a.settle,
+                        recursive=a.recursive, mode="poll" if a.poll else None, interval=a.interval, on_result=on_result,
+                        size=size, quality=a.quality or quality, preserve_exif=settings.get("preserve_exif", False),
+                        profile=settings.get("color_profile", "sRGB"), background=parse_color(settings.get("background", "#ffffff")))
+    thread = threading.Thread(target=service.run, daemon=True)
+    thread.start()
+    with lock:
+        _emit({"event": "watching", "folder": service.folder, "outdir": service.outdir, "mode": service.mode,
+               "format": service.fmt, "quality": a.quality or quality, "size": size})
+    try:
+        while thread.is_alive():
+            thread.join(a.stats_every or None)
+            if a.stats_every and thread.is_alive():
+                with lock:
+                    _emit(dict({"event": "stats"}, **service.stats()))
+    except KeyboardInterrupt:
+        service.stop()
+        thread.join()
+    _emit(dict({"event": "summary"}, **service.stats()))
+    return 0
+
+def _cmd_undo(a):
+    res = undo_last_rename()
+    if res is None:
+        _emit({"event": "undo", "batch": None})
+        return 0
+    batch, steps, failed = res
+    _emit({"event": "undo", "batch": batch, "steps": steps, "failed": [list(p) for p in failed]})
+    return 1 if failed else 0
+
+def _cmd_sizes(a):
+    from image_utils import STANDARD_SIZES, target_dims_from_preset
+    for name in STANDARD_SIZES:
+        _emit({"event": "size", "name": name, "px": target_dims_from_preset(name)})
+    return 0
+
+def build_parser():
+    p = argparse.ArgumentParser(prog="utilitytool", description="Batch image and file tools without the GUI.")
+    sub = p.add_subparsers(dest="command", required=True)
+
+    def add_inputs(sp):
+        sp.add_argument("paths", nargs="+", help="files, directories or glob patterns (quote '**' globs)")
+        sp.add_argument("-r", "--recursive", action="store_true", help="descend into sub-directories")
+
+    c = sub.add_parser("convert", help="convert / resize / compress images")
+    add_inputs(c)
+    c.add_argument("-f", "--format", default="JPEG", type=str.upper, choices=["JPEG", "PNG", "WEBP", "TIFF", "BMP"])
+    c.add_argument("-q", "--quality", type=int, default=85)
+    g = c.add_mutually_exclusive_group()
+    g.add_argument("--size", type=parse_size, help="target box in px, e.g. 1920x1080")
+    g.add_argument("--preset", help="a STANDARD_SIZES name (or unique part of it)")
+    c.add_argument("-t", "--target", action="append", type=parse_target, metavar="SIZE:FORMAT[:Q]",
+                   help="write this output too, e.g. 1920x1080:JPEG:85, 'Instagram:WEBP:80', full:PNG; "
+                        "repeat for more (one decode per image; replaces --format/--size/--preset/--quality)")
+    c.add_argument("--exact", action="store_true", help="resize to exactly --size instead of fitting inside it")
+    c.add_argument("--fast-downscale", type=float, metavar="GAP",
+                   help="shrink on load, keeping GAP× the target size before resampling (2 = sharp, 1 = fastest)")
+    c.add_argument("--max-kb", type=int, help="JPEG/WEBP: search quality so each output is at most this many KB")
+    c.add_argument("--allow-downscale", action="store_true", help="with --max-kb, also shrink images that can't fit")
+    c.add_argument("-i", "--incremental", action="store_true",
+                   help="skip outputs that are up to date (per-folder manifest); re-running resumes an interrupted batch")
+    c.add_argument("--hash", action="store_true", help="with -i, also compare content hashes of touched sources")
+    c.add_argument("--max-memory", type=int, metavar="MB",
+                   help="per worker: decode larger images in strips so at most this much image data is held")
+    c.add_argument("--budget-mp", type=float, metavar="MP",
+                   help="decoded megapixels allowed in flight across workers (default: half the RAM)")
+    c.add_argument("--keep-exif", action="store_true", help="keep the EXIF block (default: only the orientation tag)")
+    c.add_argument("--profile", default="sRGB", help="colour: sRGB (convert embedded ICC profiles; default), keep "
+                   "(embed them unchanged) or the path of an ICC profile to convert to")
+    c.add_argument("--background", type=parse_color, default=(255, 255, 255), metavar="RRGGBB",
+                   help="colour transparent areas are flattened onto for JPEG (default ffffff)")
+    c.add_argument("--always-reencode", action="store_true",
+                   help="re-encode even images that already match the output (by default they are copied)")
+    c.add_argument("--as-completed", action="store_true", help="print results as they finish (largest files first)")
+    c.add_argument("--pipeline", action="store_true",
+                   help="overlap reading and writing with conversion (helps on network shares / USB disks)")
+    c.add_argument("--read-ahead", type=int, default=8, metavar="N", help="with --pipeline: tasks prefetched ahead (default 8)")
+    c.add_argument("--write-behind", type=int, default=8, metavar="N",
+                   help="with --pipeline: encoded tasks allowed to wait for the writer (default 8)")
+    c.add_argument("--io-threads", type=int, default=4, metavar="N", help="with --pipeline: reader and writer threads each (default 4)")
+    c.add_argument("-o", "--outdir", help="output folder (default: next to each source), or an archive to write "
+                   "everything into: .zip, .tar, .tar.gz, .tar.bz2, .tar.xz")
+    c.add_argument("-j", "--workers", type=int, help="worker processes (default: CPU count - 1)")
+    c.add_argument("--report", metavar="JSON", help="write per-stage timings, percentiles and the slowest files here")
+    c.set_defaults(func=_cmd_convert)
+
+    e = sub.add_parser("estimate", help="estimate compressed output sizes")
+    add_inputs(e)
+    e.add_argument("-f", "--format", default="JPEG", type=str.upper)
+    e.add_argument("-q", "--quality", type=int, default=85)
+    e.add_argument("--subsampling", default="keep", choices=["keep", "0", "1", "2"])
+    e.add_argument("--fast", action="store_true", help="encode sampled tiles and extrapolate (≈5%% accuracy)")
+    e.set_defaults(func=_cmd_estimate)
+
+    n = sub.add_parser("rename", help="batch rename (dry run unless --apply)")
+    add_inputs(n)
+    n.add_argument("--prefix", default="", help="tokens: {date} {num} {exif_date} {width} {height} {camera}")
+    n.add_argument("--suffix", default="", help="same tokens as --prefix")
+    n.add_argument("--start", type=int, default=1)
+    n.add_argument("--pad", type=int, default=2)
+    n.add_argument("--date-source", default="now", choices=["now", "file_modified"])
+    n.add_argument("--find", help="regex applied to the file stem")
+    n.add_argument("--replace", help="replacement for --find")
+    n.add_argument("--case", default="none", choices=["none", "lower", "upper", "title"])
+    n.add_argument("--numbering", action="store_true", help="fill the {num} token")
+    n.add_argument("--apply", action="store_true", help="actually rename files")
+    n.set_defaults(func=_cmd_rename)
+
+    d = sub.add_parser("duplicates", help="find files with identical content (report only unless --action)")
+    add_inputs(d)
+    d.add_argument("--keep", default="oldest", choices=["oldest", "newest", "shortest path", "first listed"],
+                   help="which file of each group stays")
+    d.add_argument("--action", choices=["delete", "link", "move"], help="delete the others, hard-link them to the kept "
+                   "file, or move them (--to); undo-rename reverses it")
+    d.add_argument("--to", help="target folder for --action move")
+    d.add_argument("-j", "--threads", type=int, default=8, help="hashing threads (default 8)")
+    d.add_argument("--no-cache", action="store_true", help="don't read or store hashes in the cache")
+    d.set_defaults(func=_cmd_duplicates)
+
+    m = sub.add_parser("similar", help="group visually near-identical images (perceptual hashes; needs NumPy)")
+    add_inputs(m)
+    m.add_argument("-k", "--max-distance", type=int, default=6, help="max differing hash bits of 64, 0-14 (default 6)")
+    m.add_argument("--hash", default="phash", choices=["ahash", "dhash", "phash"])
+    m.add_argument("-j", "--threads", type=int, default=4, help="decoding threads (default 4)")
+    m.add_argument("--no-cache", action="store_true", help="don't read or store hashes in the cache")
+    m.set_defaults(func=_cmd_similar)
+
+    t = sub.add_parser("montage", help="contact sheets / sprite sheets: images in a grid with their names")
+    add_inputs(t)
+    t.add_argument("-o", "--out", required=True, help="sheet file; several pages become NAME_001.EXT, NAME_002.EXT…")
+    t.add_argument("--cols", type=int, default=6)
+    t.add_argument("--rows", type=int, default=5, help="rows per sheet (0: everything on one sheet)")
+    t.add_argument("--tile", type=parse_size, default=(240, 240), help="tile box in px (default 240x240)")
+    t.add_argument("--gap", type=int, default=8, help="px between tiles (default 8)")
+    t.add_argument("--no-captions", action="store_true", help="no file names (with --gap 0: a sprite sheet)")
+    t.add_argument("--background", type=parse_color, default=(255, 255, 255), metavar="RRGGBB", help="default ffffff")
+    t.add_argument("-q", "--quality", type=int, default=85)
+    t.add_argument("-j", "--threads", type=int, default=4, help="decoding threads (default 4)")
+    t.set_defaults(func=_cmd_montage)
+
+    w = sub.add_parser("watch", help="convert images as they arrive in a folder (hot folder), until Ctrl+C")
+    w.add_argument("folder")
+    w.add_argument("-o", "--outdir", required=True, help="output folder (may be inside the watched folder)")
+    w.add_argument("-r", "--recursive", action="store_true", help="watch sub-folders too")
+    w.add_argument("--preset", help="a preset saved in the app's Home tab (format + quality; default: the Home defaults)")
+    w.add_argument("-f", "--format", type=str.upper, choices=["JPEG", "PNG", "WEBP", "TIFF", "BMP"], help="overrides the preset")
+    w.add_argument("-q", "--quality", type=int, help="overrides the preset")
+    g = w.add_mutually_exclusive_group()
+    g.add_argument("--size", type=parse_size, help="target box in px, e.g. 1920x1080")
+    g.add_argument("--size-preset", help="a STANDARD_SIZES name (or unique part of it)")
+    w.add_argument("--settle", type=float, default=2.0, help="seconds a file must stay unchanged before it is converted (default 2)")
+    w.add_argument("--poll", action="store_true", help="poll instead of inotify (automatic on network shares and off Linux)")
+    w.add_argument("--interval", type=float, default=2.0, help="seconds between polls (default 2)")
+    w.add_argument("-j", "--workers", type=int, help="worker processes (default: CPU count - 1)")
+    w.add_argument("--stats-every", type=float, default=60, metavar="S", help="print queue / latency stats every S seconds (0: never)")
+    w.set_defaults(func=_cmd_watch)
+
+    u = sub.add_parser("undo-rename", help="reverse the most recent applied rename (or duplicates) batch")
+    u.set_defaults(func=_cmd_undo)
+
+    s = sub.add_parser("sizes", help="list the standard size presets")
+    s.set_defaults(func=_cmd_sizes)
+    return p
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func(args)
+    except RenameConflictError as e:
+        for kind, path, detail in e.conflicts:
+            _emit({"event": "conflict", "kind": kind, "path": path, "detail": detail})
+        print(f"utilitytool: error: nothing renamed, {len(e.conflicts)} conflicts", file=sys.stderr)
+        return 2
+    except ValueError as e:
+        print(f"utilitytool: error: {e}", file=sys.stderr)
+        return 2
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,344 @@
+"""
+Hot-folder service: converts images as they arrive in a folder, until stopped.
+
+- change detection: inotify (Linux, through ctypes) reports files as they are closed or
+  moved in, and new sub-folders are watched as they appear; elsewhere, on network file
+  systems (where inotify misses other machines' writes) and after an inotify queue
+  overflow, folders are polled, and only folders whose mtime changed are listed again
+- a file is converted once its size and mtime have stayed the same for `settle` seconds,
+  so half-copied files are never picked up
+- ready files go to a process pool through batch_engine's task runner, in groups when a
+  burst arrives; outputs and the manifest are those of an incremental BatchEngine run, so
+  a restarted service skips what it already did
+- idle cost: with inotify the loop sleeps in select() until something happens; polling
+  wakes every `interval` seconds to stat the folders
+stats() gives queue depths and latency (first seen -> output written) at any time.
+"""
+import os, sys, time, errno, select, signal, socket, struct, threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from batch_engine import BatchResult, default_workers, output_path_for, pool_context, _run_task
+from manifest import ManifestSet, params_digest
+from file_utils import IMAGE_EXTS
+
+REMOTE_FS = ("cifs", "smb3", "smbfs", "nfs", "nfs4", "fuse.sshfs", "9p", "afpfs", "davfs")
+GROUP_FILES = 16  # files per pool task while a backlog is queued
+
+# inotify(7)
+IN_CLOSE_WRITE, IN_MOVED_TO, IN_CREATE = 0x8, 0x80, 0x100
+IN_DELETE_SELF, IN_MOVE_SELF, IN_Q_OVERFLOW, IN_IGNORED, IN_ISDIR = 0x400, 0x800, 0x4000, 0x8000, 0x40000000
+IN_NONBLOCK, IN_CLOEXEC = 0o4000, 0o2000000
+_EVENT = struct.Struct("iIII")
+_WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE_SELF | IN_MOVE_SELF
+
+def _mount_type(path):
+    # file system type of the mount holding path (Linux), or None
+    try:
+        with open("/proc/self/mounts", "r") as f:
+            mounts = [line.split()[1:3] for line in f]
+    except OSError:
+        return None
+    path = os.path.realpath(path)
+    best = max((m for m in mounts if path == m[0] or path.startswith(m[0].rstrip("/") + "/")),
+               key=lambda m: len(m[0]), default=None)
+    return best and best[1]
+
+def _ignore_sigint():
+    # pool processes: Ctrl+C is for the service, which then shuts the pool down itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+class _Inotify:
+    # Thin ctypes wrapper: add(dir) and read() -> [(dir, name, mask), ...]
+    def __init__(self):
+        import ctypes
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.dirs = {}  # wd -> dir
+
+    def add(self, path):
+        import ctypes
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), _WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {path}")
+        self.dirs[wd] = path
+
+    def read(self):
+        out = []
+        while True:
+            try:
+                buf = os.read(self.fd, 256 * 1024)
+            except BlockingIOError:
+                return out
+            pos = 0
+            while pos + _EVENT.size <= len(buf):
+                wd, mask, _, n = _EVENT.unpack_from(buf, pos)
+                name = os.fsdecode(buf[pos + _EVENT.size:pos + _EVENT.size + n].rstrip(b"\0"))
+                pos += _EVENT.size + n
+                if mask & IN_IGNORED:
+                    self.dirs.pop(wd, None)
+                elif wd in self.dirs or mask & IN_Q_OVERFLOW:
+                    out.append((self.dirs.get(wd), name, mask))
+
+    def close(self):
+        os.close(self.fd)
+
+class HotFolder:
+    """
+    Watches folder (and its sub-folders with recursive) and converts every image that
+    arrives or changes into outdir, mirroring the sub-folders (a/b/x.jpg -> outdir/a/b/x_out.jpg).
+    outdir may sit inside folder (it is not watched) but not be folder itself (ValueError).
+    - options: as for BatchEngine.run / convert_resize_compress (size, quality, ...)
+    - settle: seconds a file's size and mtime must stay put before it is converted
+    - mode: "inotify", "poll" or None to pick (inotify on local Linux file systems)
+    - on_result(BatchResult, latency_seconds) is called from the service thread
+    - start_method: as for BatchEngine ("spawn" when run from the GUI)
+    run() blocks until stop() (from any thread).
+    """
+    def __init__(self, folder, outdir, fmt="JPEG", workers=None, settle=2.0, recursive=True, mode=None,
+                 interval=2.0, full_every=30, on_result=None, start_method=None, **options):
+        self.folder, self.outdir, self.fmt = os.path.abspath(folder), os.path.abspath(outdir), fmt
+        if os.path.normcase(self.folder) == os.path.normcase(self.outdir):
+            raise ValueError("the output folder must not be the watched folder itself")
+        self.workers = max(1, int(workers or default_workers()))
+        self.settle, self.recursive, self.interval, self.full_every = settle, recursive, interval, full_every
+        self.options, self.on_result, self.start_method = options, on_result, start_method
+        self.mode = mode or ("inotify" if sys.platform.startswith("linux") and _mount_type(folder) not in REMOTE_FS
+                             else "poll")
+        self.digest = params_digest(dict(options, fmt=fmt.upper()))
+        self._stop = threading.Event()
+        self._wake_r, self._wake_w = socket.socketpair()  # select()-able on every platform
+        self._wake_r.setblocking(False)
+        self._lock = threading.Lock()
+        self.dirs = {}         # dir -> mtime_ns (what polling compares against)
+        self.known = {}        # path -> (size, mtime_ns) of the version last queued or done
+        self.settling = {}     # path -> [size, mtime_ns, unchanged since, first seen]
+        self.ready = deque()   # (path, stat, first seen)
+        self.inflight = {}     # future -> [(path, stat, first seen), ...]
+        self.latencies = deque(maxlen=2000)
+        self.counts = {"detected": 0, "converted": 0, "failed": 0, "skipped": 0, "events": 0, "overflows": 0}
+        self.started = None
+        self._inotify = None
+        self._made = set()     # output sub-folders already created
+
+    def stop(self):
+        self._stop.set()
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b"x")
+        except OSError:
+            pass  # buffer full: a wake-up is pending anyway
+
+    def stats(self):
+        """Snapshot: queue depths, totals and latency percentiles in seconds."""
+        with self._lock:
+            lat = sorted(self.latencies)
+            pct = lambda p: round(lat[min(len(lat) - 1, int(p / 100 * len(lat)))], 3) if lat else None
+            return dict(self.counts, mode=self.mode, watched_dirs=len(self.dirs), settling=len(self.settling),
+                        queued=len(self.ready), in_flight=sum(len(j) for j in self.inflight.values()),
+                        latency_p50=pct(50), latency_p95=pct(95), latency_max=round(lat[-1], 3) if lat else None,
+                        uptime=round(time.monotonic() - self.started, 1) if self.started else 0.0)
+
+    # --- detection ---
+
+    def _wanted(self, path):
+        name = os.path.basename(path)
+        return not name.startswith(".") and os.path.splitext(name)[1].lower() in IMAGE_EXTS \
+            and not path.startswith(self.outdir + os.sep)
+
+    def _seen(self, path, now):
+        # a created / written / moved-in file: (re)start its settle timer
+        if path not in self.settling and self._wanted(path):
+            self.settling[path] = [-1, -1, now, now]
+            self.counts["detected"] += 1
+
+    def _scan_dir(self, d, now=None):
+        # list d: new or changed files start settling; sub-folders are scanned (and watched) too
+        now = now or time.monotonic()
+        stack = [d]
+        while stack:
+            d = stack.pop()
+            try:
+                new = d not in self.dirs
+                self.dirs[d] = os.stat(d).st_mtime_ns
+                if new and self._inotify:
+                    self._inotify.add(d)
+                with os.scandir(d) as it:
+                    for e in it:
+                        if e.is_dir(follow_symlinks=False):
+                            if self.recursive and e.path != self.outdir:
+                                stack.append(e.path)
+                        elif self._wanted(e.path):
+                            try:
+                                st = e.stat()
+                            except OSError:
+                                continue
+                            if self.known.get(e.path) != (st.st_size, st.st_mtime_ns):
+                                self._seen(e.path, now)
+            except OSError as err:
+                self.dirs.pop(d, None)
+                if err.errno == errno.ENOSPC:  # out of inotify watches: fall back to polling
+                    raise
+
+    def _poll(self, full=False):
+        # listing only folders whose mtime moved finds new, renamed and deleted files; rewrites
+        # in place are found by the full pass every full_every polls
+        now = time.monotonic()
+        for d, mtime in list(self.dirs.items()):
+            try:
+                changed = os.stat(d).st_mtime_ns != mtime
+            except OSError:
+                self.dirs.pop(d, None); continue
+            if changed or full:
+                self._scan_dir(d, now=now)
+
+    # --- settling and conversion ---
+
+    def _settle(self, now):
+        for path, s in list(self.settling.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self.settling[path]; continue
+            if (st.st_size, st.st_mtime_ns) != (s[0], s[1]):
+                s[0], s[1], s[2] = st.st_size, st.st_mtime_ns, now
+            elif now - s[2] >= self.settle:
+                del self.settling[path]
+                if self.known.get(path) != (st.st_size, st.st_mtime_ns):  # e.g. opened for writing, left as it was
+                    self.known[path] = (st.st_size, st.st_mtime_ns)
+                    self.ready.append((path, st, s[3]))
+
+    def _out_dir(self, path):
+        # outdir, plus path's folder relative to the watched one; created on first use
+        d = os.path.normpath(os.path.join(self.outdir, os.path.relpath(os.path.dirname(path), self.folder)))
+        if d not in self._made:
+            try:
+                os.makedirs(d, exist_ok=True)
+            except OSError:
+                pass  # the job reports it
+            self._made.add(d)
+        return d
+
+    def _submit(self, pool, manifests):
+        while self.ready and len(self.inflight) < self.workers * 2:
+            n = min(GROUP_FILES, max(1, len(self.ready) // (self.workers * 2)))
+            group = [self.ready.popleft() for _ in range(min(n, len(self.ready)))]
+            jobs = []
+            for path, st, seen in group:
+                out = output_path_for(path, self.fmt, self._out_dir(path))
+                if manifests.for_output(out).is_current(path, st, self.digest):
+                    self._finish(BatchResult(-1, path, out, None, {"skipped": True}), seen)
+                else:
+                    jobs.append((path, st, seen))
+            if jobs:
+                fut = pool.submit(_run_task, [(-1, p, output_path_for(p, self.fmt, self._out_dir(p)), st) for p, st, _ in jobs],
+                                  self.options, self.fmt, False, self.outdir)
+                fut.add_done_callback(lambda f: self._wake())
+                with self._lock:
+                    self.inflight[fut] = jobs
+
+    def _collect(self, manifests):
+        for fut in [f for f in self.inflight if f.done()]:
+            with self._lock:
+                jobs = self.inflight.pop(fut)
+            try:
+                results = fut.result()
+            except Exception as e:  # e.g. a pool process died
+                results = [BatchResult(-1, p, None, f"{type(e).__name__}: {e}") for p, _, _ in jobs]
+            for r, (path, st, seen) in zip(results, jobs):
+                if not r.error:
+                    manifests.for_output(r.out_path).record(path, st, self.digest, r.out_path)
+                self._finish(r, seen)
+
+    def _finish(self, r, seen):
+        latency = time.monotonic() - seen
+        with self._lock:
+            key = "failed" if r.error else "skipped" if (r.info or {}).get("skipped") else "converted"
+            self.counts[key] += 1
+            if key == "converted":
+                self.latencies.append(latency)
+        if self.on_result:
+            self.on_result(r, latency)
+
+    # --- main loop ---
+
+    def run(self):
+        os.makedirs(self.outdir, exist_ok=True)
+        self._stop.clear()
+        self.started = time.monotonic()
+        if self.mode == "inotify":
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError):
+                self.mode = "poll"
+        try:
+            self._scan_dir(self.folder)
+        except OSError:  # inotify watch limit reached
+            self._drop_inotify()
+            self._scan_dir(self.folder)
+        manifests = ManifestSet()
+        pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_ignore_sigint,
+                                   mp_context=pool_context(self.start_method))
+        polls, last_poll = 0, time.monotonic()
+        try:
+            while not self._stop.is_set():
+                inotify = self._inotify
+                busy = self.settling or self.ready or self.inflight
+                if inotify:
+                    timeout = min(0.5, self.settle / 4) if busy else None  # None: sleep until an event
+                else:
+                    timeout = max(0.0, self.interval - (time.monotonic() - last_poll))
+                    if busy:
+                        timeout = min(timeout, 0.5, self.settle / 4)
+                fds = [self._wake_r] + ([inotify.fd] if inotify else [])
+                readable, _, _ = select.select(fds, [], [], timeout)
+                if self._wake_r in readable:
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except (BlockingIOError, InterruptedError):
+                        pass
+                now = time.monotonic()
+                try:
+                    if inotify and inotify.fd in readable:
+                        self._on_events(inotify.read(), now)
+                    elif not inotify and now - last_poll >= self.interval:
+                        polls += 1
+                        self._poll(full=polls % self.full_every == 0)
+                        last_poll = now
+                except OSError:  # out of inotify watches for a new sub-folder
+                    self._drop_inotify()
+                    self._poll(full=True)
+                self._settle(now)
+                self._collect(manifests)
+                self._submit(pool, manifests)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            self._collect(manifests)
+            manifests.close()
+            if self._inotify:
+                self._inotify.close()
+                self._inotify = None
+
+    def _on_events(self, events, now):
+        for d, name, mask in events:
+            self.counts["events"] += 1
+            if mask & IN_Q_OVERFLOW:  # events were dropped: compare the tree once
+                self.counts["overflows"] += 1
+                self._poll(full=True)
+            elif mask & (IN_DELETE_SELF | IN_MOVE_SELF):
+                self.dirs.pop(d, None)
+            elif mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._scan_dir(os.path.join(d, name), now)
+            elif name:
+                self._seen(os.path.join(d, name), now)
+
+    def _drop_inotify(self):
+        if self._inotify:
+            self._inotify.close()
+            self._inotify = None
+            self.mode = "poll"